@@ -1,5 +1,6 @@
 import os
 import environ
+from corsheaders.defaults import default_headers
 from pathlib import Path
 from datetime import timedelta
 
@@ -34,6 +35,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'store.metrics.MetricsMiddleware', # First, so it times everything below; off unless METRICS_ENABLED
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware', # Must be above CommonMiddleware
@@ -67,11 +69,17 @@ AUTH_USER_MODEL = 'store.User'
 # --- REST FRAMEWORK & JWT ---
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # simplejwt's JWTAuthentication with users cached (store/authentication.py)
+        'store.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.AllowAny', 
     ),
+    # orjson when installed, identical output to JSONRenderer (see store/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': (
+        'store.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 9, 
 }
@@ -97,6 +105,9 @@ DJOSER = {
 
 # --- NETWORKING & CORS ---
 CORS_ALLOW_ALL_ORIGINS = DEBUG 
+# Guest carts travel in X-Cart-Token (store/carts.py)
+CORS_ALLOW_HEADERS = (*default_headers, 'x-cart-token', 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['X-Cart-Token', 'Idempotent-Replayed']
 CLIENT_URL = env('FRONTEND_URL', default="http://localhost:5173")
 if not DEBUG:
     CORS_ALLOWED_ORIGINS = [CLIENT_URL]
@@ -107,18 +118,97 @@ if not DEBUG:
 STRIPE_PUBLISHABLE_KEY = env('STRIPE_PUBLISHABLE_KEY', default='')
 STRIPE_SECRET_KEY = env('STRIPE_SECRET_KEY', default='')
 STRIPE_WEBHOOK_SECRET = env('STRIPE_WEBHOOK_SECRET', default='')
+# Webhook events that keep failing are left for a human after this many tries
+PAYMENT_EVENT_MAX_ATTEMPTS = env.int('PAYMENT_EVENT_MAX_ATTEMPTS', default=5)
+# Seconds before the first retry of a failed event; doubles on each attempt
+PAYMENT_EVENT_RETRY_BACKOFF = env.int('PAYMENT_EVENT_RETRY_BACKOFF', default=60)
+
+# Stock is held for this long after a checkout session is created, and
+# the Stripe session expires with the hold. Stripe only accepts expiries
+# 30 minutes to 24 hours out (store/checkout.py leaves a 2 minute margin);
+# a shorter hold leaves the session on Stripe's default expiry.
+STOCK_RESERVATION_MINUTES = env.int('STOCK_RESERVATION_MINUTES', default=35)
 
 # eSewa Setup (v2)
 ESEWA_PRODUCT_CODE = env('ESEWA_PRODUCT_CODE', default='EPAYTEST')
 ESEWA_SECRET_KEY = env('ESEWA_SECRET_KEY', default='8g8M8ksRXz9S7S4U')
+ESEWA_STATUS_URL = env('ESEWA_STATUS_URL', default='https://rc.esewa.com.np/api/epay/transaction/status/')
+
+# Outbound provider HTTP (async payment views, store/providers.py)
+STRIPE_API_BASE = env('STRIPE_API_BASE', default='https://api.stripe.com')
+PAYMENT_HTTP_TIMEOUT = env.float('PAYMENT_HTTP_TIMEOUT', default=10.0)
+PAYMENT_HTTP_RETRIES = env.int('PAYMENT_HTTP_RETRIES', default=2)
+PAYMENT_HTTP_BACKOFF = env.float('PAYMENT_HTTP_BACKOFF', default=0.25)
+PAYMENT_HTTP_MAX_CONNECTIONS = env.int('PAYMENT_HTTP_MAX_CONNECTIONS', default=200)
+
+# --- CACHE ---
+# locmem for local dev; point CACHE_URL at redis://... in production so every
+# worker shares the catalog cache and its version counter.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+CATALOG_CACHE_TIMEOUT = env.int('CATALOG_CACHE_TIMEOUT', default=300)
+# Concurrent misses for one catalog page wait on a single computation
+# (store/cache.py): the lock bounds how long, and the previous version of
+# the page is served meanwhile if it is younger than the stale timeout.
+CATALOG_LOCK_TIMEOUT = env.int('CATALOG_LOCK_TIMEOUT', default=10)
+CATALOG_STALE_TIMEOUT = env.int('CATALOG_STALE_TIMEOUT', default=60 * 60)
+# 'orm' keeps carts in Cart/CartItem; 'cache' keeps them in the cache until
+# checkout (store/carts.py). Guest carts always use the cache.
+CART_STORAGE = env('CART_STORAGE', default='orm')
+CART_CACHE_ALIAS = env('CART_CACHE_ALIAS', default='default')
+CART_CACHE_TIMEOUT = env.int('CART_CACHE_TIMEOUT', default=60 * 60 * 24 * 30)
+# Responses kept for replaying retried POSTs that carry an Idempotency-Key
+# (store/idempotency.py); the lock covers a request still in flight.
+IDEMPOTENCY_KEY_TIMEOUT = env.int('IDEMPOTENCY_KEY_TIMEOUT', default=60 * 60 * 24)
+IDEMPOTENCY_LOCK_TIMEOUT = env.int('IDEMPOTENCY_LOCK_TIMEOUT', default=60)
+
+# Authenticated users (with profiles) cached per id by CachedJWTAuthentication
+AUTH_USER_CACHE_TIMEOUT = env.int('AUTH_USER_CACHE_TIMEOUT', default=60)
+
+# --- EXPORTS ---
+# Rows fetched per round trip by the streaming exports (store/exports.py)
+EXPORT_CHUNK_SIZE = env.int('EXPORT_CHUNK_SIZE', default=2000)
+
+# --- LOYALTY ---
+# Points per dollar of a paid order, awarded by the update_loyalty command
+LOYALTY_POINTS_PER_DOLLAR = env.int('LOYALTY_POINTS_PER_DOLLAR', default=1)
+
+# --- METRICS ---
+# Per-route request, latency and query metrics at /api/metrics/ (Prometheus format)
+METRICS_ENABLED = env.bool('METRICS_ENABLED', default=False)
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+METRICS_DUPLICATE_QUERY_THRESHOLD = env.int('METRICS_DUPLICATE_QUERY_THRESHOLD', default=5)
 
 # --- DATABASE & STORAGE ---
+# SQLite for local dev; production sets DATABASE_URL=postgres://... and,
+# optionally, REPLICA_DATABASE_URL for a read replica that serves catalog
+# reads (store/routers.py).
+def database_from_env(var, default=None):
+    database = env.db(var, default=default)
+    # Keep connections open between requests, checking them before reuse
+    database['CONN_MAX_AGE'] = env.int('DB_CONN_MAX_AGE', default=60)
+    database['CONN_HEALTH_CHECKS'] = env.bool('DB_CONN_HEALTH_CHECKS', default=True)
+    if database['ENGINE'] == 'django.db.backends.postgresql':
+        if env.bool('DB_POOL', default=False):
+            # psycopg 3 connection pool inside each worker (replaces CONN_MAX_AGE)
+            database['CONN_MAX_AGE'] = 0
+            database.setdefault('OPTIONS', {})['pool'] = {
+                'min_size': env.int('DB_POOL_MIN_SIZE', default=2),
+                'max_size': env.int('DB_POOL_MAX_SIZE', default=10),
+            }
+        if env.bool('DB_PGBOUNCER', default=False):
+            # Transaction-mode PgBouncer cannot keep server-side cursors open
+            database['DISABLE_SERVER_SIDE_CURSORS'] = True
+    return database
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_from_env('DATABASE_URL', default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}"),
 }
+if env('REPLICA_DATABASE_URL', default=''):
+    DATABASES['replica'] = database_from_env('REPLICA_DATABASE_URL')
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+DATABASE_ROUTERS = ['store.routers.PrimaryReplicaRouter']
 
 STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
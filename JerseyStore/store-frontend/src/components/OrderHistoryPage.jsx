@@ -31,7 +31,8 @@ export default function OrderHistoryPage() {
             if (searchTerm.trim()) params.search = searchTerm.trim();
 
             const res = await apiClient.get('api/orders/', { params });
-            setOrders(res.data);
+            // api/orders/ is cursor-paginated: { next, previous, results }
+            setOrders(res.data.results || res.data);
         } catch (err) {
             console.error("Error fetching orders:", err.response?.data || err.message);
             setError("Failed to load order history.");
@@ -3,9 +3,9 @@ import { Link } from 'react-router-dom';
 export default function ProductCard({ product }) {
   const BACKEND_BASE_URL = 'http://127.0.0.1:8000';
 
-  // 1. Price Logic (Still pulls from first SKU)
+  // 1. Price Logic (cheapest size, kept on the product by the backend)
   const firstSku = product.skus?.length > 0 ? product.skus[0] : null;
-  const price = firstSku ? firstSku.price : "N/A";
+  const price = product.min_price ?? (firstSku ? firstSku.price : "N/A");
   
   // 2. Simplified Image Logic using main_image from backend
   const getDisplayImage = () => {
@@ -22,6 +22,10 @@ export default function ProductCard({ product }) {
 
   const imageUrl = getDisplayImage();
 
+  // 3. Pre-sized WebP/JPEG renditions (card grid is ~400px wide)
+  const renditions = product.image_renditions;
+  const sizes = '(min-width: 1024px) 33vw, (min-width: 640px) 50vw, 100vw';
+
   return (
     <div className="jersey-card group flex flex-col h-full shadow-jersey overflow-hidden rounded-[2rem] bg-white transition-all duration-500 hover:shadow-2xl hover:-translate-y-2">
       
@@ -39,12 +43,18 @@ export default function ProductCard({ product }) {
         </div>
 
         {/* The Jersey Image */}
-        <img 
-          src={imageUrl} 
-          className="w-full h-full object-contain p-10 transition-transform duration-700 group-hover:scale-110" 
-          alt={product.name} 
-          onError={(e) => { e.target.src = 'https://via.placeholder.com/300x400?text=Image+Error'; }}
-        />
+        <picture>
+          {renditions && <source type="image/webp" srcSet={renditions.srcset.webp} sizes={sizes} />}
+          <img 
+            src={renditions?.card?.jpeg || imageUrl} 
+            srcSet={renditions?.srcset.jpeg}
+            sizes={renditions ? sizes : undefined}
+            loading="lazy"
+            className="w-full h-full object-contain p-10 transition-transform duration-700 group-hover:scale-110" 
+            alt={product.name} 
+            onError={(e) => { e.target.src = 'https://via.placeholder.com/300x400?text=Image+Error'; }}
+          />
+        </picture>
         
         <div className="absolute inset-0 bg-pitch-black/5 opacity-0 group-hover:opacity-100 transition-opacity duration-300" />
       </Link>
@@ -25,16 +25,11 @@ export const CartProvider = ({ children }) => {
         }
     }, [currentCartId]);
 
-    const updateLocalCart = useCallback((items) => {
-        localStorage.setItem('glow_cart', JSON.stringify(items));
-        setCartItems(items);
-    }, []);
-
     // --- 3. BACKEND SYNC ---
+    // Guests have a server-side cart too (X-Cart-Token, see UserContext);
+    // it is merged into the customer's cart on the first signed-in sync.
     const syncCartWithBackend = useCallback(async () => {
-        if (!apiClient || !isLoggedIn) {
-            const local = JSON.parse(localStorage.getItem('glow_cart') || '[]');
-            setCartItems(local);
+        if (!apiClient) {
             setLoadingCart(false);
             return;
         }
@@ -43,10 +38,11 @@ export const CartProvider = ({ children }) => {
         try {
             // GET /api/cart/my_cart/
             const res = await apiClient.get('api/cart/my_cart/'); 
-            if (res.data?.id) {
-                setCurrentCartId(res.data.id);
-                setCartItems(res.data.items || []);
+            if (isLoggedIn) {
+                localStorage.removeItem('cart_token'); // merged now
+                if (res.data?.id) setCurrentCartId(res.data.id);
             }
+            setCartItems(res.data?.items || []);
         } catch (error) {
             console.error("Cart sync failed:", error);
             if (error.response?.status === 404) setCurrentCartId(null);
@@ -79,10 +75,8 @@ export const CartProvider = ({ children }) => {
     }, [isLoggedIn, apiClient, syncCartWithBackend]);
 
     useEffect(() => { 
-        if (isLoggedIn) {
-            syncCartWithBackend(); 
-            cleanupGhostCart();
-        }
+        syncCartWithBackend(); 
+        if (isLoggedIn) cleanupGhostCart();
     }, [isLoggedIn, syncCartWithBackend, cleanupGhostCart]);
 
     // --- 5. CHECKOUT LOGIC ---
@@ -144,65 +138,39 @@ export const CartProvider = ({ children }) => {
         const name = customName.trim().toUpperCase();
         const number = customNumber.toString().trim();
 
-        if (!isLoggedIn) {
-            setCartItems(prev => {
-                let updated = [...prev];
-                const idx = updated.findIndex(i => 
-                    i.sku.id === skuId && i.custom_name === name && i.custom_number === number
-                );
-                
-                if (idx > -1) {
-                    updated[idx].quantity += qty;
-                    if (updated[idx].quantity <= 0) updated.splice(idx, 1);
-                } else if (qty > 0) {
-                    updated.push({ 
-                        id: `guest-${Date.now()}`, 
-                        sku: isObject ? productSkuOrId : { id: skuId, price: 0 }, 
-                        quantity: qty, 
-                        custom_name: name, 
-                        custom_number: number 
-                    });
-                }
-                updateLocalCart(updated);
-                return updated;
-            });
-        } else {
-            try {
-                // POST api/cart/add_item/
-                await apiClient.post(`api/cart/add_item/`, { 
-                    sku_id: skuId, 
-                    quantity: qty, 
-                    custom_name: name, 
-                    custom_number: number 
-                });
-                await syncCartWithBackend();
-            } catch (e) { 
-                alert("Could not update cart."); 
-            }
+        // One key per click: a retried request is replayed, not added twice
+        const idempotencyKey = crypto.randomUUID();
+        const send = () => apiClient.post(`api/cart/add_item/`, {
+            sku_id: skuId,
+            quantity: qty,
+            custom_name: name,
+            custom_number: number
+        }, { headers: { 'Idempotency-Key': idempotencyKey } });
+
+        try {
+            // POST api/cart/add_item/ (guests included), retried once on a network error
+            await send().catch(err => (err.response ? Promise.reject(err) : send()));
+            await syncCartWithBackend();
+        } catch (e) { 
+            alert("Could not update cart."); 
         }
         if (qty > 0) setIsRosterOpen(true);
     };
 
     const removeFromCart = async (cartItemId) => {
-        if (!isLoggedIn) {
-            const updated = cartItems.filter(item => item.id !== cartItemId);
-            updateLocalCart(updated);
-        } else {
-            try {
-                // MATCHES router.register(r'cart_items', CartItemViewSet)
-                // DELETE api/cart_items/{id}/
-                await apiClient.delete(`api/cart_items/${cartItemId}/`);
-                await syncCartWithBackend();
-            } catch (e) { 
-                console.error("Remove failed:", e.response?.data || e.message); 
-            }
+        try {
+            // MATCHES router.register(r'cart_items', CartItemViewSet)
+            // DELETE api/cart_items/{id}/
+            await apiClient.delete(`api/cart_items/${cartItemId}/`);
+            await syncCartWithBackend();
+        } catch (e) { 
+            console.error("Remove failed:", e.response?.data || e.message); 
         }
     };
 
     const clearCart = useCallback(() => {
         setCartItems([]);
         setCurrentCartId(null);
-        localStorage.removeItem('glow_cart');
         localStorage.removeItem('active_cart_id');
     }, []);
 
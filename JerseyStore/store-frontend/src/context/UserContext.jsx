@@ -13,6 +13,19 @@ export const apiClient = axios.create({
     },
 });
 
+// 2. Guest carts: the backend hands out an X-Cart-Token and merges that cart
+// into the customer's own on their first signed-in cart request.
+apiClient.interceptors.request.use((config) => {
+    const cartToken = localStorage.getItem('cart_token');
+    if (cartToken) config.headers['X-Cart-Token'] = cartToken;
+    return config;
+});
+apiClient.interceptors.response.use((response) => {
+    const cartToken = response.headers['x-cart-token'];
+    if (cartToken) localStorage.setItem('cart_token', cartToken);
+    return response;
+});
+
 export const UserProvider = ({ children }) => {
     const [user, setUser] = useState(null); 
     const [loading, setLoading] = useState(true);
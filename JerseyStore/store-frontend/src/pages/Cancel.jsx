@@ -1,9 +1,25 @@
-import React from 'react';
-import { useNavigate, Link } from 'react-router-dom';
+import React, { useContext, useEffect, useRef } from 'react';
+import { useNavigate, useSearchParams, Link } from 'react-router-dom';
+import { UserContext } from '../context/UserContext';
 import { XCircle, ArrowLeft, MessageCircle, ShoppingBag } from 'lucide-react';
 
 const Cancel = () => {
     const navigate = useNavigate();
+    const { apiClient } = useContext(UserContext);
+    const [searchParams] = useSearchParams();
+    const releaseStarted = useRef(false);
+
+    useEffect(() => {
+        // Prevent double execution in React Strict Mode
+        if (releaseStarted.current) return;
+        releaseStarted.current = true;
+
+        // Stripe sends the abandoned session back; give its held stock back
+        const sessionId = searchParams.get('session_id');
+        if (!sessionId) return;
+        apiClient.post('/api/payment/cancel-checkout/', { session_id: sessionId })
+            .catch((err) => console.error('Could not release held stock:', err));
+    }, [apiClient, searchParams]);
 
     return (
         <div className="min-h-screen flex items-center justify-center bg-slate-50 p-8">
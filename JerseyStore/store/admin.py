@@ -1,16 +1,69 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
 from .models import (
     User, Profile, Category, Product, ProductSKU, 
-    Cart, CartItem, Order, OrderItem, Newsletter
+    Cart, CartItem, Order, OrderItem, Newsletter, LoyaltyEntry
 )
+from .search import search_products
+
+ADMIN_SEARCH_LIMIT = 1000
+
+# --- 0. CHANGELISTS AT SCALE ---
+# Unfiltered changelists of big tables show the planner's row estimate
+# instead of running COUNT(*) over the whole table; filtered ones still
+# count exactly. The big admins also set show_full_result_count = False,
+# which drops the second, unfiltered COUNT(*) Django runs on every page.
+
+ESTIMATED_COUNT_THRESHOLD = 100_000
+
+
+def estimated_row_count(model, using):
+    """The planner's row count for a table (after ANALYZE), or None."""
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+            elif connection.vendor == 'sqlite':
+                # First number of any index's stat is the table's row count
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:  # never analyzed (no sqlite_stat1)
+        return None
+    if row is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None  # reltuples is -1 before the first ANALYZE
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 # --- 1. USER & PROFILE ---
 # This ensures that when you view a User, you see their Profile details below it
 class ProfileInline(admin.StackedInline):
     model = Profile
     can_delete = False
-    readonly_fields = ('tier',)
+    # Both follow the loyalty ledger; add an ADJUSTMENT entry to change points
+    readonly_fields = ('points', 'tier')
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
@@ -20,6 +73,14 @@ class UserAdmin(BaseUserAdmin):
         ('Custom Roles', {'fields': ('is_customer', 'phone_number')}),
     )
 
+@admin.register(LoyaltyEntry)
+class LoyaltyEntryAdmin(LargeTableAdmin):
+    list_display = ('user', 'points', 'reason', 'order', 'created_at')
+    list_select_related = ('user', 'order__user')  # Order.__str__ shows its customer
+    list_filter = ('reason',)
+    search_fields = ('^user__username',)
+    raw_id_fields = ('user', 'order')
+
 # --- 2. PRODUCT & SKUs (The "One-Page" Management) ---
 class ProductSKUInline(admin.TabularInline):
     model = ProductSKU
@@ -27,40 +88,81 @@ class ProductSKUInline(admin.TabularInline):
     # Adding 'image' to fields makes it visible in the table row
     fields = ['size', 'price', 'stock_quantity', 'image', 'sku_code']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(LargeTableAdmin):
     list_display = ('team', 'name', 'season', 'jersey_type', 'is_active', 'category')
+    list_select_related = ('category',)
     list_filter = ('team', 'category', 'is_active')
     search_fields = ('name', 'team')
+    autocomplete_fields = ('category',)
     inlines = [ProductSKUInline] # This allows you to add images/sizes inside the Product page
 
+    def get_search_results(self, request, queryset, search_term):
+        # The full-text index instead of LIKE scans over name and team
+        if not search_term.strip():
+            return queryset, False
+        ids, _ = search_products(search_term, limit=ADMIN_SEARCH_LIMIT, active_only=False)
+        return queryset.filter(pk__in=ids), False
+
+# Registered so SKU pickers elsewhere can be autocomplete widgets
+@admin.register(ProductSKU)
+class ProductSKUAdmin(LargeTableAdmin):
+    list_display = ('sku_code', 'product', 'size', 'price', 'stock_quantity')
+    list_select_related = ('product',)
+    search_fields = ('=sku_code', '^product__team', '^product__name')
+    autocomplete_fields = ('product',)
+
 # --- 3. ORDERS & CUSTOMIZATION ---
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
     readonly_fields = ('sku', 'quantity', 'price_at_purchase', 'custom_name', 'custom_number')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('sku__product')  # SKU labels show the team
+
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'total_amount', 'status', 'created_at')
-    list_filter = ('status', 'created_at')
-    search_fields = ('id', 'user__username')
+class OrderAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'total_amount', 'status', 'oversold', 'created_at')
+    list_select_related = ('user',)
+    list_filter = ('status', 'oversold', 'created_at')
+    date_hierarchy = 'created_at'
+    # Exact id or username prefix: both use an index, unlike '%term%'
+    search_fields = ('=id', '^user__username')
+    autocomplete_fields = ('user',)
     inlines = [OrderItemInline]
 
 # --- 4. CART & UTILITY ---
 class CartItemInline(admin.TabularInline):
     model = CartItem
     extra = 0
+    autocomplete_fields = ('sku',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('sku__product')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # The autocomplete widget looks up each line's selected SKU for its
+        # label (one query per line); fetch the team for that label with it
+        if db_field.name == 'sku':
+            kwargs['queryset'] = ProductSKU.objects.select_related('product')
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 @admin.register(Cart)
-class CartAdmin(admin.ModelAdmin):
+class CartAdmin(LargeTableAdmin):
     list_display = ('user', 'created_at')
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
     inlines = [CartItemInline]
 
 # --- 5. CATEGORY & NEWSLETTER ---
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'slug')
+    search_fields = ('name',)
     prepopulated_fields = {'slug': ('name',)} # This auto-fills the slug while you type the name
 
 admin.site.register(Newsletter)
@@ -0,0 +1,151 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, IntegerField, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailySales, DailySkuSales, Order, OrderItem
+
+# ===================================================================
+# SALES ROLLUPS
+# ===================================================================
+# Dashboards read DailySales (orders and revenue per day) and
+# DailySkuSales (units and revenue per SKU per day, with team and size)
+# instead of scanning Order/OrderItem.
+#
+# create_order_from_session adds each new paid order to the rollups in
+# the transaction that creates it, so they are current as soon as the
+# order exists.
+# Orders cancelled afterwards are only taken out by a rebuild: run
+# rebuild_sales_rollups --since <date> (e.g. nightly over the last few
+# days), or without --since to recompute everything.
+
+COUNTED_STATUSES = ('PAID', 'SHIPPED')
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+GROUPS = ('day', 'sku', 'team', 'size')
+
+
+def record_order(order, lines):
+    """
+    Adds a just-paid order to the rollups in four statements however many
+    lines it has. `lines` are (sku, quantity, line_revenue) with
+    sku.product loaded.
+
+    Missing rows are inserted empty (ON CONFLICT DO NOTHING, so concurrent
+    orders can't collide) and then incremented in place with F(), which
+    never loses a concurrent increment.
+    """
+    day = timezone.localdate(order.created_at)
+    DailySales.objects.bulk_create([DailySales(day=day)], ignore_conflicts=True)
+    DailySales.objects.filter(day=day).update(
+        orders=F('orders') + 1, revenue=F('revenue') + order.total_amount
+    )
+
+    per_sku = {}
+    for sku, quantity, revenue in lines:
+        units, total, _ = per_sku.get(sku.pk, (0, Decimal('0.00'), sku))
+        per_sku[sku.pk] = (units + quantity, total + revenue, sku)
+    if not per_sku:
+        return
+    DailySkuSales.objects.bulk_create(
+        [DailySkuSales(day=day, sku=sku, team=sku.product.team, size=sku.size) for _, _, sku in per_sku.values()],
+        ignore_conflicts=True,
+    )
+
+    def per_row(index, output_field):
+        return Case(
+            *(When(sku_id=sku_id, then=Value(amounts[index])) for sku_id, amounts in per_sku.items()),
+            output_field=output_field,
+        )
+
+    DailySkuSales.objects.filter(day=day, sku_id__in=per_sku).update(
+        units=F('units') + per_row(0, IntegerField()),
+        revenue=F('revenue') + per_row(1, MONEY),
+    )
+
+
+def start_of_day(day):
+    """
+    Midnight at the start of `day` in the current time zone. Filtering
+    created_at__gte on it matches what created_at__date__gte would, but
+    lets the database use an index on created_at.
+    """
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def rebuild_rollups(since=None, batch_size=1000):
+    """
+    Recomputes the rollups from Order/OrderItem, for days from `since`
+    on (a date) or for all time. Returns (days, sku_rows) written.
+    """
+    orders = Order.objects.filter(status__in=COUNTED_STATUSES)
+    items = OrderItem.objects.filter(order__status__in=COUNTED_STATUSES)
+    daily_rows = DailySales.objects.all()
+    sku_rows = DailySkuSales.objects.all()
+    if since is not None:
+        orders = orders.filter(created_at__gte=start_of_day(since))
+        items = items.filter(order__created_at__gte=start_of_day(since))
+        daily_rows = daily_rows.filter(day__gte=since)
+        sku_rows = sku_rows.filter(day__gte=since)
+
+    daily = (
+        orders.annotate(day=TruncDate('created_at')).values('day')
+        .annotate(count=Count('id'), total=Sum('total_amount')).order_by('day')
+    )
+    per_sku = (
+        items.annotate(day=TruncDate('order__created_at'))
+        .values('day', 'sku_id', 'sku__product__team', 'sku__size')
+        .annotate(
+            units=Sum('quantity'),
+            total=Sum(ExpressionWrapper(F('price_at_purchase') * F('quantity'), output_field=MONEY)),
+        )
+        .order_by('day', 'sku_id')
+    )
+
+    with transaction.atomic():
+        daily_rows.delete()
+        sku_rows.delete()
+        days = DailySales.objects.bulk_create(
+            [DailySales(day=row['day'], orders=row['count'], revenue=row['total']) for row in daily],
+            batch_size=batch_size,
+        )
+        skus = DailySkuSales.objects.bulk_create(
+            [
+                DailySkuSales(day=row['day'], sku_id=row['sku_id'], team=row['sku__product__team'] or '',
+                              size=row['sku__size'] or '', units=row['units'], revenue=row['total'])
+                for row in per_sku
+            ],
+            batch_size=batch_size,
+        )
+    return len(days), len(skus)
+
+
+def sales_report(group='day', start=None, end=None):
+    """
+    Rows for the staff dashboard between two dates (inclusive), read from
+    the rollups only. Defaults to the last 30 days.
+    """
+    end = end or timezone.localdate()
+    start = start or end - timedelta(days=29)
+    if group == 'day':
+        return list(
+            DailySales.objects.filter(day__range=(start, end)).order_by('day')
+            .values('day', 'orders', 'revenue')
+        )
+
+    columns = {
+        'sku': ('sku_id', 'team', 'size'),
+        'team': ('team',),
+        'size': ('size',),
+    }[group]
+    labels = {'sku_code': F('sku__sku_code'), 'product_name': F('sku__product__name')} if group == 'sku' else {}
+    return list(
+        DailySkuSales.objects.filter(day__range=(start, end))
+        .values(*columns, **labels)
+        .annotate(units=Sum('units'), revenue=Sum('revenue'))
+        .order_by('-units', *columns)
+    )
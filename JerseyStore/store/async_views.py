@@ -0,0 +1,128 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework import exceptions
+from rest_framework.settings import api_settings
+
+from . import providers
+from .checkout import CheckoutError, prepare_checkout_session
+from .inventory import OutOfStock, attach_session, release_reservations
+from .models import Order
+from .orders import create_order_from_session
+from .routers import use_primary
+
+# ===================================================================
+# ASYNC PAYMENT VIEWS (ASGI)
+# ===================================================================
+# Async twins of PaymentView's Stripe actions plus an eSewa status check.
+# Database work runs through sync_to_async; the provider calls are awaited
+# on the shared pooled client, so while Stripe is thinking the worker is
+# free to serve other requests. Served under /api/async/payment/ — run the
+# app with an ASGI server (backend/asgi.py) to get the benefit.
+
+
+def authenticate(request):
+    """Same authentication as the DRF views; returns the user or None."""
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        result = authentication_class().authenticate(request)
+        if result is not None:
+            return result[0]
+    return None
+
+
+def payment_view(view):
+    """
+    POST-only, token-authenticated (no CSRF cookie involved), JSON in and
+    out, with every read on the primary database.
+    """
+
+    @csrf_exempt
+    @require_POST
+    async def wrapper(request):
+        try:
+            user = await sync_to_async(authenticate)(request)
+        except exceptions.AuthenticationFailed as e:
+            return JsonResponse({"detail": str(e.detail)}, status=401)
+        if user is None:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({"error": "Invalid JSON body"}, status=400)
+        # The context variable follows the work into sync_to_async threads
+        with use_primary():
+            return await view(request, user, data)
+
+    return wrapper
+
+
+@payment_view
+async def create_checkout_session(request, user, data):
+    try:
+        params, reservations = await sync_to_async(prepare_checkout_session)(user, data)
+    except CheckoutError as e:
+        return JsonResponse(e.as_response_data(), status=e.status_code)
+    except OutOfStock as e:
+        return JsonResponse({"error": "Not enough stock for this size", "sku_id": e.sku_id}, status=409)
+
+    try:
+        session = await providers.create_checkout_session(params)
+    except providers.ProviderError as e:
+        await sync_to_async(release_reservations)(reservations)
+        print(f"STRIPE ERROR: {str(e)}")
+        return JsonResponse({"error": "Failed to create payment session"}, status=502)
+
+    await sync_to_async(attach_session)(reservations, session['id'])
+    return JsonResponse({'url': session['url']})
+
+
+@payment_view
+async def verify_payment(request, user, data):
+    session_id = data.get('session_id')
+    if not session_id:
+        return JsonResponse({"error": "session_id required"}, status=400)
+
+    order = await Order.objects.filter(transaction_id=session_id, user=user).afirst()
+    if order:
+        return JsonResponse({"message": "Order already processed", "order_id": order.id})
+
+    try:
+        session = await providers.retrieve_checkout_session(session_id)
+    except providers.ProviderError as e:
+        return JsonResponse({"error": str(e)}, status=502)
+    metadata = session.get('metadata') or {}
+    if metadata.get('user_id') != str(user.id):
+        return JsonResponse({"error": "Checkout session not found"}, status=404)
+    if session.get('payment_status') != 'paid':
+        return JsonResponse({"error": "Payment failed"}, status=400)
+
+    try:
+        order, created = await sync_to_async(create_order_from_session)(
+            session['id'], session['amount_total'], metadata, user
+        )
+    except Exception as e:
+        print(f"VERIFICATION ERROR: {str(e)}")
+        return JsonResponse({"error": str(e)}, status=400)
+    if not created:
+        return JsonResponse({"message": "Order already processed", "order_id": order.id})
+    return JsonResponse({"order_id": order.id, "status": "success"})
+
+
+@payment_view
+async def esewa_status(request, user, data):
+    transaction_uuid = data.get('transaction_uuid')
+    total_amount = data.get('total_amount')
+    if not transaction_uuid or not total_amount:
+        return JsonResponse({"error": "transaction_uuid and total_amount required"}, status=400)
+    try:
+        result = await providers.esewa_transaction_status(transaction_uuid, total_amount)
+    except providers.ProviderError as e:
+        return JsonResponse({"error": str(e)}, status=502)
+    return JsonResponse({
+        "status": result.get('status'),
+        "ref_id": result.get('ref_id'),
+        "transaction_uuid": transaction_uuid,
+    })
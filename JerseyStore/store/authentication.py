@@ -0,0 +1,117 @@
+import itertools
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import Profile
+
+# ===================================================================
+# CACHED JWT USERS
+# ===================================================================
+# simplejwt loads the User row on every authenticated request, and
+# UserMeView then loads the profile as well. CachedJWTAuthentication keeps
+# the user's non-credential fields and its profile in the cache for
+# AUTH_USER_CACHE_TIMEOUT seconds.
+#
+# Entries are keyed by user id. User and Profile saves drop them (see the
+# signals in models.py). Bulk .update()s skip signals, so call
+# forget_users() after them, as update_loyalty does.
+#
+# The is_active check and simplejwt's revoked-token check (the token's
+# password-hash claim, when CHECK_REVOKE_TOKEN is on) run against the
+# cached user on every request. A password change saves the user, so a
+# token issued before it is refused from then on.
+#
+# Only CACHED_USER_FIELDS, the profile and that claim value (which every
+# token carries anyway) are cached; the password hash never leaves the
+# database. The user is rebuilt with every other field deferred, so
+# reading one (check_password, say) loads it, and save() writes only the
+# fields that were loaded or set.
+
+USER_CACHE_PREFIX = 'auth:user'
+
+# What requests read off request.user: identity, permission flags and the
+# fields UserSerializer shows
+CACHED_USER_FIELDS = ('id', 'username', 'email', 'phone_number', 'is_active', 'is_staff', 'is_superuser')
+
+
+def user_cache_key(user_id):
+    return f"{USER_CACHE_PREFIX}:{user_id}"
+
+
+def forget_users(user_ids, batch_size=1000):
+    """Drops the cached users with these ids (any iterable, deleted in batches)."""
+    user_ids = iter(user_ids)
+    while keys := [user_cache_key(user_id) for user_id in itertools.islice(user_ids, batch_size)]:
+        cache.delete_many(keys)
+
+
+def user_cache_entry(user):
+    """The cacheable part of a user loaded with select_related('profile')."""
+    try:
+        profile = user.profile
+    except ObjectDoesNotExist:
+        profile = None
+    return {
+        'user': {name: getattr(user, name) for name in CACHED_USER_FIELDS},
+        'profile': profile and {field.attname: getattr(profile, field.attname) for field in profile._meta.concrete_fields},
+        'revoke_claim': get_md5_hash_password(user.password),
+    }
+
+
+def from_cached_fields(model, fields):
+    """A model instance with `fields` loaded and every other field deferred."""
+    # from_db() wants the loaded values in field order
+    names = [field.attname for field in model._meta.concrete_fields if field.attname in fields]
+    return model.from_db(DEFAULT_DB_ALIAS, names, [fields[name] for name in names])
+
+
+def user_from_cache_entry(user_model, entry):
+    """A user with just the cached fields loaded and its profile attached."""
+    user = from_cached_fields(user_model, entry['user'])
+    profile = entry['profile']
+    if profile is not None:
+        profile = from_cached_fields(Profile, profile)
+        Profile.user.field.set_cached_value(profile, user)
+    user_model.profile.related.set_cached_value(user, profile)
+    return user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication resolving users (and their profiles) through the cache."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        key = user_cache_key(user_id)
+        entry = cache.get(key)
+        if entry is None:
+            try:
+                user = (
+                    self.user_model.objects.select_related('profile')
+                    .get(**{api_settings.USER_ID_FIELD: user_id})
+                )
+            except self.user_model.DoesNotExist as e:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+            entry = user_cache_entry(user)
+            cache.set(key, entry, settings.AUTH_USER_CACHE_TIMEOUT)
+        else:
+            user = user_from_cache_entry(self.user_model, entry)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+            api_settings.REVOKE_TOKEN_CLAIM
+        ) != entry['revoke_claim']:
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
@@ -0,0 +1,271 @@
+import itertools
+import json
+import math
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Prefetch, Q
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import Cart, CartItem, Product, ProductSKU, User
+from .renderers import FastJSONRenderer
+from .representations import product_rows, represent_products
+from .serializers import ProductSerializer
+from .search import search_products
+from .seeding import seed_synthetic_catalog
+
+# ===================================================================
+# SYNTHETIC DATA
+# ===================================================================
+# The catalog itself comes from store/seeding.py.
+
+BENCH_STOCK = 1_000_000  # checkout scenarios reserve stock on every request
+
+
+def seed_shoppers(users, cart_lines):
+    """Creates `users` customers, each with a cart of `cart_lines` lines."""
+    skus = list(ProductSKU.objects.values_list('pk', flat=True)[:max(cart_lines, 1) * 4])
+    shoppers = []
+    for n in range(users):
+        user = User.objects.create_user(username=f"bench-user-{n}-{time.time_ns()}", password="bench")
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, sku_id=skus[(n + line) % len(skus)], quantity=1 + line % 3,
+                     custom_name="BENCH" if line % 2 else None)
+            for line in range(cart_lines)
+        ])
+        shoppers.append(user)
+    return shoppers
+
+
+# ===================================================================
+# MEASUREMENT
+# ===================================================================
+
+def percentile(samples, pct):
+    """Nearest-rank percentile."""
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def measure(iterations, send, before=None):
+    """Calls send(i) `iterations` times; returns latency percentiles and queries per request."""
+    timings, queries, statuses = [], [], set()
+    for i in range(iterations):
+        if before:
+            before(i)
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = send(i)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(len(captured))
+        statuses.add(response.status_code)
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'queries_per_request': round(sum(queries) / len(queries), 2),
+        'status_codes': sorted(statuses),
+    }
+
+
+def fake_session(session_id, sku_id, user_id):
+    return mock.Mock(
+        id=session_id, url=f"https://checkout.stripe.test/{session_id}",
+        payment_status='paid', amount_total=13000,
+        metadata={'is_instant': 'true', 'sku_id': str(sku_id), 'qty': '1', 'user_id': str(user_id)},
+    )
+
+
+def measure_serialization(page_size=100, iterations=20):
+    """
+    Time to load, serialize and render one page of `page_size` products:
+    ProductSerializer + JSONRenderer against the lean rows + FastJSONRenderer
+    path the catalog endpoints use. Both include their queries.
+    """
+    request = APIRequestFactory().get('/api/products/')
+    products = Product.objects.filter(is_active=True).order_by('id')
+
+    def drf():
+        page = list(
+            products.select_related('category')
+            .prefetch_related(Prefetch('skus', queryset=ProductSKU.objects.order_by('id')))[:page_size]
+        )
+        data = ProductSerializer(page, many=True, context={'request': request}).data
+        return JSONRenderer().render(data)
+
+    def lean():
+        return FastJSONRenderer().render(represent_products(product_rows(products)[:page_size], request))
+
+    results = {}
+    for name, build in (('drf', drf), ('lean', lean)):
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            build()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[f"{name}_p50_ms"] = round(percentile(timings, 50), 3)
+    results['page_size'] = page_size
+    results['speedup'] = round(results['drf_p50_ms'] / results['lean_p50_ms'], 2) if results['lean_p50_ms'] else None
+    return results
+
+
+SEARCH_QUERIES = ["argentina 2024", "real mad", "lakers 24", "jersey 99999", "arsenl"]
+
+
+def measure_search(iterations=20, limit=20):
+    """
+    Ranked full-text search (store/search.py) against the icontains LIKE
+    filter it replaces, both fetching `limit` active products per query.
+    """
+    products = Product.objects.filter(is_active=True)
+
+    def like(query):
+        matches = products
+        for word in query.split():
+            matches = matches.filter(
+                Q(name__icontains=word) | Q(team__icontains=word) | Q(season__icontains=word)
+                | Q(description__icontains=word) | Q(category__name__icontains=word)
+            )
+        return list(matches.order_by('id').values_list('id', flat=True)[:limit])
+
+    def indexed(query):
+        return search_products(query, limit=limit)[0]
+
+    results = {}
+    for name, run in (('like', like), ('fts', indexed)):
+        timings = []
+        for i in range(iterations):
+            started = time.perf_counter()
+            run(SEARCH_QUERIES[i % len(SEARCH_QUERIES)])
+            timings.append((time.perf_counter() - started) * 1000)
+        results[f"{name}_p50_ms"] = round(percentile(timings, 50), 3)
+        results[f"{name}_p95_ms"] = round(percentile(timings, 95), 3)
+    results['speedup'] = round(results['like_p95_ms'] / results['fts_p95_ms'], 2) if results['fts_p95_ms'] else None
+    return results
+
+
+def bench_caches():
+    """A private in-memory stand-in for every configured cache alias."""
+    return {
+        alias: {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': f"bench-{alias}"}
+        for alias in settings.CACHES
+    }
+
+
+def run_benchmarks(products=200, skus_per_product=4, users=5, cart_lines=10, iterations=50):
+    """
+    Seeds a catalog and shoppers into the current database, then times the
+    store's hot endpoints through the full request stack with real JWT auth.
+    Stripe is stubbed so only our own code is measured.
+
+    Runs against private in-memory caches: the cold scenarios clear the
+    cache, which must never reach a shared Redis/memcached holding live
+    carts, idempotency keys and sessions.
+    """
+    with override_settings(CACHES=bench_caches()):
+        return _run_benchmarks(products, skus_per_product, users, cart_lines, iterations)
+
+
+def _run_benchmarks(products, skus_per_product, users, cart_lines, iterations):
+    seeded_skus = seed_synthetic_catalog(products, skus_per_product, stock=BENCH_STOCK)
+    shoppers = seed_shoppers(users, cart_lines)
+    product_ids = list(Product.objects.values_list('pk', flat=True)[:iterations])
+    sku_ids = list(ProductSKU.objects.values_list('pk', flat=True)[:iterations])
+    page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+    pages = max(1, min(5, math.ceil(Product.objects.filter(is_active=True).count() / page_size)))
+
+    clients = []
+    for user in shoppers:
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(user).access_token}")
+        clients.append(client)
+    anonymous = APIClient()
+
+    def shopper(i):
+        return clients[i % len(clients)]
+
+    def clear_cache(i):
+        cache.clear()
+
+    counter = itertools.count()
+
+    def create_session(**kwargs):
+        metadata = kwargs['metadata']
+        return fake_session(f"cs_bench_create_{next(counter)}", metadata.get('sku_id'), metadata.get('user_id'))
+
+    def verify(i):
+        session = fake_session(f"cs_bench_verify_{time.time_ns()}_{i}", sku_ids[i % len(sku_ids)],
+                               shoppers[i % len(shoppers)].id)
+        with mock.patch('stripe.checkout.Session.retrieve', return_value=session):
+            return shopper(i).post('/api/payment/verify-payment/', {'session_id': session.id}, format='json')
+
+    def checkout(i):
+        with mock.patch('stripe.checkout.Session.create', side_effect=create_session):
+            return shopper(i).post('/api/payment/create-checkout-session/', {}, format='json')
+
+    # name -> (send, before)
+    scenarios = {
+        'catalog_list_cold': (lambda i: anonymous.get('/api/products/', {'page': 1 + i % pages}), clear_cache),
+        'catalog_list_cached': (lambda i: anonymous.get('/api/products/', {'page': 1}), None),
+        'catalog_detail_cold': (
+            lambda i: anonymous.get(f"/api/products/{product_ids[i % len(product_ids)]}/"), clear_cache),
+        'cart_add_item': (
+            lambda i: shopper(i).post('/api/cart/add_item/',
+                                      {'sku_id': sku_ids[i % len(sku_ids)], 'quantity': 1}, format='json'),
+            None),
+        'cart_my_cart': (lambda i: shopper(i).get('/api/cart/my_cart/'), None),
+        'payment_create_checkout_session': (checkout, None),
+        'payment_verify_payment': (verify, None),
+    }
+    results = {
+        name: measure(iterations, send, before)
+        for name, (send, before) in scenarios.items()
+    }
+
+    return {
+        'config': {
+            'products': products, 'skus_per_product': skus_per_product, 'seeded_skus': seeded_skus,
+            'users': users, 'cart_lines': cart_lines, 'iterations': iterations,
+            'database': connection.vendor,
+        },
+        'scenarios': results,
+        'serialization': measure_serialization(iterations=iterations),
+        'search': measure_search(iterations=iterations),
+    }
+
+
+def compare_reports(baseline, current, tolerance=0.2):
+    """
+    Lines describing how `current` moved against `baseline`, and whether any
+    scenario regressed: p95 slower by more than `tolerance`, or more queries.
+    """
+    lines, regressed = [], False
+    for name, now in current['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before:
+            lines.append(f"{name}: new scenario")
+            continue
+        change = (now['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0
+        query_delta = now['queries_per_request'] - before['queries_per_request']
+        flag = change > tolerance or query_delta > 0
+        regressed = regressed or flag
+        lines.append(
+            f"{'REGRESSION ' if flag else ''}{name}: p95 {before['p95_ms']} -> {now['p95_ms']} ms "
+            f"({change:+.0%}), queries {before['queries_per_request']} -> {now['queries_per_request']}"
+        )
+    return lines, regressed
+
+
+def write_report(report, path):
+    with open(path, 'w') as handle:
+        json.dump(report, handle, indent=2, sort_keys=True)
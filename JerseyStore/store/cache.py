@@ -0,0 +1,196 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+# ===================================================================
+# CATALOG VERSION
+# ===================================================================
+# Every cached catalog page is keyed by the current catalog version.
+# Any write to Product, ProductSKU or Category bumps the version (see the
+# signals in models.py), so old pages simply stop being looked up and
+# expire on their own. Nothing is ever deleted key-by-key.
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def _seed_version():
+    # Seeded from the clock so an evicted version can never roll back
+    # onto pages that were cached under an earlier number.
+    return int(time.time() * 1000)
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, _seed_version(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # Key missing (first write or evicted): start a fresh version.
+        version = _seed_version()
+        cache.set(CATALOG_VERSION_KEY, version, timeout=None)
+        return version
+
+
+# ===================================================================
+# SINGLE FLIGHT
+# ===================================================================
+# When a drop goes live every client misses the cache for the same page at
+# once. Only one of them (the leader) computes it; the rest either get the
+# previous version of the page straight away (stale-while-revalidate) or,
+# if there is none, wait for the leader and read what it cached.
+#
+# Threads in one process wait on an Event. Across processes the leader
+# holds `<key>:lock` in the shared cache (cache.add) and the others poll
+# for the result. A follower that waited CATALOG_LOCK_TIMEOUT for nothing
+# (leader crashed, or its response wasn't cacheable) computes it itself.
+
+_flights = {}
+_flights_lock = threading.Lock()
+LOCK_POLL_INTERVAL = 0.02
+
+
+def single_flight(key, fill, fetch, stale=None):
+    """
+    fill() computes and caches the value for `key` and returns it; fetch()
+    returns what fill() cached, or None. stale(), when given, returns an
+    older value to serve instead of waiting, or None.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = threading.Event()
+
+    if leader:
+        try:
+            return _lead(key, fill, fetch, stale)
+        finally:
+            with _flights_lock:
+                del _flights[key]
+            flight.set()
+
+    result = stale() if stale else None
+    if result is None:
+        flight.wait(settings.CATALOG_LOCK_TIMEOUT)
+        result = fetch()
+    return result if result is not None else fill()
+
+
+def _lead(key, fill, fetch, stale):
+    # The previous leader may have finished between our miss and now
+    result = fetch()
+    if result is not None:
+        return result
+
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, 1, settings.CATALOG_LOCK_TIMEOUT):
+        try:
+            return fill()
+        finally:
+            cache.delete(lock_key)
+
+    # Another process is computing it
+    result = stale() if stale else None
+    deadline = time.monotonic() + settings.CATALOG_LOCK_TIMEOUT
+    while result is None and time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        result = fetch()
+        if result is None and cache.get(lock_key) is None:
+            break  # released without caching anything
+    return result if result is not None else fill()
+
+
+# ===================================================================
+# RESPONSE CACHE
+# ===================================================================
+
+def catalog_request_digest(request):
+    """
+    Identifies a catalog response: host (image URLs are absolute),
+    path and the sorted query string (filters, ordering, page).
+    """
+    params = sorted(
+        (key, value)
+        for key in request.query_params
+        for value in request.query_params.getlist(key)
+    )
+    raw = f"{request.scheme}://{request.get_host()}{request.path}?{params}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def catalog_etag(version, digest):
+    return f'"{version}-{digest[:16]}"'
+
+
+class CatalogCacheMixin:
+    """
+    Serves list/retrieve from the versioned cache.
+
+    The ETag is derived from the catalog version and the request digest,
+    so a matching If-None-Match is answered with a 304 before the cache
+    or the database is touched.
+
+    Misses go through single_flight(). The last page served for each
+    request digest is also kept under catalog:stale:<digest> for
+    CATALOG_STALE_TIMEOUT, so while a new version is being computed the
+    other clients get that one (with its own, older ETag).
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, view, request, *args, **kwargs):
+        version = get_catalog_version()
+        digest = catalog_request_digest(request)
+        etag = catalog_etag(version, digest)
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
+
+        cache_key = f"catalog:{version}:{digest}"
+        stale_key = f"catalog:stale:{digest}"
+
+        def fetch():
+            data = cache.get(cache_key)
+            return None if data is None else self.catalog_response(data, etag)
+
+        def stale():
+            previous = cache.get(stale_key)
+            return None if previous is None else self.catalog_response(previous[1], catalog_etag(previous[0], digest))
+
+        def fill():
+            response = view(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            cache.set(cache_key, response.data, settings.CATALOG_CACHE_TIMEOUT)
+            cache.set(stale_key, (version, response.data), settings.CATALOG_STALE_TIMEOUT)
+            response['ETag'] = etag
+            return response
+
+        response = fetch()
+        if response is None:
+            response = single_flight(cache_key, fill, fetch, stale)
+        return response
+
+    @staticmethod
+    def catalog_response(data, etag):
+        response = Response(data)
+        response['ETag'] = etag
+        return response
@@ -0,0 +1,287 @@
+import hashlib
+import re
+import secrets
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q, prefetch_related_objects
+
+from .models import Cart, CartItem, ProductSKU
+from .pricing import priced_items_prefetch
+
+# ===================================================================
+# CART STORAGE
+# ===================================================================
+# CartViewSet talks to a cart store instead of the ORM directly:
+#
+#   CART_STORAGE = 'orm'    Cart/CartItem rows, as before
+#   CART_STORAGE = 'cache'  one compact value per cart in the cache
+#                           (point CACHE_URL at Redis in production)
+#
+# With the cache store, adding and removing lines never writes to the
+# database; the lines are copied into Cart/CartItem only when a checkout
+# starts (persist()), because orders and stock reservations work from
+# those rows. Guest carts always live in the cache, under the token the
+# client sends as X-Cart-Token, and are merged into the customer's cart on
+# their first authenticated request.
+
+CART_TOKEN_HEADER = 'X-Cart-Token'
+CART_TOKEN_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+
+
+def new_cart_token():
+    return secrets.token_urlsafe(24)
+
+
+def valid_cart_token(token):
+    return bool(token) and bool(CART_TOKEN_PATTERN.match(token))
+
+
+def normalize_line(custom_name, custom_number):
+    """Same identity rules as CartViewSet.add_item: upper-cased name, integer number or None."""
+    custom_name = str(custom_name or '').strip().upper()
+    custom_number = str('' if custom_number is None else custom_number).strip()
+    return custom_name, int(custom_number) if custom_number else None
+
+
+def line_filter(sku_id, custom_name, custom_number):
+    """The CartItem row for a line; a blank name or number also matches NULL (see cartitem_unique_line)."""
+    name = Q(custom_name=custom_name) if custom_name else Q(custom_name='') | Q(custom_name__isnull=True)
+    number = Q(custom_number__isnull=True) if custom_number is None else Q(custom_number=custom_number)
+    return Q(sku_id=sku_id) & name & number
+
+
+def existing_lines(lines):
+    """(sku_id, quantity, name, number) lines with integer SKU ids, once every SKU is known to exist."""
+    lines = [(int(sku_id), quantity, custom_name, custom_number)
+             for sku_id, quantity, custom_name, custom_number in lines]
+    sku_ids = {line[0] for line in lines}
+    missing = sku_ids - set(ProductSKU.objects.filter(pk__in=sku_ids).values_list('pk', flat=True))
+    if missing:
+        raise ProductSKU.DoesNotExist(f"SKU {min(missing)} does not exist")
+    return lines
+
+
+def line_id(sku_id, custom_name, custom_number):
+    """Stable numeric id for a cache line (fits a JS number), so DELETE /api/cart_items/<id>/ works."""
+    key = f"{sku_id}|{custom_name}|{'' if custom_number is None else custom_number}"
+    return int(hashlib.sha1(key.encode()).hexdigest()[:12], 16)
+
+
+class OrmCartStore:
+    """The user's Cart and CartItem rows."""
+
+    def __init__(self, user):
+        self.user = user
+        self._cart = None
+
+    def cart(self):
+        if self._cart is None:
+            self._cart, _ = Cart.objects.get_or_create(user=self.user)
+        return self._cart
+
+    @property
+    def cart_id(self):
+        return self.cart().id
+
+    def priced_cart(self):
+        """The cart with every line priced in one query."""
+        cart = self.cart()
+        prefetch_related_objects([cart], priced_items_prefetch(CartItem.objects.all()))
+        return cart
+
+    def items(self):
+        return list(self.priced_cart().items.all())
+
+    def add(self, sku_id, quantity, custom_name='', custom_number=None):
+        """
+        Adds `quantity` (negative to take away) to a line in single UPDATE
+        statements, so two tabs adding the same jersey both count. A line
+        that does not exist yet is inserted; if another request inserted it
+        first, the unique constraint stops the duplicate and we increment
+        that row instead.
+        """
+        line = self.cart().items.filter(line_filter(sku_id, custom_name, custom_number))
+        if quantity < 0:
+            if not line.filter(quantity__gt=-quantity).update(quantity=F('quantity') + quantity):
+                line.delete()
+            return
+        if not quantity or line.update(quantity=F('quantity') + quantity):
+            return
+        try:
+            with transaction.atomic():
+                CartItem.objects.create(cart=self.cart(), sku_id=sku_id, quantity=quantity,
+                                        custom_name=custom_name, custom_number=custom_number)
+        except IntegrityError:
+            # Lost the race to insert the line
+            if not line.update(quantity=F('quantity') + quantity):
+                raise
+
+    def add_many(self, lines):
+        """Adds (sku_id, quantity, custom_name, custom_number) lines, all or none."""
+        lines = existing_lines(lines)
+        with transaction.atomic():
+            for line in lines:
+                self.add(*line)
+
+    def remove(self, item_id):
+        return CartItem.objects.filter(pk=item_id, cart__user=self.user).delete()[0] > 0
+
+    def merge_from(self, other):
+        if not other.load()['lines']:
+            return
+        for item in other.items():
+            self.add(item.sku_id, item.quantity, item.custom_name, item.custom_number)
+        other.clear()
+
+    def persist(self):
+        return self.cart()
+
+    def discard_sold(self, sold_items):
+        pass  # the order conversion deleted the rows itself
+
+    def clear(self):
+        CartItem.objects.filter(cart__user=self.user).delete()
+
+
+class CacheCartStore:
+    """
+    A cart held in the cache as
+        {'cart_id': <Cart pk once persisted>, 'lines': {line_id: [sku_id, quantity, name, number]}}
+    Concurrent writes to one cart are last-writer-wins, which is fine for a
+    single shopper's clicks.
+    """
+
+    def __init__(self, key, user=None):
+        self.key = key
+        self.user = user
+        self.cache = caches[settings.CART_CACHE_ALIAS]
+        self._value = None
+
+    @classmethod
+    def for_user(cls, user):
+        return cls(f"cart:user:{user.pk}", user=user)
+
+    @classmethod
+    def for_guest(cls, token):
+        return cls(f"cart:guest:{token}")
+
+    def load(self):
+        if self._value is None:
+            self._value = self.cache.get(self.key)
+        if self._value is None:
+            self._value = self.from_database() if self.user else {'cart_id': None, 'lines': {}}
+        return self._value
+
+    def from_database(self):
+        """
+        A cache miss (first use, eviction, or switching from the ORM store)
+        starts from whatever the user's Cart rows hold.
+        """
+        cart = Cart.objects.filter(user=self.user).first()
+        lines = {}
+        if cart:
+            for sku_id, quantity, custom_name, custom_number in cart.items.values_list(
+                'sku_id', 'quantity', 'custom_name', 'custom_number'
+            ):
+                custom_name = custom_name or ''
+                key = str(line_id(sku_id, custom_name, custom_number))
+                current = lines.setdefault(key, [sku_id, 0, custom_name, custom_number])
+                current[1] += quantity
+        return {'cart_id': cart.id if cart else None, 'lines': lines}
+
+    def save(self):
+        if self._value['lines'] or self._value['cart_id']:
+            self.cache.set(self.key, self._value, settings.CART_CACHE_TIMEOUT)
+        else:
+            self.cache.delete(self.key)
+
+    @property
+    def cart_id(self):
+        return self.load()['cart_id']
+
+    def items(self):
+        """Unsaved CartItems with their SKUs loaded in one query; priced by get_total_item_price()."""
+        lines = self.load()['lines']
+        skus = ProductSKU.objects.in_bulk({line[0] for line in lines.values()})
+        return [
+            CartItem(id=int(pk), sku=skus[sku_id], quantity=quantity,
+                     custom_name=custom_name, custom_number=custom_number)
+            for pk, (sku_id, quantity, custom_name, custom_number) in lines.items()
+            if sku_id in skus
+        ]
+
+    def add(self, sku_id, quantity, custom_name='', custom_number=None):
+        self.add_many([(sku_id, quantity, custom_name, custom_number)])
+
+    def add_many(self, lines):
+        """Adds (sku_id, quantity, custom_name, custom_number) lines with one SKU check and one write."""
+        lines = existing_lines(lines)
+        stored = self.load()['lines']
+        for sku_id, quantity, custom_name, custom_number in lines:
+            key = str(line_id(sku_id, custom_name, custom_number))
+            current = stored.get(key, [sku_id, 0, custom_name, custom_number])
+            current[1] += quantity
+            if current[1] > 0:
+                stored[key] = current
+            else:
+                stored.pop(key, None)
+        self.save()
+
+    def remove(self, item_id):
+        removed = self.load()['lines'].pop(str(item_id), None) is not None
+        if removed:
+            self.save()
+        return removed
+
+    def merge_from(self, other):
+        if not other.load()['lines']:
+            return
+        lines = self.load()['lines']
+        for key, (sku_id, quantity, custom_name, custom_number) in other.load()['lines'].items():
+            current = lines.get(key, [sku_id, 0, custom_name, custom_number])
+            current[1] += quantity
+            lines[key] = current
+        self.save()
+        other.clear()
+
+    def persist(self):
+        """Writes the lines into the user's Cart (replacing its rows) and returns it."""
+        value = self.load()
+        with transaction.atomic():
+            cart, _ = Cart.objects.get_or_create(user=self.user)
+            cart.items.all().delete()
+            CartItem.objects.bulk_create([
+                CartItem(cart=cart, sku=item.sku, quantity=item.quantity,
+                         custom_name=item.custom_name, custom_number=item.custom_number)
+                for item in self.items()
+            ])
+        value['cart_id'] = cart.id
+        self.save()
+        return cart
+
+    def discard_sold(self, sold_items):
+        """Takes the quantities an order just bought off the matching lines."""
+        lines = self.load()['lines']
+        for item in sold_items:
+            key = str(line_id(item.sku_id, item.custom_name or '', item.custom_number))
+            if key in lines:
+                lines[key][1] -= item.quantity
+                if lines[key][1] <= 0:
+                    del lines[key]
+        self.save()
+
+    def clear(self):
+        self._value = {'cart_id': self.load()['cart_id'], 'lines': {}}
+        self.save()
+
+
+def get_cart_store(user):
+    if settings.CART_STORAGE == 'cache':
+        return CacheCartStore.for_user(user)
+    return OrmCartStore(user)
+
+
+def get_guest_cart_store(token):
+    return CacheCartStore.for_guest(token)
@@ -0,0 +1,304 @@
+import csv
+import itertools
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils.text import slugify
+
+from .cache import bump_catalog_version
+from .models import Category, Product, ProductSKU, StockReservation
+from .search import index_products
+from .summaries import refresh_product_summaries
+
+# ===================================================================
+# CATALOG IMPORT
+# ===================================================================
+# Streams a supplier feed (CSV or JSON lines, one SKU per row) and upserts
+# categories, products and SKUs a batch at a time with
+# bulk_create(update_conflicts=True): a batch costs a handful of queries
+# whatever its size, and only one batch is ever held in memory.
+#
+# Keys: categories by `category_slug`, products by `product_slug` (derived
+# from team/name/season/type when absent), SKUs by `sku_code`.
+#
+# bulk_create skips the model signals, so each batch refreshes its
+# products' summary columns (store/summaries.py) with one UPDATE.
+#
+# Optional columns (category_name, description, is_active, image) are
+# only written when the feed has them, so a feed that doesn't carry them
+# leaves hand-edited names, descriptions, active flags and images alone.
+#
+# The feed's stock_quantity is stock on hand; units currently held by
+# checkout reservations are subtracted so a sync never re-sells them.
+
+REQUIRED_COLUMNS = ('sku_code', 'name', 'team', 'season', 'size', 'price', 'category_slug')
+
+PRODUCT_FIELDS = ['category', 'name', 'team', 'season', 'jersey_type']
+SKU_FIELDS = ['product', 'size', 'price', 'custom_printing_cost', 'stock_quantity']
+
+# Feed column -> (model, field) it owns when present
+OPTIONAL_COLUMNS = {
+    'category_name': ('category', 'name'),
+    'description': ('product', 'description'),
+    'is_active': ('product', 'is_active'),
+    'image': ('sku', 'image'),
+}
+
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'off'}
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+def read_rows(handle, fmt):
+    """Yields (line_number, raw dict) from a CSV or JSON-lines file object."""
+    if fmt == 'csv':
+        reader = csv.DictReader(handle)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(handle, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, ImportRowError(f"invalid JSON: {e}")
+            continue
+        yield line_number, row if isinstance(row, dict) else ImportRowError("expected a JSON object")
+
+
+def parse_money(value, column):
+    try:
+        amount = Decimal(str(value).strip()).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise ImportRowError(f"{column} is not a number: {value!r}")
+    if amount < 0:
+        raise ImportRowError(f"{column} is negative: {value!r}")
+    return amount
+
+
+def parse_row(raw):
+    """Validates one feed row into the values the upsert needs."""
+    row = {key: (str(value).strip() if value is not None else '') for key, value in raw.items()}
+    missing = [column for column in REQUIRED_COLUMNS if not row.get(column)]
+    if missing:
+        raise ImportRowError(f"missing {', '.join(missing)}")
+    try:
+        stock = int(row.get('stock_quantity') or 0)
+    except ValueError:
+        raise ImportRowError(f"stock_quantity is not an integer: {row['stock_quantity']!r}")
+
+    jersey_type = (row.get('jersey_type') or 'HOME').upper()
+    product_slug = row.get('product_slug') or slugify(
+        f"{row['team']} {row['name']} {row['season']} {jersey_type}"
+    )
+    return {
+        'sku_code': row['sku_code'],
+        'category_slug': row['category_slug'],
+        'category_name': row.get('category_name') or row['category_slug'].replace('-', ' ').title(),
+        'product_slug': product_slug[:220],
+        'name': row['name'],
+        'team': row['team'],
+        'season': row['season'],
+        'jersey_type': jersey_type,
+        'description': row.get('description', ''),
+        'is_active': row.get('is_active', '').lower() not in FALSE_VALUES,
+        'size': row['size'].upper(),
+        'price': parse_money(row['price'], 'price'),
+        'custom_printing_cost': parse_money(row.get('custom_printing_cost') or '15.00', 'custom_printing_cost'),
+        'stock_quantity': max(stock, 0),
+        'image': row.get('image') or None,
+    }
+
+
+class CatalogImport:
+    """
+    Upserts feed rows in batches. With dry_run=True nothing is written and
+    `changes` lists what a real run would do.
+
+    `columns` (the OPTIONAL_COLUMNS the feed carries) is decided by the
+    first row: a feed owns the fields for those columns and leaves the
+    others alone.
+    """
+
+    def __init__(self, batch_size=1000, dry_run=False, max_errors=20, max_changes=50):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.max_errors = max_errors
+        self.max_changes = max_changes
+        self.columns = None
+        self.stats = {'rows': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0, 'products': 0}
+        self.errors = []
+        self.changes = []
+
+    def run(self, rows, on_batch=None):
+        parsed = self.parse(rows)
+        while True:
+            batch = list(itertools.islice(parsed, self.batch_size))
+            if not batch:
+                break
+            self.import_batch(batch)
+            if on_batch:
+                on_batch(self.stats)
+        if not self.dry_run:
+            bump_catalog_version()  # bulk writes skip the cache signals
+        return self.stats
+
+    def parse(self, rows):
+        for line_number, raw in rows:
+            self.stats['rows'] += 1
+            try:
+                if isinstance(raw, ImportRowError):
+                    raise raw
+                if self.columns is None:
+                    self.columns = {column for column in OPTIONAL_COLUMNS if column in raw}
+                yield parse_row(raw)
+            except ImportRowError as e:
+                self.stats['skipped'] += 1
+                if len(self.errors) < self.max_errors:
+                    self.errors.append(f"line {line_number}: {e}")
+
+    def import_batch(self, batch):
+        # Last row wins when a feed repeats a SKU within one batch
+        batch = list({row['sku_code']: row for row in batch}.values())
+        existing = {
+            sku['sku_code']: sku
+            for sku in ProductSKU.objects.filter(sku_code__in=[row['sku_code'] for row in batch]).values(
+                'sku_code', 'product_id', 'size', 'price', 'custom_printing_cost', 'stock_quantity', 'image',
+                'product__slug', 'product__name', 'product__team', 'product__season', 'product__jersey_type',
+                'product__description', 'product__is_active', 'product__category__slug',
+            )
+        }
+        held = dict(
+            StockReservation.objects.filter(
+                sku__sku_code__in=list(existing), status='HELD'
+            ).values('sku__sku_code').annotate(total=Sum('quantity')).values_list('sku__sku_code', 'total')
+        )
+        for row in batch:
+            row['stock_quantity'] = max(row['stock_quantity'] - held.get(row['sku_code'], 0), 0)
+
+        for row in batch:
+            diff = self.diff(row, existing.get(row['sku_code']))
+            if diff is None:
+                self.stats['created'] += 1
+                self.record(f"+ {row['sku_code']} ({row['product_slug']}, {row['size']}, {row['price']})")
+            elif diff:
+                self.stats['updated'] += 1
+                self.record(f"~ {row['sku_code']}: " + ', '.join(
+                    f"{field} {old!r} -> {new!r}" for field, (old, new) in diff.items()
+                ))
+            else:
+                self.stats['unchanged'] += 1
+
+        if self.dry_run:
+            return
+        with transaction.atomic():
+            self.write_batch(batch, existing)
+
+    def diff(self, row, current):
+        """None for a new SKU, otherwise {field: (old, new)} for what would change."""
+        if current is None:
+            return None
+        compare = {
+            'product': (current['product__slug'], row['product_slug']),
+            'name': (current['product__name'], row['name']),
+            'team': (current['product__team'], row['team']),
+            'season': (current['product__season'], row['season']),
+            'jersey_type': (current['product__jersey_type'], row['jersey_type']),
+            'description': (current['product__description'], row['description']),
+            'is_active': (current['product__is_active'], row['is_active']),
+            'category': (current['product__category__slug'], row['category_slug']),
+            'size': (current['size'], row['size']),
+            'price': (str(current['price']), str(row['price'])),
+            'custom_printing_cost': (str(current['custom_printing_cost']), str(row['custom_printing_cost'])),
+            'stock_quantity': (current['stock_quantity'], row['stock_quantity']),
+        }
+        for column in OPTIONAL_COLUMNS.keys() - self.columns:
+            compare.pop(column, None)
+        if 'image' in self.columns:
+            compare['image'] = (current['image'] or None, row['image'])
+        if current['product__slug'] is None:
+            # Hand-made product adopted by the feed: it keeps its row and gains a slug
+            del compare['product']
+        return {field: pair for field, pair in compare.items() if pair[0] != pair[1]}
+
+    def record(self, change):
+        if self.dry_run and len(self.changes) < self.max_changes:
+            self.changes.append(change)
+
+    def owned_fields(self, model):
+        return [field for column, (owner, field) in OPTIONAL_COLUMNS.items()
+                if owner == model and column in self.columns]
+
+    def write_batch(self, batch, existing):
+        categories = [
+            Category(slug=slug, name=name)
+            for slug, name in {row['category_slug']: row['category_name'] for row in batch}.items()
+        ]
+        if self.owned_fields('category'):
+            Category.objects.bulk_create(categories, update_conflicts=True, unique_fields=['slug'],
+                                         update_fields=['name'])
+        else:
+            # Names derived from the slug only ever name new categories
+            Category.objects.bulk_create(categories, ignore_conflicts=True)
+        category_ids = dict(Category.objects.filter(
+            slug__in={row['category_slug'] for row in batch}
+        ).values_list('slug', 'pk'))
+
+        products = {row['product_slug']: row for row in batch}
+        self.adopt_unslugged_products(batch, existing, products)
+        Product.objects.bulk_create(
+            [
+                Product(
+                    slug=slug, category_id=category_ids[row['category_slug']], name=row['name'],
+                    team=row['team'], season=row['season'], jersey_type=row['jersey_type'],
+                    description=row['description'], is_active=row['is_active'],
+                )
+                for slug, row in products.items()
+            ],
+            update_conflicts=True, unique_fields=['slug'],
+            update_fields=PRODUCT_FIELDS + self.owned_fields('product'),
+        )
+        product_ids = dict(Product.objects.filter(slug__in=list(products)).values_list('slug', 'pk'))
+        self.stats['products'] += len(products)
+
+        ProductSKU.objects.bulk_create(
+            [
+                ProductSKU(
+                    sku_code=row['sku_code'], product_id=product_ids[row['product_slug']], size=row['size'],
+                    price=row['price'], custom_printing_cost=row['custom_printing_cost'],
+                    stock_quantity=row['stock_quantity'], image=row['image'],
+                )
+                for row in batch
+            ],
+            update_conflicts=True, unique_fields=['sku_code'],
+            update_fields=SKU_FIELDS + self.owned_fields('sku'),
+        )
+        # Products a SKU moved away from need their summaries redone as well
+        moved_from = {sku['product_id'] for sku in existing.values()}
+        refresh_product_summaries(product_ids=set(product_ids.values()) | moved_from)
+        index_products(product_ids.values())
+
+    def adopt_unslugged_products(self, batch, existing, products):
+        """
+        Gives products created by hand (no slug yet) the slug their SKUs carry
+        in the feed, so the upsert updates them instead of making duplicates.
+        """
+        if not any(current['product__slug'] is None for current in existing.values()):
+            return
+        taken = set(Product.objects.filter(slug__in=list(products)).values_list('slug', flat=True))
+        adopted = {}
+        for row in batch:
+            current = existing.get(row['sku_code'])
+            slug = row['product_slug']
+            if current and current['product__slug'] is None and slug not in taken:
+                adopted.setdefault(current['product_id'], slug)
+                taken.add(slug)
+        if adopted:
+            Product.objects.bulk_update(
+                [Product(pk=pk, slug=slug) for pk, slug in adopted.items()], ['slug']
+            )
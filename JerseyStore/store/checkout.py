@@ -0,0 +1,131 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils import timezone
+
+from .carts import get_cart_store
+from .inventory import release_reservations, reserve_stock
+from .models import CheckoutLine, ProductSKU, StockReservation
+from .pricing import priced_items
+
+SHIPPING_COST = Decimal('10.00')
+
+# Stripe accepts a session expires_at between 30 minutes and 24 hours
+# after the session is created; the margin covers the time between
+# computing it here and Stripe receiving the request.
+STRIPE_MIN_EXPIRY = timedelta(minutes=30)
+STRIPE_MAX_EXPIRY = timedelta(hours=24)
+STRIPE_EXPIRY_MARGIN = timedelta(minutes=2)
+
+
+def session_expiry(hold_expires_at, now=None):
+    """
+    expires_at for a Stripe session whose stock is held until
+    `hold_expires_at`, or None when the hold is too short for Stripe to
+    accept it (the session then keeps Stripe's default, and a late payment
+    is settled by commit_reservations).
+    """
+    now = now or timezone.now()
+    if hold_expires_at < now + STRIPE_MIN_EXPIRY + STRIPE_EXPIRY_MARGIN:
+        return None
+    return int(min(hold_expires_at, now + STRIPE_MAX_EXPIRY - STRIPE_EXPIRY_MARGIN).timestamp())
+
+
+class CheckoutError(Exception):
+    """A checkout request that cannot go ahead; carries the HTTP status to answer with."""
+
+    def __init__(self, message, status_code=400, **extra):
+        super().__init__(message)
+        self.status_code = status_code
+        self.extra = extra
+
+    def as_response_data(self):
+        return {"error": str(self), **self.extra}
+
+
+def prepare_checkout_session(user, data):
+    """
+    Prices an 'Instant Buy' or 'Full Cart' checkout, holds the stock and
+    returns (session_params, reservations).
+
+    session_params are the keyword arguments for Stripe's
+    checkout.Session.create; the caller makes the call (sync SDK or the async
+    client in store/providers.py) and must release the reservations if it fails.
+    Raises CheckoutError, or OutOfStock from reserve_stock.
+    """
+    if data.get('is_instant', False):
+        sku_id = data.get('sku_id')
+        if not sku_id:
+            raise CheckoutError("sku_id is required for instant purchase")
+        try:
+            sku = ProductSKU.objects.select_related('product').get(id=sku_id)
+        except ProductSKU.DoesNotExist:
+            raise CheckoutError("Product SKU not found", status_code=404)
+        try:
+            qty = int(data.get('qty', 1))
+        except (TypeError, ValueError):
+            raise CheckoutError("qty must be a whole number")
+        if qty < 1:
+            raise CheckoutError("qty must be at least 1")
+        paid_lines = [CheckoutLine(sku=sku, quantity=qty, unit_price=sku.price)]
+        total_cents = int((Decimal(str(sku.price)) * qty + SHIPPING_COST) * 100)
+        metadata = {
+            "sku_id": str(sku.id),
+            "qty": str(qty),
+            "is_instant": "true",
+            "user_id": str(user.id)
+        }
+        line_item_name = f"Instant Purchase: {sku.product.name}"
+    else:
+        # Cache-backed carts reach the database here, at checkout
+        cart = get_cart_store(user).persist()
+        items = list(priced_items(cart.items.order_by('id')))
+        if not items:
+            raise CheckoutError("Locker is empty")
+        total_cents = int((sum(item.line_total for item in items) + SHIPPING_COST) * 100)
+        paid_lines = [
+            CheckoutLine(cart_item=item, sku_id=item.sku_id, quantity=item.quantity, unit_price=item.unit_price,
+                         custom_name=item.custom_name, custom_number=item.custom_number)
+            for item in items
+        ]
+        metadata = {
+            "is_instant": "false",
+            "cart_id": str(cart.id),
+            "user_id": str(user.id)
+        }
+        line_item_name = "Jersey Arena - Locker Checkout"
+
+    # A customer who backed out of Stripe and tries again must not be
+    # blocked by their own earlier hold: one checkout at a time holds stock.
+    # (If the abandoned session is paid after all, commit_reservations
+    # takes the stock again.)
+    release_reservations(StockReservation.objects.filter(user=user, status='HELD'))
+    # Hold the stock before sending the customer to pay for it
+    reservations = reserve_stock(user, [(line.sku_id, line.quantity) for line in paid_lines])
+    # ...and remember exactly what is being paid for
+    held = {reservation.sku_id: reservation for reservation in reservations}
+    for line in paid_lines:
+        line.reservation = held[line.sku_id]
+    CheckoutLine.objects.bulk_create(paid_lines)
+    params = {
+        'payment_method_types': ['card'],
+        'line_items': [{
+            'price_data': {
+                'currency': 'usd',
+                'product_data': {'name': line_item_name},
+                'unit_amount': total_cents
+            },
+            'quantity': 1
+        }],
+        'mode': 'payment',
+        'metadata': metadata,
+        'success_url': f"{settings.CLIENT_URL}/success?session_id={{CHECKOUT_SESSION_ID}}",
+        # The cancel page hands the session back to cancel-checkout
+        'cancel_url': f"{settings.CLIENT_URL}/cancel?session_id={{CHECKOUT_SESSION_ID}}",
+    }
+    expires_at = session_expiry(reservations[0].expires_at)
+    if expires_at is not None:
+        # Stripe stops taking payment when the hold runs out
+        params['expires_at'] = expires_at
+    return params, reservations
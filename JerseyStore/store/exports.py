@@ -0,0 +1,148 @@
+import csv
+import json
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.utils import timezone
+
+from .analytics import start_of_day
+from .models import Newsletter, Order, Product
+
+# ===================================================================
+# STREAMING EXPORTS
+# ===================================================================
+# Orders (one row per order line; orders without lines get one row with
+# empty item columns), newsletter subscribers and the catalog
+# (one row per SKU) as CSV or JSON Lines, for the staff export endpoint
+# and the export_data command.
+#
+# Rows come from .values_list().iterator(chunk_size=EXPORT_CHUNK_SIZE):
+# a server-side cursor on PostgreSQL, fetchmany() on SQLite. Nothing is
+# loaded up front, so memory stays flat however many rows there are and
+# the first bytes go out as soon as the first chunk arrives. gzip, when
+# asked for, compresses chunk by chunk as well.
+# Under DB_PGBOUNCER server-side cursors are disabled and the driver
+# buffers the whole result; export from a direct connection instead.
+
+# name -> (queryset, {header: values_list path}, date field `since` filters on)
+DATASETS = {
+    'orders': (
+        lambda: Order.objects.order_by('id', 'items__id'),
+        {
+            'order_id': 'id', 'created_at': 'created_at', 'status': 'status',
+            'username': 'user__username', 'email': 'user__email', 'total_amount': 'total_amount',
+            'shipping_address': 'shipping_address', 'city': 'city', 'zip_code': 'zip_code',
+            'transaction_id': 'transaction_id', 'item_id': 'items__id', 'sku_code': 'items__sku__sku_code',
+            'product_name': 'items__product_name', 'price_at_purchase': 'items__price_at_purchase',
+            'quantity': 'items__quantity', 'custom_name': 'items__custom_name',
+            'custom_number': 'items__custom_number',
+        },
+        'created_at',
+    ),
+    'newsletter': (
+        lambda: Newsletter.objects.order_by('id'),
+        {'email': 'email', 'subscribed_at': 'subscribed_at'},
+        'subscribed_at',
+    ),
+    'catalog': (
+        lambda: Product.objects.order_by('id', 'skus__id'),
+        {
+            'product_id': 'id', 'slug': 'slug', 'name': 'name', 'team': 'team', 'season': 'season',
+            'jersey_type': 'jersey_type', 'category': 'category__slug', 'is_active': 'is_active',
+            'sku_code': 'skus__sku_code', 'size': 'skus__size', 'price': 'skus__price',
+            'custom_printing_cost': 'skus__custom_printing_cost', 'stock_quantity': 'skus__stock_quantity',
+        },
+        None,
+    ),
+}
+
+FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+# Rows per chunk handed to the response (and to zlib)
+ROWS_PER_WRITE = 500
+
+
+def export_rows(dataset, since=None):
+    """(headers, row iterator) for a dataset, rows created on or after `since` (a date) if given."""
+    queryset, columns, date_field = DATASETS[dataset]
+    queryset = queryset()
+    if since is not None and date_field:
+        queryset = queryset.filter(**{f"{date_field}__gte": start_of_day(since)})
+    rows = queryset.values_list(*columns.values()).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    return list(columns), rows
+
+
+def cell(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+# Spreadsheets run a cell starting with one of these as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def csv_cell(value):
+    """cell(), with text a spreadsheet would evaluate quoted by a leading apostrophe."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return cell(value)
+
+
+class Echo:
+    """csv.writer target that hands each line back instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def encode_csv(headers, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(headers).encode()
+    lines = []
+    for row in rows:
+        lines.append(writer.writerow([csv_cell(value) for value in row]))
+        if len(lines) == ROWS_PER_WRITE:
+            yield ''.join(lines).encode()
+            lines = []
+    if lines:
+        yield ''.join(lines).encode()
+
+
+def encode_jsonl(headers, rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(dict(zip(headers, map(cell, row)))) + '\n')
+        if len(lines) == ROWS_PER_WRITE:
+            yield ''.join(lines).encode()
+            lines = []
+    if lines:
+        yield ''.join(lines).encode()
+
+
+ENCODERS = {'csv': encode_csv, 'jsonl': encode_jsonl}
+
+
+def gzip_chunks(chunks):
+    """Compresses a byte stream into a gzip file as it goes."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip header and trailer
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_stream(dataset, file_format='csv', compress=False, since=None):
+    """The export as an iterator of byte chunks."""
+    headers, rows = export_rows(dataset, since=since)
+    chunks = ENCODERS[file_format](headers, rows)
+    return gzip_chunks(chunks) if compress else chunks
+
+
+def export_filename(dataset, file_format='csv', compress=False):
+    return f"{dataset}-{timezone.localdate().isoformat()}.{file_format}{'.gz' if compress else ''}"
@@ -0,0 +1,83 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Exists, OuterRef
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+from .models import ProductSKU
+
+TRUE_VALUES = ('1', 'true', 'yes')
+
+
+def parse_price(params, name):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValidationError({name: "Must be a number."})
+
+
+class CatalogFilterBackend(BaseFilterBackend):
+    """
+    Server-side catalog filters for ProductViewSet.
+
+    Product filters:   ?team=  ?season=  ?jersey_type=  ?category=<slug or id>
+    SKU filters:       ?min_price=  ?max_price=  ?size=M,L  ?in_stock=true
+    Ordering:          ?ordering=price|-price|newest|oldest|name|-name
+
+    All SKU filters must hold for the *same* SKU (a size M that is in stock
+    and within budget), and are applied as a single EXISTS so products
+    never come back duplicated. ?in_stock on its own and price ordering use
+    the product's summary columns and never touch the SKU table.
+    """
+
+    ORDERING = {
+        'price': ('min_price', 'id'),
+        '-price': ('-min_price', 'id'),
+        'newest': ('-created_at', '-id'),
+        'oldest': ('created_at', 'id'),
+        'name': ('name', 'id'),
+        '-name': ('-name', 'id'),
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        for field in ('team', 'season'):
+            if params.get(field):
+                queryset = queryset.filter(**{field: params[field]})
+        if params.get('jersey_type'):
+            queryset = queryset.filter(jersey_type=params['jersey_type'].upper())
+
+        category = params.get('category')
+        if category:
+            if category.isdigit():
+                queryset = queryset.filter(category_id=category)
+            else:
+                queryset = queryset.filter(category__slug=category)
+
+        sku_filters = {}
+        min_price = parse_price(params, 'min_price')
+        max_price = parse_price(params, 'max_price')
+        if min_price is not None:
+            sku_filters['price__gte'] = min_price
+        if max_price is not None:
+            sku_filters['price__lte'] = max_price
+        sizes = [size.strip().upper() for size in params.get('size', '').split(',') if size.strip()]
+        if sizes:
+            sku_filters['size__in'] = sizes
+        in_stock = params.get('in_stock', '').lower() in TRUE_VALUES
+        if in_stock and sku_filters:
+            sku_filters['stock_quantity__gt'] = 0
+        elif in_stock:
+            queryset = queryset.filter(total_stock__gt=0)
+        if sku_filters:
+            matching_skus = ProductSKU.objects.filter(product=OuterRef('pk'), **sku_filters)
+            queryset = queryset.filter(Exists(matching_skus))
+
+        ordering = self.ORDERING.get(params.get('ordering', ''))
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return queryset
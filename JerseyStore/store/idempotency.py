@@ -0,0 +1,99 @@
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from .carts import CART_TOKEN_HEADER
+
+# ===================================================================
+# IDEMPOTENCY KEYS
+# ===================================================================
+# A client that retries a POST (timeout, flaky network, double click)
+# sends the same Idempotency-Key header again. The first request claims
+# the key in the cache; a retry gets the stored response back instead of
+# running the action twice:
+#
+#   still running     -> 409, try again shortly
+#   finished          -> the original status and body, with
+#                        Idempotent-Replayed: true
+#   different payload -> 422, keys are single-use
+#
+# Keys are scoped to the customer (or guest cart token) and the action.
+# Only successful responses are kept; a failed request releases its key
+# so the client can retry with the same key.
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+PENDING = 'pending'
+
+
+def idempotency_cache_key(scope, key, owner):
+    raw = f"{scope}|{owner}|{key}"
+    return f"idempotency:{hashlib.sha256(raw.encode()).hexdigest()}"
+
+
+def request_fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def idempotent(scope):
+    """
+    Decorator for a view method (action) honouring Idempotency-Key.
+
+    Views with a guest cart (CartStoreMixin) get the cart token replayed
+    too, so a retried first add lands in the cart the first attempt made.
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER, '')
+            if not key:
+                return method(view, request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response({"error": f"{IDEMPOTENCY_HEADER} is too long"},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+            if request.user.is_authenticated:
+                owner = f"user:{request.user.pk}"
+            else:
+                owner = f"guest:{request.headers.get(CART_TOKEN_HEADER, '')}"
+            cache_key = idempotency_cache_key(scope, key, owner)
+            fingerprint = request_fingerprint(request)
+
+            claim = {'state': PENDING, 'fingerprint': fingerprint}
+            if not cache.add(cache_key, claim, settings.IDEMPOTENCY_LOCK_TIMEOUT):
+                stored = cache.get(cache_key) or claim
+                if stored['fingerprint'] != fingerprint:
+                    return Response({"error": f"{IDEMPOTENCY_HEADER} was already used for a different request"},
+                                    status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+                if stored['state'] == PENDING:
+                    return Response({"error": "A request with this key is still being processed"},
+                                    status=status.HTTP_409_CONFLICT)
+                view.guest_cart_token = stored.get('cart_token', '')
+                response = Response(stored['data'], status=stored['status'])
+                response['Idempotent-Replayed'] = 'true'
+                return response
+
+            try:
+                response = method(view, request, *args, **kwargs)
+            except Exception:
+                cache.delete(cache_key)
+                raise
+            if response.status_code < 400:
+                cache.set(cache_key, {
+                    'state': 'done', 'fingerprint': fingerprint, 'status': response.status_code,
+                    'data': response.data, 'cart_token': getattr(view, 'guest_cart_token', ''),
+                }, settings.IDEMPOTENCY_KEY_TIMEOUT)
+            else:
+                cache.delete(cache_key)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,141 @@
+import logging
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# ===================================================================
+# IMAGE RENDITIONS
+# ===================================================================
+# Every SKU image gets resized copies in WebP and JPEG, written once (on
+# save, or by the generate_renditions command) next to the original:
+#   products/arsenal.png -> products/renditions/arsenal.png-card.webp, ...
+# The whole original file name is kept, so arsenal.png and arsenal.jpg
+# never share renditions. The paths land in ProductSKU.image_renditions,
+# so serializing a product only turns stored paths into URLs; nothing is
+# resized per request. When a SKU's image changes or is cleared, the old
+# renditions are deleted (see retire_renditions in models.py).
+
+# name -> maximum width in pixels; smaller originals are never upscaled
+RENDITIONS = {
+    'card': 400,
+    'detail': 800,
+    'zoom': 1600,
+}
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def rendition_path(source, name, extension):
+    directory, filename = posixpath.split(source)
+    return posixpath.join(directory, 'renditions', f"{filename}-{name}.{extension}")
+
+
+def encode(image, fmt):
+    pil_format, options = FORMATS[fmt]
+    if pil_format == 'JPEG' and image.mode != 'RGB':
+        # JPEG has no alpha: flatten transparent kits onto white
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    return buffer.getvalue()
+
+
+def generate_renditions(source, storage=default_storage):
+    """
+    Writes every rendition of the image stored at `source` and returns the
+    map to keep in ProductSKU.image_renditions:
+        {'source': ..., 'card': {'width': 400, 'height': 480, 'webp': path, 'jpeg': path}, ...}
+    Returns {} when the original is missing or not an image.
+    """
+    try:
+        with storage.open(source, 'rb') as handle:
+            original = ImageOps.exif_transpose(Image.open(handle))
+            original.load()
+    except FileNotFoundError:
+        # Common in dev databases without the media folder; not worth a warning
+        logger.info("No file for %s, skipping renditions", source)
+        return {}
+    except (OSError, UnidentifiedImageError) as e:
+        logger.warning("Cannot build renditions for %s: %s", source, e)
+        return {}
+
+    if original.mode not in ('RGB', 'RGBA'):
+        original = original.convert('RGBA' if original.has_transparency_data else 'RGB')
+
+    renditions = {'source': source}
+    for name, max_width in RENDITIONS.items():
+        if original.width > max_width:
+            height = round(original.height * max_width / original.width)
+            image = original.resize((max_width, height), Image.LANCZOS)
+        else:
+            image = original
+        entry = {'width': image.width, 'height': image.height}
+        for fmt in FORMATS:
+            path = rendition_path(source, name, fmt)
+            if storage.exists(path):
+                storage.delete(path)
+            entry[fmt] = storage.save(path, ContentFile(encode(image, fmt)))
+        renditions[name] = entry
+    return renditions
+
+
+def delete_renditions(renditions, storage=default_storage):
+    """Deletes the files listed in a renditions map (missing ones are skipped)."""
+    for name in RENDITIONS:
+        entry = (renditions or {}).get(name) or {}
+        for fmt in FORMATS:
+            if entry.get(fmt):
+                storage.delete(entry[fmt])
+
+
+def needs_renditions(sku):
+    """True when the stored renditions were not made from the SKU's current image."""
+    image = sku.image.name if sku.image else None
+    return (sku.image_renditions or {}).get('source') != image
+
+
+def renditions_for(sku):
+    return generate_renditions(sku.image.name) if sku.image else {}
+
+
+def rendition_urls(renditions, request=None, storage=default_storage):
+    """
+    Stored rendition paths as URLs, plus a ready-made srcset per format:
+        {'card': {'width': 400, 'webp': url, 'jpeg': url}, ...,
+         'srcset': {'webp': 'url 400w, url 800w, ...', 'jpeg': ...}}
+    """
+    if not renditions:
+        return None
+
+    def url(path):
+        location = storage.url(path)
+        return request.build_absolute_uri(location) if request else location
+
+    result = {}
+    srcset = {fmt: [] for fmt in FORMATS}
+    widths = set()
+    for name in RENDITIONS:
+        entry = renditions.get(name)
+        if not entry:
+            continue
+        result[name] = {'width': entry['width'], 'height': entry['height']}
+        for fmt in FORMATS:
+            result[name][fmt] = url(entry[fmt])
+        # A small original yields equal widths; list each width once
+        if entry['width'] not in widths:
+            widths.add(entry['width'])
+            for fmt in FORMATS:
+                srcset[fmt].append(f"{result[name][fmt]} {entry['width']}w")
+    result['srcset'] = {fmt: ', '.join(candidates) for fmt, candidates in srcset.items()}
+    return result
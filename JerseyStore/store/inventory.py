@@ -0,0 +1,136 @@
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Order, ProductSKU, StockReservation
+from .summaries import refresh_product_summaries
+
+logger = logging.getLogger(__name__)
+
+# ===================================================================
+# STOCK RESERVATIONS
+# ===================================================================
+# Stock is taken with a conditional UPDATE:
+#   UPDATE ... SET stock_quantity = stock_quantity - n
+#   WHERE id = ? AND stock_quantity >= n
+# The check and the decrement are one statement, so two checkouts racing
+# for the last jersey cannot both win and the count never goes negative.
+#
+# These updates deliberately do not bump the catalog cache version: stock
+# shown on catalog pages is advisory and refreshes with the cache timeout,
+# while the reservation itself is what decides whether a sale goes through.
+# They do refresh Product.total_stock for the SKUs involved, once per call.
+
+
+class OutOfStock(Exception):
+    def __init__(self, sku_id):
+        super().__init__(f"SKU {sku_id} does not have enough stock")
+        self.sku_id = sku_id
+
+
+def reservation_expiry():
+    return timezone.now() + timedelta(minutes=settings.STOCK_RESERVATION_MINUTES)
+
+
+def _take_stock(sku_id, quantity):
+    return ProductSKU.objects.filter(
+        pk=sku_id, stock_quantity__gte=quantity
+    ).update(stock_quantity=F('stock_quantity') - quantity)
+
+
+def reserve_stock(user, lines, session_id=''):
+    """
+    Holds stock for every (sku_id, quantity) in `lines`, all or nothing.
+
+    Raises OutOfStock (and holds nothing) if any SKU is short. Expired
+    holds on a short SKU are released and the SKU retried once, so a
+    missed cleanup run never blocks a sale.
+    """
+    wanted = Counter()
+    for sku_id, quantity in lines:
+        wanted[int(sku_id)] += int(quantity)
+
+    with transaction.atomic():
+        # Fixed lock order keeps two multi-SKU checkouts from deadlocking
+        for sku_id in sorted(wanted):
+            if _take_stock(sku_id, wanted[sku_id]):
+                continue
+            release_expired_reservations(StockReservation.objects.filter(sku_id=sku_id))
+            if not _take_stock(sku_id, wanted[sku_id]):
+                raise OutOfStock(sku_id)
+
+        refresh_product_summaries(sku_ids=list(wanted))
+        expires_at = reservation_expiry()
+        return StockReservation.objects.bulk_create([
+            StockReservation(
+                sku_id=sku_id, user=user, quantity=quantity,
+                session_id=session_id, expires_at=expires_at
+            )
+            for sku_id, quantity in sorted(wanted.items())
+        ])
+
+
+def attach_session(reservations, session_id):
+    StockReservation.objects.filter(
+        pk__in=[reservation.pk for reservation in reservations]
+    ).update(session_id=session_id)
+
+
+def release_reservations(reservations):
+    """Returns held stock to its SKUs. Safe to call twice on the same holds."""
+    released = 0
+    with transaction.atomic():
+        for reservation in reservations:
+            # Flip HELD -> RELEASED first; only the caller that wins the flip
+            # gives the stock back.
+            flipped = StockReservation.objects.filter(
+                pk=reservation.pk, status='HELD'
+            ).update(status='RELEASED')
+            if flipped:
+                ProductSKU.objects.filter(pk=reservation.sku_id).update(
+                    stock_quantity=F('stock_quantity') + reservation.quantity
+                )
+                released += 1
+        if released:
+            refresh_product_summaries(sku_ids=[reservation.sku_id for reservation in reservations])
+    return released
+
+
+def release_expired_reservations(queryset=None, now=None):
+    queryset = StockReservation.objects.all() if queryset is None else queryset
+    expired = queryset.filter(status='HELD', expires_at__lte=now or timezone.now())
+    return release_reservations(list(expired))
+
+
+def commit_reservations(session_id):
+    """
+    Marks a paid session's holds as sold. A hold that already expired had
+    its stock put back, so it is taken again; if that stock has been sold
+    meanwhile, the session's order is flagged oversold for staff to sort out.
+    """
+    committed = 0
+    retaken, short = [], []
+    reservations = StockReservation.objects.filter(session_id=session_id).exclude(status='COMMITTED')
+    with transaction.atomic():
+        for reservation in reservations:
+            flipped = StockReservation.objects.filter(
+                pk=reservation.pk, status=reservation.status
+            ).update(status='COMMITTED')
+            if flipped and reservation.status == 'RELEASED':
+                if _take_stock(reservation.sku_id, reservation.quantity):
+                    retaken.append(reservation.sku_id)
+                else:
+                    short.append(reservation.sku_id)
+            committed += flipped
+        if short:
+            logger.warning("Session %s was paid after its hold expired; SKU(s) %s sold out meanwhile",
+                           session_id, ', '.join(map(str, short)))
+            Order.objects.filter(transaction_id=session_id).update(oversold=True)
+        if retaken:
+            refresh_product_summaries(sku_ids=retaken)
+    return committed
@@ -0,0 +1,112 @@
+from decimal import ROUND_FLOOR, Decimal
+
+from django.conf import settings
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.lookups import GreaterThanOrEqual
+
+from .authentication import forget_users
+from .models import LoyaltyEntry, Order, Profile
+
+# ===================================================================
+# LOYALTY POINTS
+# ===================================================================
+# Points live in an append-only ledger (LoyaltyEntry); Profile.points and
+# Profile.tier are a cached summary of it. Nothing here runs while a
+# customer logs in or checks out: the update_loyalty command (run from
+# cron) awards points for paid orders, takes them back for cancelled
+# ones, then refreshes the summaries with one UPDATE for the points and
+# one UPDATE ... CASE for every tier.
+
+TIERS = (('Gold', 2000), ('Silver', 500))  # highest first
+BASE_TIER = 'Bronze'
+
+EARNING_STATUSES = ('PAID', 'SHIPPED')
+
+
+def tier_for(points):
+    for tier, threshold in TIERS:
+        if points >= threshold:
+            return tier
+    return BASE_TIER
+
+
+def tier_expression(points=F('points')):
+    """tier_for() as a CASE expression, for updating every profile in one statement."""
+    return Case(
+        *(When(GreaterThanOrEqual(points, threshold), then=Value(tier)) for tier, threshold in TIERS),
+        default=Value(BASE_TIER),
+    )
+
+
+def order_points(total_amount):
+    """Whole points for an order total (LOYALTY_POINTS_PER_DOLLAR, rounded down)."""
+    points = Decimal(total_amount) * settings.LOYALTY_POINTS_PER_DOLLAR
+    return int(points.to_integral_value(rounding=ROUND_FLOOR))
+
+
+def award_order_points(batch_size=1000):
+    """
+    Adds ORDER entries for paid orders that have none yet and REVERSAL
+    entries for cancelled orders that had earned. Returns the ids of the
+    customers whose balance changed.
+    """
+    touched = set()
+
+    unawarded = (
+        Order.objects.filter(status__in=EARNING_STATUSES)
+        .exclude(loyalty_entries__reason='ORDER')
+        .values_list('id', 'user_id', 'total_amount')
+    )
+    entries = []
+    for order_id, user_id, total_amount in unawarded.iterator(chunk_size=batch_size):
+        entries.append(LoyaltyEntry(user_id=user_id, order_id=order_id, points=order_points(total_amount)))
+        touched.add(user_id)
+    # ignore_conflicts: a run overlapping this one may have awarded the same order
+    LoyaltyEntry.objects.bulk_create(entries, batch_size=batch_size, ignore_conflicts=True)
+
+    reversals = (
+        LoyaltyEntry.objects.filter(reason='ORDER', order__status='CANCELLED')
+        .exclude(order__loyalty_entries__reason='REVERSAL')
+        .values_list('order_id', 'user_id', 'points')
+    )
+    entries = []
+    for order_id, user_id, points in reversals.iterator(chunk_size=batch_size):
+        entries.append(LoyaltyEntry(user_id=user_id, order_id=order_id, points=-points, reason='REVERSAL'))
+        touched.add(user_id)
+    LoyaltyEntry.objects.bulk_create(entries, batch_size=batch_size, ignore_conflicts=True)
+    return touched
+
+
+def refresh_points(user_ids=None):
+    """Sets Profile.points to the ledger balance (never below zero); all profiles when user_ids is None."""
+    balance = (
+        LoyaltyEntry.objects.filter(user=OuterRef('user')).order_by().values('user')
+        .annotate(total=Sum('points')).values('total')
+    )
+    profiles = Profile.objects.all() if user_ids is None else Profile.objects.filter(user_id__in=user_ids)
+    return profiles.update(points=Greatest(
+        Coalesce(Subquery(balance, output_field=IntegerField()), Value(0)), Value(0)
+    ))
+
+
+def refresh_tiers():
+    """One UPDATE ... CASE over every profile whose tier no longer matches its points."""
+    return Profile.objects.exclude(tier=tier_expression()).update(tier=tier_expression())
+
+
+def update_loyalty(full=False, batch_size=1000):
+    touched = award_order_points(batch_size=batch_size)
+    if full:
+        refreshed = refresh_points()
+    else:
+        refreshed = refresh_points(touched) if touched else 0
+    tiers_changed = refresh_tiers()
+    # The updates above skip signals; drop the cached users they changed
+    everyone = Profile.objects.values_list('user_id', flat=True).iterator(chunk_size=batch_size)
+    forget_users(everyone if full else touched, batch_size=batch_size)
+    return {
+        'customers': len(touched),
+        'refreshed': refreshed,
+        'tiers_changed': tiers_changed,
+    }
@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from store.benchmarks import compare_reports, run_benchmarks, write_report
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the store API (catalog, cart, checkout) against a throwaway '
+        'database and writes a JSON latency/query report'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--skus', type=int, default=4, help='SKUs (sizes) per product')
+        parser.add_argument('--users', type=int, default=5)
+        parser.add_argument('--cart-lines', type=int, default=10)
+        parser.add_argument('--iterations', type=int, default=50, help='Requests per scenario')
+        parser.add_argument('--output', default='bench_report.json')
+        parser.add_argument('--compare', help='Earlier report to diff against; exits non-zero on regression')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed p95 slowdown (0.2 = 20%%)')
+
+    def handle(self, *args, **options):
+        self.stdout.write('⏱️ Creating benchmark database...')
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            report = run_benchmarks(
+                products=options['products'], skus_per_product=options['skus'],
+                users=options['users'], cart_lines=options['cart_lines'],
+                iterations=options['iterations'],
+            )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        write_report(report, options['output'])
+        for name, result in report['scenarios'].items():
+            self.stdout.write(
+                f"{name:<34} p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  "
+                f"p99 {result['p99_ms']:>8.2f} ms  {result['queries_per_request']:>6} queries"
+            )
+        serialization = report['serialization']
+        self.stdout.write(
+            f"{'serialize ' + str(serialization['page_size']) + ' products':<34} "
+            f"DRF {serialization['drf_p50_ms']:>8.2f} ms  lean {serialization['lean_p50_ms']:>8.2f} ms  "
+            f"({serialization['speedup']}x)"
+        )
+        search = report['search']
+        self.stdout.write(
+            f"{'search (LIKE vs full-text)':<34} "
+            f"LIKE p95 {search['like_p95_ms']:>8.2f} ms  index p95 {search['fts_p95_ms']:>8.2f} ms  "
+            f"({search['speedup']}x)"
+        )
+        self.stdout.write(self.style.SUCCESS(f"✨ Report written to {options['output']}"))
+
+        if options['compare']:
+            with open(options['compare']) as handle:
+                baseline = json.load(handle)
+            lines, regressed = compare_reports(baseline, report, options['tolerance'])
+            for line in lines:
+                self.stdout.write(line)
+            if regressed:
+                raise CommandError("Benchmark regression against " + options['compare'])
@@ -0,0 +1,31 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from store.exports import DATASETS, FORMATS, export_filename, export_stream
+
+class Command(BaseCommand):
+    help = 'Streams orders, newsletter subscribers or the catalog to a CSV/JSONL file in constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(DATASETS))
+        parser.add_argument('--as', dest='file_format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Compress the file as it is written')
+        parser.add_argument('--since', help='Only rows created on or after this day (YYYY-MM-DD)')
+        parser.add_argument('--output', help='File to write; default: <dataset>-<today>.<format>[.gz]')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError("--since must be a date like 2026-01-31")
+        dataset, file_format, compress = options['dataset'], options['file_format'], options['gzip']
+        path = options['output'] or export_filename(dataset, file_format, compress)
+
+        written = 0
+        with open(path, 'wb') as handle:
+            for chunk in export_stream(dataset, file_format, compress=compress, since=since):
+                handle.write(chunk)
+                written += len(chunk)
+        self.stdout.write(self.style.SUCCESS(f"📦 Exported {dataset} to {path} ({written} bytes)"))
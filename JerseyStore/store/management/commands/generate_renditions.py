@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from store.cache import bump_catalog_version
+from store.images import needs_renditions, renditions_for
+from store.models import ProductSKU, retire_renditions
+from store.summaries import refresh_product_summaries
+
+class Command(BaseCommand):
+    help = (
+        'Builds the card/detail/zoom WebP and JPEG renditions for SKU images that '
+        'lack them (e.g. after import_catalog, which skips the save signal)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild renditions that are already current')
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        skus = (
+            ProductSKU.objects.exclude(image='').exclude(image__isnull=True)
+            .only('pk', 'image', 'image_renditions').order_by('pk')
+        )
+        pending, built, failed = [], 0, 0
+        for sku in skus.iterator(chunk_size=options['batch_size']):
+            if not options['force'] and not needs_renditions(sku):
+                continue
+            old = sku.image_renditions
+            sku.image_renditions = renditions_for(sku)
+            retire_renditions(sku, old)
+            if sku.image_renditions:
+                built += 1
+            else:
+                failed += 1
+            pending.append(sku)
+            if len(pending) >= options['batch_size']:
+                self.save(pending)
+                pending = []
+        if pending:
+            self.save(pending)
+
+        if built:
+            bump_catalog_version()  # bulk_update skips the cache signals
+        if failed:
+            self.stderr.write(f"⚠️ {failed} image(s) could not be read")
+        self.stdout.write(self.style.SUCCESS(f"✅ Built renditions for {built} SKU image(s)"))
+
+    def save(self, skus):
+        ProductSKU.objects.bulk_update(skus, ['image_renditions'])
+        # Products carry their main image's renditions (store/summaries.py)
+        refresh_product_summaries(sku_ids=[sku.pk for sku in skus])
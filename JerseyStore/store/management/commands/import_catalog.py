@@ -0,0 +1,64 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from store.catalog_import import CatalogImport, read_rows
+from store.routers import use_primary
+
+class Command(BaseCommand):
+    help = (
+        'Streams a supplier catalog feed (CSV or JSON lines, one SKU per row) and '
+        'upserts categories, products and SKUs in batches keyed on sku_code'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Feed file, or '-' for stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Defaults to the file extension (.csv, .jsonl/.ndjson)')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Write nothing; print what would be created or changed')
+        parser.add_argument('--diff-limit', type=int, default=50, help='Changes to list in --dry-run')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        if path == '-' and not options['format']:
+            raise CommandError("--format is required when reading from stdin")
+
+        importer = CatalogImport(
+            batch_size=options['batch_size'], dry_run=options['dry_run'], max_changes=options['diff_limit']
+        )
+        started = time.perf_counter()
+
+        def progress(stats):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"  {stats['rows']} rows ({stats['rows'] / elapsed:,.0f} rows/sec)")
+
+        handle = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            # The diff must compare against the primary, not a lagging replica
+            with use_primary():
+                stats = importer.run(
+                    read_rows(handle, fmt), on_batch=progress if options['verbosity'] > 1 else None
+                )
+        finally:
+            if handle is not sys.stdin:
+                handle.close()
+        elapsed = time.perf_counter() - started
+
+        for error in importer.errors:
+            self.stderr.write(f"⚠️ {error}")
+        for change in importer.changes:
+            self.stdout.write(change)
+
+        rate = stats['rows'] / elapsed if elapsed else 0
+        summary = (
+            f"{stats['rows']} rows in {elapsed:.2f}s ({rate:,.0f} rows/sec): "
+            f"{stats['created']} new, {stats['updated']} changed, "
+            f"{stats['unchanged']} unchanged, {stats['skipped']} skipped"
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"🔍 Dry run, nothing written. {summary}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"✨ Catalog import complete! {summary}"))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from store.orders import process_pending_events
+
+class Command(BaseCommand):
+    help = 'Drains stored Stripe webhook events in batches and creates the orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true', help='Keep polling instead of exiting when the queue is empty')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Seconds to wait between polls when idle')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = process_pending_events(options['batch_size'])
+            total += processed
+            if processed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f"✅ Processed {total} payment event(s)"))
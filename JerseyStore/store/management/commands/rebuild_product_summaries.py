@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from store.cache import bump_catalog_version
+from store.models import Product
+from store.summaries import refresh_product_summaries
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes every product\'s min/max price, total stock and main image '
+        'from its SKUs (fixes drift from writes that bypassed the hooks)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Products per UPDATE, to keep each transaction short')
+
+    def handle(self, *args, **options):
+        product_ids = Product.objects.order_by('pk').values_list('pk', flat=True)
+        last_pk, updated = 0, 0
+        while True:
+            batch = list(product_ids.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            updated += refresh_product_summaries(product_ids=batch)
+            last_pk = batch[-1]
+
+        bump_catalog_version()  # update() skips the cache signals
+        self.stdout.write(self.style.SUCCESS(f"✅ Rebuilt summaries for {updated} product(s)"))
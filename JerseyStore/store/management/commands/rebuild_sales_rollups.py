@@ -0,0 +1,24 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from store.analytics import rebuild_rollups
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes the daily sales rollups (DailySales, DailySkuSales) from '
+        'orders; picks up cancellations and anything written before the rollups existed'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='First day to rebuild (YYYY-MM-DD); default: everything')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError("--since must be a date like 2026-01-31")
+        days, rows = rebuild_rollups(since=since, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"📊 Rebuilt sales rollups: {days} day(s), {rows} SKU row(s)"))
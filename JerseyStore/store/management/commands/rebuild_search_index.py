@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from store.cache import bump_catalog_version
+from store.search import rebuild_index
+
+class Command(BaseCommand):
+    help = 'Rebuilds the product full-text search index from the catalog tables'
+
+    def handle(self, *args, **kwargs):
+        indexed = rebuild_index()
+        bump_catalog_version()  # cached search pages and typo candidates
+        self.stdout.write(self.style.SUCCESS(f"🔎 Indexed {indexed} product(s) for search"))
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from store.inventory import release_expired_reservations
+
+class Command(BaseCommand):
+    help = 'Returns stock held by checkout reservations that have expired (run from cron)'
+
+    def handle(self, *args, **kwargs):
+        released = release_expired_reservations()
+        self.stdout.write(self.style.SUCCESS(f"✅ Released {released} expired reservation(s)"))
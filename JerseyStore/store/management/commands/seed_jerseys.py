@@ -1,9 +1,16 @@
 from django.core.management.base import BaseCommand
+from store.cache import bump_catalog_version
 from store.models import Category, Product, ProductSKU
+from store.seeding import seed_synthetic_catalog
 
 class Command(BaseCommand):
     help = 'Seeds and syncs the database with jerseys and image paths'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=0,
+                            help='Also bulk-create this many synthetic jerseys (load testing)')
+        parser.add_argument('--skus', type=int, default=4, help='Sizes per synthetic jersey')
+
     def handle(self, *args, **kwargs):
         self.stdout.write('🏟️ Starting Integrated Jersey Seeding & Sync...')
         
@@ -45,4 +52,11 @@ class Command(BaseCommand):
             
             self.stdout.write(self.style.SUCCESS(f"✅ Synced: {item['name']}"))
 
-        self.stdout.write(self.style.SUCCESS('✨ Database Sync Complete!'))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS('✨ Database Sync Complete!'))
+
+        if kwargs['products']:
+            created = seed_synthetic_catalog(kwargs['products'], kwargs['skus'])
+            bump_catalog_version()  # bulk_create skips the cache signals
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Synthetic catalog: {kwargs['products']} jerseys, {created} SKUs"
+            ))
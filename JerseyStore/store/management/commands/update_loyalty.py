@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from store.loyalty import update_loyalty
+
+class Command(BaseCommand):
+    help = (
+        'Awards loyalty points for paid orders, reverses them for cancelled ones '
+        'and recomputes every tier in one UPDATE (run from cron)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Recompute every balance from the ledger, not just the ones that changed')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        stats = update_loyalty(full=options['full'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"🏆 Loyalty updated: {stats['customers']} customer(s) earned or lost points, "
+            f"{stats['refreshed']} balance(s) refreshed, {stats['tiers_changed']} tier change(s)"
+        ))
@@ -0,0 +1,289 @@
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+# ===================================================================
+# REQUEST METRICS
+# ===================================================================
+# Opt-in (METRICS_ENABLED). The middleware wraps every database connection
+# for the length of a request, so each route gets its request count,
+# latency, number of queries and time spent in the database. A request
+# that runs the same SQL statement METRICS_DUPLICATE_QUERY_THRESHOLD times
+# or more is counted (and logged) as a likely N+1.
+#
+# Works under WSGI and ASGI. Queries are attributed through a context
+# variable, which sync_to_async carries into the threads that run the ORM
+# for async views. A streaming response (CSV exports) is measured until its
+# last chunk is sent or the client goes away, queries made while
+# generating chunks included; its headers leave before those numbers are
+# known, so it gets no Server-Timing header.
+#
+# Numbers live in process memory: every worker keeps its own registry and
+# Prometheus scrapes each one, like any multi-process exporter.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.total += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class RouteStats:
+    def __init__(self):
+        self.statuses = Counter()
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.db_seconds = 0.0
+        self.duplicate_requests = 0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, route, method, status_code, seconds, queries, db_seconds, duplicated):
+        with self.lock:
+            stats = self.routes.get((route, method))
+            if stats is None:
+                stats = self.routes[(route, method)] = RouteStats()
+            stats.statuses[f"{status_code // 100}xx"] += 1
+            stats.latency.observe(seconds)
+            stats.queries.observe(queries)
+            stats.db_seconds += db_seconds
+            if duplicated:
+                stats.duplicate_requests += 1
+
+    def reset(self):
+        with self.lock:
+            self.routes.clear()
+
+    def render(self):
+        """The registry in Prometheus text exposition format (0.0.4)."""
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def histogram(name, labels, hist):
+            for bound, count in zip(hist.buckets, hist.counts):
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {hist.total}')
+            lines.append(f"{name}_sum{{{labels}}} {hist.sum}")
+            lines.append(f"{name}_count{{{labels}}} {hist.total}")
+
+        with self.lock:
+            routes = sorted(self.routes.items())
+
+            family('store_http_requests_total', 'counter', 'Requests by route, method and status class.')
+            for (route, method), stats in routes:
+                for status_class, count in sorted(stats.statuses.items()):
+                    lines.append(
+                        f'store_http_requests_total{{route="{route}",method="{method}",'
+                        f'status="{status_class}"}} {count}'
+                    )
+            family('store_http_request_duration_seconds', 'histogram', 'Request latency by route.')
+            for (route, method), stats in routes:
+                histogram('store_http_request_duration_seconds',
+                          f'route="{route}",method="{method}"', stats.latency)
+            family('store_db_queries_per_request', 'histogram', 'Database queries per request by route.')
+            for (route, method), stats in routes:
+                histogram('store_db_queries_per_request', f'route="{route}",method="{method}"', stats.queries)
+            family('store_db_seconds_total', 'counter', 'Time spent in database calls by route.')
+            for (route, method), stats in routes:
+                lines.append(f'store_db_seconds_total{{route="{route}",method="{method}"}} {stats.db_seconds}')
+            family('store_db_duplicate_query_requests_total', 'counter',
+                   'Requests that repeated one SQL statement past the N+1 threshold.')
+            for (route, method), stats in routes:
+                lines.append(
+                    f'store_db_duplicate_query_requests_total{{route="{route}",method="{method}"}} '
+                    f'{stats.duplicate_requests}'
+                )
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class QueryRecorder:
+    """Counts, times and fingerprints one request's queries."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            # Parameters are passed separately, so `sql` is already the statement's shape
+            self.statements[sql] += 1
+
+    def duplicates(self, threshold):
+        return [(sql, count) for sql, count in self.statements.most_common() if count >= threshold]
+
+
+current_recorder = ContextVar('current_recorder', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    """connection.execute_wrapper handing queries to the current request's recorder, if any."""
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def watch_connections():
+    """Installs record_query on this thread's connections (once each)."""
+    for connection in connections.all():
+        if record_query not in connection.execute_wrappers:
+            connection.execute_wrappers.append(record_query)
+
+
+def route_name(request):
+    """URL pattern name (e.g. product-list) so labels stay bounded whatever the ids."""
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route or 'unnamed'
+
+
+FINISHED = object()
+
+
+class RequestMeasurement:
+    def __init__(self, request):
+        self.request = request
+        self.recorder = QueryRecorder()
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def recording(self):
+        token = current_recorder.set(self.recorder)
+        try:
+            yield
+        finally:
+            current_recorder.reset(token)
+
+    def finish(self, response):
+        """Records a plain response now; a streaming one once its content has been consumed."""
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self.measure_async_stream(response, aiter(response.streaming_content))
+            else:
+                response.streaming_content = self.measure_stream(response, iter(response.streaming_content))
+            return response
+        elapsed = self.record(response)
+        response['Server-Timing'] = (
+            f'db;dur={self.recorder.seconds * 1000:.1f};desc="{self.recorder.count} queries", '
+            f'total;dur={elapsed * 1000:.1f}'
+        )
+        return response
+
+    # The context variable is set around each step only: a generator runs
+    # in whichever context resumes it, so one set/reset can't span a yield.
+    def measure_stream(self, response, chunks):
+        try:
+            while True:
+                with self.recording():
+                    chunk = next(chunks, FINISHED)
+                if chunk is FINISHED:
+                    return
+                yield chunk
+        finally:
+            self.record(response)
+
+    async def measure_async_stream(self, response, chunks):
+        try:
+            while True:
+                with self.recording():
+                    chunk = await anext(chunks, FINISHED)
+                if chunk is FINISHED:
+                    return
+                yield chunk
+        finally:
+            self.record(response)
+
+    def record(self, response):
+        elapsed = time.perf_counter() - self.started
+        request, recorder = self.request, self.recorder
+        route = route_name(request)
+        duplicates = recorder.duplicates(settings.METRICS_DUPLICATE_QUERY_THRESHOLD)
+        if duplicates:
+            sql, count = duplicates[0]
+            logger.warning("Possible N+1 on %s %s: %d queries, %d x %s",
+                           request.method, route, recorder.count, count, sql[:200])
+        registry.record(route, request.method, response.status_code, elapsed,
+                        recorder.count, recorder.seconds, bool(duplicates))
+        return elapsed
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        watch_connections()
+        measurement = RequestMeasurement(request)
+        with measurement.recording():
+            response = self.get_response(request)
+        return measurement.finish(response)
+
+    async def __acall__(self, request):
+        # On the thread this request's sync_to_async calls run on
+        await sync_to_async(watch_connections)()
+        measurement = RequestMeasurement(request)
+        with measurement.recording():
+            response = await self.get_response(request)
+        return measurement.finish(response)
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. 404 unless METRICS_ENABLED; when
+    METRICS_TOKEN is set the scraper must send it as a bearer token.
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if settings.METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {settings.METRICS_TOKEN}":
+        return HttpResponse(status=401)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'team'], name='product_active_team_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'season'], name='product_active_season_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'jersey_type'], name='product_active_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'created_at'], name='product_active_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'name'], name='product_active_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productsku',
+            index=models.Index(fields=['product', 'price'], name='sku_product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productsku',
+            index=models.Index(fields=['product', 'size', 'stock_quantity'], name='sku_product_size_stock_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_product_slug'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productsku',
+            name='image_renditions',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
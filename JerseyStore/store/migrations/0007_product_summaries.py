@@ -0,0 +1,67 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:10
+
+from django.db import migrations, models
+from django.db.models import IntegerField, JSONField, Max, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_summaries(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    ProductSKU = apps.get_model('store', 'ProductSKU')
+    skus = ProductSKU.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    main_image_sku = ProductSKU.objects.filter(
+        product=OuterRef('pk'), image__isnull=False
+    ).exclude(image='').order_by('id')
+    Product.objects.update(
+        min_price=Subquery(skus.annotate(value=Min('price')).values('value')),
+        max_price=Subquery(skus.annotate(value=Max('price')).values('value')),
+        total_stock=Coalesce(
+            Subquery(skus.annotate(value=Sum('stock_quantity')).values('value')), Value(0),
+            output_field=IntegerField(),
+        ),
+        main_image=Coalesce(Subquery(main_image_sku.values('image')[:1]), Value('')),
+        main_image_renditions=Coalesce(
+            Subquery(main_image_sku.values('image_renditions')[:1]), Value({}, JSONField()),
+            output_field=JSONField(),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_productsku_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='main_image',
+            field=models.CharField(blank=True, default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='main_image_renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='max_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='min_price',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='total_stock',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'min_price'], name='product_active_price_idx'),
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:20
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    """Folds duplicate cart lines into the oldest row before the constraint goes on."""
+    CartItem = apps.get_model('store', 'CartItem')
+    keep = {}
+    for item in CartItem.objects.order_by('id'):
+        key = (item.cart_id, item.sku_id, item.custom_name or '', item.custom_number)
+        first = keep.setdefault(key, item)
+        if first is not item:
+            first.quantity += item.quantity
+            first.save(update_fields=['quantity'])
+            item.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_product_summaries'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(models.F('cart'), models.F('sku'), django.db.models.functions.comparison.Coalesce('custom_name', models.Value('')), django.db.models.functions.comparison.Coalesce('custom_number', models.Value(-1)), name='cartitem_unique_line'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:23
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_cartitem_unique_line'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoyaltyEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.IntegerField()),
+                ('reason', models.CharField(choices=[('ORDER', 'Order'), ('REVERSAL', 'Order cancelled'), ('ADJUSTMENT', 'Adjustment')], default='ORDER', max_length=12)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='loyalty_entries', to='store.order')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='loyalty_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'loyalty entries',
+                'indexes': [models.Index(fields=['user', 'created_at'], name='loyalty_user_created_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('order__isnull', False)), fields=('order', 'reason'), name='loyalty_entry_once_per_order')],
+            },
+        ),
+    ]
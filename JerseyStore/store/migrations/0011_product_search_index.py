@@ -0,0 +1,62 @@
+from django.db import migrations
+
+# Raw DDL per backend; store/search.py reads and writes these tables.
+# Other backends get no index and search returns nothing.
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS store_product_fts USING fts5("
+    "name, team, season, description, category, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS store_product_fts_vocab USING fts5vocab(store_product_fts, 'row')",
+]
+SQLITE_DROP = [
+    "DROP TABLE IF EXISTS store_product_fts_vocab",
+    "DROP TABLE IF EXISTS store_product_fts",
+]
+SQLITE_FILL = (
+    "INSERT INTO store_product_fts (rowid, name, team, season, description, category) "
+    "SELECT p.id, p.name, p.team, p.season, p.description, c.name "
+    "FROM store_product p JOIN store_category c ON c.id = p.category_id"
+)
+
+POSTGRES_CREATE = [
+    "CREATE TABLE IF NOT EXISTS store_product_search ("
+    "product_id bigint PRIMARY KEY, "
+    "document tsvector NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS store_product_search_document_idx ON store_product_search USING GIN (document)",
+]
+POSTGRES_DROP = ["DROP TABLE IF EXISTS store_product_search"]
+POSTGRES_FILL = (
+    "INSERT INTO store_product_search (product_id, document) "
+    "SELECT p.id, "
+    "setweight(to_tsvector('simple', p.name), 'A') || setweight(to_tsvector('simple', p.team), 'A') || "
+    "setweight(to_tsvector('simple', c.name), 'B') || setweight(to_tsvector('simple', p.season), 'B') || "
+    "setweight(to_tsvector('simple', p.description), 'C') "
+    "FROM store_product p JOIN store_category c ON c.id = p.category_id"
+)
+
+STATEMENTS = {
+    'sqlite': (SQLITE_CREATE + [SQLITE_FILL], SQLITE_DROP),
+    'postgresql': (POSTGRES_CREATE + [POSTGRES_FILL], POSTGRES_DROP),
+}
+
+
+def create_index(apps, schema_editor):
+    for statement in STATEMENTS.get(schema_editor.connection.vendor, ([], []))[0]:
+        schema_editor.execute(statement)
+
+
+def drop_index(apps, schema_editor):
+    for statement in STATEMENTS.get(schema_editor.connection.vendor, ([], []))[1]:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_payment_event_next_attempt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckoutLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('custom_name', models.CharField(blank=True, max_length=50, null=True)),
+                ('custom_number', models.IntegerField(blank=True, null=True)),
+                ('cart_item', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='store.cartitem')),
+                ('reservation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='store.stockreservation')),
+                ('sku', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='store.productsku')),
+            ],
+        ),
+    ]
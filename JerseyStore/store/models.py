@@ -1,8 +1,15 @@
-from django.db import models
+from decimal import Decimal
+
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
-from django.db.models.signals import post_save
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
+from .cache import bump_catalog_version
+from .images import delete_renditions, needs_renditions, renditions_for
+from .pricing import cart_summary
+
 # ===================================================================
 # 1. USER & PROFILE MODELS
 # ===================================================================
@@ -37,14 +44,47 @@ class Profile(models.Model):
     zip_code = models.CharField(max_length=20, blank=True, default='')
 
     def update_tier(self):
-        if self.points >= 2000: self.tier = 'Gold'
-        elif self.points >= 500: self.tier = 'Silver'
-        else: self.tier = 'Bronze'
-        self.save()
+        # Bulk recomputation lives in store/loyalty.py (update_loyalty command)
+        from .loyalty import tier_for
+        tier = tier_for(self.points)
+        if tier != self.tier:
+            self.tier = tier
+            self.save(update_fields=['tier'])
 
     def __str__(self):
         return f"Profile for {self.user.username}"
 
+class LoyaltyEntry(models.Model):
+    """
+    One change to a customer's points. Profile.points is the sum of their
+    entries, refreshed in bulk by the update_loyalty command.
+    """
+    REASON_CHOICES = (
+        ('ORDER', 'Order'),
+        ('REVERSAL', 'Order cancelled'),
+        ('ADJUSTMENT', 'Adjustment')
+    )
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='loyalty_entries')
+    order = models.ForeignKey('Order', null=True, blank=True, on_delete=models.SET_NULL,
+                              related_name='loyalty_entries')
+    points = models.IntegerField()
+    reason = models.CharField(max_length=12, choices=REASON_CHOICES, default='ORDER')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name_plural = 'loyalty entries'
+        # An order earns once and is reversed at most once, however often the command runs
+        constraints = [
+            models.UniqueConstraint(fields=['order', 'reason'], condition=models.Q(order__isnull=False),
+                                    name='loyalty_entry_once_per_order'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'created_at'], name='loyalty_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.points:+} pts for {self.user_id} ({self.reason})"
+
 # ===================================================================
 # 2. PRODUCT & CATEGORY MODELS
 # ===================================================================
@@ -62,6 +102,8 @@ class Category(models.Model):
 class Product(models.Model):
     category = models.ForeignKey(Category, related_name='products', on_delete=models.CASCADE)
     name = models.CharField(max_length=200)
+    # Natural key for catalog imports (see import_catalog); optional for hand-made products
+    slug = models.SlugField(max_length=220, unique=True, null=True, blank=True)
     team = models.CharField(max_length=100)
     season = models.CharField(max_length=20)
     jersey_type = models.CharField(max_length=20, default='HOME') # HOME, AWAY, THIRD, SPECIAL
@@ -69,6 +111,25 @@ class Product(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Copied from the SKUs so catalog pages never have to aggregate them
+    # (kept current by store/summaries.py)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, editable=False)
+    total_stock = models.PositiveIntegerField(default=0, editable=False)
+    main_image = models.CharField(max_length=100, blank=True, default='', editable=False)
+    main_image_renditions = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        # Every catalog query filters on is_active first (see store/filters.py)
+        indexes = [
+            models.Index(fields=['is_active', 'team'], name='product_active_team_idx'),
+            models.Index(fields=['is_active', 'season'], name='product_active_season_idx'),
+            models.Index(fields=['is_active', 'jersey_type'], name='product_active_type_idx'),
+            models.Index(fields=['is_active', 'created_at'], name='product_active_created_idx'),
+            models.Index(fields=['is_active', 'name'], name='product_active_name_idx'),
+            models.Index(fields=['is_active', 'min_price'], name='product_active_price_idx'),
+        ]
+
     def __str__(self): 
         return f"{self.team} {self.name} ({self.season})"
 
@@ -81,6 +142,15 @@ class ProductSKU(models.Model):
     custom_printing_cost = models.DecimalField(max_digits=5, decimal_places=2, default=15.00)
     stock_quantity = models.PositiveIntegerField(default=0)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
+    # Resized WebP/JPEG copies of `image`, filled in by store/images.py
+    image_renditions = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        # Price/size/stock filters run as EXISTS subqueries keyed on product
+        indexes = [
+            models.Index(fields=['product', 'price'], name='sku_product_price_idx'),
+            models.Index(fields=['product', 'size', 'stock_quantity'], name='sku_product_size_stock_idx'),
+        ]
 
     def __str__(self): 
         return f"{self.product.team} - {self.size}"
@@ -94,7 +164,12 @@ class Cart(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     def get_total_price(self):
-        return sum(item.get_total_item_price() for item in self.items.all())
+        # Lines prefetched through pricing.priced_items_prefetch() already carry
+        # their totals; otherwise let the database add the cart up.
+        items = getattr(self, '_prefetched_objects_cache', {}).get('items')
+        if items is not None and all(hasattr(item, 'line_total') for item in items):
+            return sum((item.line_total for item in items), Decimal('0.00'))
+        return cart_summary(self)['total']
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
@@ -104,7 +179,20 @@ class CartItem(models.Model):
     custom_name = models.CharField(max_length=50, blank=True, null=True)
     custom_number = models.IntegerField(blank=True, null=True)
 
+    class Meta:
+        # One row per line, so adds can increment in place (see OrmCartStore.add).
+        # A blank name and NULL are the same line, as are no number and NULL.
+        constraints = [
+            models.UniqueConstraint(
+                'cart', 'sku', Coalesce('custom_name', models.Value('')),
+                Coalesce('custom_number', models.Value(-1)),
+                name='cartitem_unique_line',
+            ),
+        ]
+
     def get_total_item_price(self):
+        if hasattr(self, 'line_total'):
+            return self.line_total
         base_price = self.sku.price * self.quantity
         # Add printing cost only if customization exists
         if self.custom_name or self.custom_number:
@@ -130,6 +218,16 @@ class Order(models.Model):
     transaction_id = models.CharField(max_length=255, unique=True, null=True, blank=True)
     voucher_used = models.CharField(max_length=20, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Paid after its stock hold expired and the stock was gone by then
+    # (see inventory.commit_reservations): needs a refund or a restock
+    oversold = models.BooleanField(default=False)
+
+    class Meta:
+        # Admin date hierarchy and newest-first lists, with or without a status filter
+        indexes = [
+            models.Index(fields=['created_at'], name='order_created_idx'),
+            models.Index(fields=['status', 'created_at'], name='order_status_created_idx'),
+        ]
 
     def __str__(self):
         return f"Order {self.id} by {self.user.username}"
@@ -149,6 +247,81 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.product_name} x {self.quantity}"
 
+
+class StockReservation(models.Model):
+    """
+    Stock held for a checkout. The SKU's stock_quantity is decremented when
+    the hold is taken, so HELD rows are already out of the sellable count;
+    COMMITTED keeps them out, RELEASED puts them back (see store/inventory.py).
+    """
+    STATUS_CHOICES = (
+        ('HELD', 'Held'),
+        ('COMMITTED', 'Committed'),
+        ('RELEASED', 'Released')
+    )
+    sku = models.ForeignKey(ProductSKU, related_name='reservations', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stock_reservations')
+    quantity = models.PositiveIntegerField()
+    # Stripe checkout session id once the session exists
+    session_id = models.CharField(max_length=255, blank=True, default='', db_index=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='HELD')
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='reservation_expiry_idx'),
+            models.Index(fields=['sku', 'status', 'expires_at'], name='reservation_sku_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.sku_id} ({self.status})"
+
+
+class CheckoutLine(models.Model):
+    """
+    A line as it was priced when its checkout session was created. The
+    order is built from these, so cart edits made while the customer is on
+    the payment page neither join the order nor change what it charged.
+    """
+    reservation = models.ForeignKey(StockReservation, related_name='lines', on_delete=models.CASCADE)
+    # The cart line it came from (none for an instant buy). Unconstrained so
+    # emptying a cart stays a plain DELETE; a dangling id matches nothing.
+    cart_item = models.ForeignKey(CartItem, null=True, blank=True, on_delete=models.DO_NOTHING,
+                                  db_constraint=False, related_name='+')
+    sku = models.ForeignKey(ProductSKU, on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    custom_name = models.CharField(max_length=50, blank=True, null=True)
+    custom_number = models.IntegerField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.sku_id} @ {self.unit_price}"
+
+
+class PaymentEvent(models.Model):
+    """
+    A Stripe webhook event exactly as received. The webhook endpoint only
+    stores it; the process_payment_events command does the work.
+    """
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    # A failed event is not picked up again before this (exponential backoff)
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['processed_at', 'received_at'], name='payment_event_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} ({self.event_id})"
+
         
 class Newsletter(models.Model):
     email = models.EmailField(unique=True)
@@ -158,7 +331,44 @@ class Newsletter(models.Model):
         return self.email
 
 # ===================================================================
-# 4. SIGNALS (Auto-creation of Profile)
+# 4. SALES ROLLUPS (see store/analytics.py)
+# ===================================================================
+
+class DailySales(models.Model):
+    """Paid orders and revenue (order totals, shipping included) for one day."""
+    day = models.DateField(unique=True)
+    orders = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'daily sales'
+
+    def __str__(self):
+        return f"{self.day}: {self.orders} orders, {self.revenue}"
+
+class DailySkuSales(models.Model):
+    """Units and line revenue for one SKU on one day; team and size are copied for grouping."""
+    day = models.DateField()
+    sku = models.ForeignKey(ProductSKU, null=True, on_delete=models.SET_NULL, related_name='daily_sales')
+    team = models.CharField(max_length=100, blank=True, default='')
+    size = models.CharField(max_length=10, blank=True, default='')
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name_plural = 'daily SKU sales'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'sku'], name='daily_sku_sales_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['day', 'team'], name='daily_sku_sales_team_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day}: {self.units} x {self.sku_id}"
+
+# ===================================================================
+# 5. SIGNALS (Auto-creation of Profile)
 # ===================================================================
 
 @receiver(post_save, sender=User)
@@ -167,5 +377,78 @@ def create_profile(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_profile(sender, instance, **kwargs):
-    instance.profile.save()
\ No newline at end of file
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def forget_authenticated_user(sender, instance, **kwargs):
+    # Cached by CachedJWTAuthentication; dropped again on commit so a
+    # request that re-cached the pre-commit row doesn't keep it.
+    from .authentication import forget_users
+    user_id = instance.pk if sender is User else instance.user_id
+    forget_users([user_id])
+    transaction.on_commit(lambda: forget_users([user_id]))
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductSKU)
+@receiver(post_delete, sender=ProductSKU)
+def invalidate_catalog_cache(sender, **kwargs):
+    # Bump now so this process stops serving the old pages, and again on
+    # commit so a page rebuilt from pre-commit rows is never kept.
+    # Note: queryset.update()/bulk_create() skip signals; call
+    # bump_catalog_version() yourself after those.
+    bump_catalog_version()
+    transaction.on_commit(bump_catalog_version)
+
+def retire_renditions(sku, old):
+    """
+    Deletes the files of `old`, the SKU's previous image_renditions, once
+    the transaction commits. Kept while any other SKU still shows the same
+    image, since its renditions are the same files.
+    """
+    source = (old or {}).get('source')
+    if not source or source == (sku.image_renditions or {}).get('source'):
+        return
+    if ProductSKU.objects.filter(image=source).exclude(pk=sku.pk).exists():
+        return
+    transaction.on_commit(lambda: delete_renditions(old))
+
+@receiver(post_save, sender=ProductSKU)
+def build_image_renditions(sender, instance, raw=False, **kwargs):
+    # Resize once when the image changes, not on every catalog request.
+    # Saved with update() so the SKU's signals don't fire a second time.
+    if raw or not needs_renditions(instance):
+        return
+    old = instance.image_renditions
+    instance.image_renditions = renditions_for(instance)
+    ProductSKU.objects.filter(pk=instance.pk).update(image_renditions=instance.image_renditions)
+    retire_renditions(instance, old)
+    bump_catalog_version()
+
+@receiver(post_save, sender=ProductSKU)
+@receiver(post_delete, sender=ProductSKU)
+def refresh_product_summary(sender, instance, raw=False, **kwargs):
+    # Registered after build_image_renditions so the new renditions are copied too
+    if raw:
+        return
+    from .summaries import refresh_product_summaries
+    refresh_product_summaries(product_ids=[instance.product_id])
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    # Bulk writers skip this and call search.index_products() themselves
+    if raw:
+        return
+    from .search import index_products
+    index_products([instance.pk])
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created=False, raw=False, **kwargs):
+    # The category name is part of every one of its products' documents
+    if raw or created:
+        return
+    from .search import index_products
+    index_products(instance.products.values_list('pk', flat=True))
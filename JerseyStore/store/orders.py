@@ -0,0 +1,165 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .analytics import record_order
+from .carts import get_cart_store
+from .inventory import commit_reservations, release_reservations
+from .models import (
+    CartItem, CheckoutLine, Order, OrderItem, PaymentEvent, ProductSKU, StockReservation, User,
+)
+from .pricing import priced_items
+
+# ===================================================================
+# ORDER CONVERSION
+# ===================================================================
+# A paid checkout session becomes an Order exactly once. The Stripe
+# session id is stored in Order.transaction_id (unique), which is the
+# idempotency key: retries and duplicate deliveries find the existing
+# order with one indexed lookup and change nothing.
+
+
+def create_order_from_session(session_id, amount_total, metadata, user):
+    """
+    Converts a paid checkout session into an Order with its OrderItems.
+
+    `amount_total` is in cents and `metadata` is what create-checkout-session
+    attached to the session. Returns (order, created). Callers must make
+    sure the session is `user`'s (metadata user_id); only that user's
+    order and checkout lines are ever looked at here.
+    """
+    existing = Order.objects.filter(transaction_id=session_id, user=user).first()
+    if existing:
+        return existing, False
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(
+                    user=user,
+                    total_amount=Decimal(amount_total) / 100,
+                    status='PAID',
+                    transaction_id=session_id,
+                )
+        except IntegrityError:
+            # A concurrent delivery of the same session got there first
+            return Order.objects.get(transaction_id=session_id, user=user), False
+
+        paid = list(CheckoutLine.objects.filter(reservation__session_id=session_id, reservation__user=user)
+                    .select_related('sku__product').order_by('id'))
+        if paid:
+            # Exactly what the session was priced with
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order, sku=line.sku, product_name=line.sku.product.name,
+                    price_at_purchase=line.unit_price, quantity=line.quantity,
+                    custom_name=line.custom_name, custom_number=line.custom_number,
+                )
+                for line in paid
+            ])
+            if metadata.get('is_instant') != 'true':
+                take_off_cart(user, paid)
+            sold = [(line.sku, line.quantity, line.unit_price * line.quantity) for line in paid]
+        elif metadata.get('is_instant') == 'true':
+            # Sessions created before checkout lines were recorded
+            sku = ProductSKU.objects.select_related('product').get(pk=metadata.get('sku_id'))
+            item = OrderItem.objects.create(
+                order=order, sku=sku, product_name=sku.product.name,
+                price_at_purchase=sku.price, quantity=int(metadata.get('qty', 1)),
+            )
+            sold = [(sku, item.quantity, sku.price * item.quantity)]
+        else:
+            # Sessions created before checkout lines were recorded: the cart as it is now
+            cart_items = list(priced_items(
+                CartItem.objects.filter(cart_id=metadata.get('cart_id'), cart__user=user)
+            ).select_related('sku__product'))
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order, sku=item.sku, product_name=item.sku.product.name,
+                    price_at_purchase=item.unit_price, quantity=item.quantity,
+                    custom_name=item.custom_name, custom_number=item.custom_number,
+                )
+                for item in cart_items
+            ])
+            CartItem.objects.filter(pk__in=[item.pk for item in cart_items]).delete()
+            transaction.on_commit(lambda: get_cart_store(user).discard_sold(cart_items))
+            sold = [(item.sku, item.quantity, item.line_total) for item in cart_items]
+
+        record_order(order, sold)
+        commit_reservations(session_id)
+    return order, True
+
+
+def take_off_cart(user, paid):
+    """
+    Takes the bought quantities off the cart lines they came from. Lines
+    added, or quantities raised, after checkout stay in the cart.
+    """
+    bought = {line.cart_item_id: line.quantity for line in paid if line.cart_item_id}
+    if bought:
+        lines = CartItem.objects.filter(pk__in=bought)
+        lines.update(quantity=Greatest(
+            F('quantity') - Case(*[When(pk=pk, then=Value(quantity)) for pk, quantity in bought.items()]),
+            Value(0),
+        ))
+        lines.filter(quantity=0).delete()
+    transaction.on_commit(lambda: get_cart_store(user).discard_sold(paid))
+
+
+# ===================================================================
+# STRIPE WEBHOOK EVENTS
+# ===================================================================
+# The webhook endpoint stores events and returns; process_payment_events
+# drains the table in batches. Handlers are idempotent, so an event that
+# is delivered twice, or retried after a crash, is harmless.
+
+PAID_SESSION_EVENTS = ('checkout.session.completed', 'checkout.session.async_payment_succeeded')
+
+
+def handle_payment_event(payload):
+    session = payload['data']['object']
+    if payload['type'] in PAID_SESSION_EVENTS:
+        if session.get('payment_status') != 'paid':
+            return  # async payment methods follow up with async_payment_succeeded
+        metadata = session.get('metadata') or {}
+        user = User.objects.get(pk=metadata.get('user_id'))
+        create_order_from_session(session['id'], session['amount_total'], metadata, user)
+    elif payload['type'] == 'checkout.session.expired':
+        release_reservations(StockReservation.objects.filter(session_id=session['id']))
+
+
+def process_pending_events(batch_size=100):
+    """
+    Processes one batch of due events, oldest first. Returns how many were
+    attempted. A failed event waits PAYMENT_EVENT_RETRY_BACKOFF seconds,
+    doubling with each attempt, before it is tried again, until
+    PAYMENT_EVENT_MAX_ATTEMPTS is reached.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        # skip_locked lets several workers drain the table side by side on PostgreSQL
+        batch = list(
+            PaymentEvent.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True, attempts__lt=settings.PAYMENT_EVENT_MAX_ATTEMPTS)
+            .filter(Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now))
+            .order_by('received_at', 'id')[:batch_size]
+        )
+        for event in batch:
+            event.attempts += 1
+            try:
+                with transaction.atomic():
+                    handle_payment_event(event.payload)
+                event.processed_at = timezone.now()
+                event.next_attempt_at = None
+                event.last_error = ''
+            except Exception as e:
+                event.last_error = f"{type(e).__name__}: {e}"
+                backoff = settings.PAYMENT_EVENT_RETRY_BACKOFF * (2 ** (event.attempts - 1))
+                event.next_attempt_at = now + timedelta(seconds=backoff)
+        PaymentEvent.objects.bulk_update(batch, ['attempts', 'processed_at', 'next_attempt_at', 'last_error'])
+    return len(batch)
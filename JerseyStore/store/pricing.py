@@ -0,0 +1,50 @@
+from decimal import Decimal
+
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, Prefetch, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+# ===================================================================
+# CART PRICING
+# ===================================================================
+# Line and cart totals are computed by the database so pricing a cart is
+# one query however many lines it has. The rules mirror
+# CartItem.get_total_item_price(), which remains the reference:
+#   line = quantity * (sku.price + sku.custom_printing_cost if printed)
+# and a line counts as printed when custom_name or custom_number is truthy.
+
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+HAS_CUSTOM_PRINTING = Q(custom_name__gt='') | (Q(custom_number__isnull=False) & ~Q(custom_number=0))
+
+
+def unit_price_expression():
+    return Case(
+        When(HAS_CUSTOM_PRINTING, then=F('sku__price') + F('sku__custom_printing_cost')),
+        default=F('sku__price'),
+        output_field=MONEY,
+    )
+
+
+def line_total_expression():
+    return ExpressionWrapper(unit_price_expression() * F('quantity'), output_field=MONEY)
+
+
+def priced_items(queryset):
+    """CartItems with their SKU joined and `unit_price`/`line_total` annotated."""
+    return queryset.select_related('sku').annotate(
+        unit_price=unit_price_expression(),
+        line_total=line_total_expression(),
+    )
+
+
+def priced_items_prefetch(queryset):
+    """Prefetch for Cart.items that carries `line_total` on every line."""
+    return Prefetch('items', queryset=priced_items(queryset.order_by('id')))
+
+
+def cart_summary(cart):
+    """Line count and grand total for a cart in a single aggregate query."""
+    return cart.items.aggregate(
+        line_count=Count('id'),
+        total=Coalesce(Sum(line_total_expression()), Value(Decimal('0.00')), output_field=MONEY),
+    )
@@ -0,0 +1,145 @@
+import asyncio
+import random
+import uuid
+import weakref
+from urllib.parse import quote, urlencode
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import httpx
+except ImportError:  # only the async payment views need it
+    httpx = None
+
+# ===================================================================
+# POOLED ASYNC HTTP CLIENT
+# ===================================================================
+# One httpx.AsyncClient per event loop (in practice one per ASGI worker)
+# keeps TCP/TLS connections to Stripe and eSewa open between requests, so
+# hundreds of in-flight payment calls share a bounded connection pool
+# instead of each opening its own.
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_clients = weakref.WeakKeyDictionary()
+
+
+class ProviderError(Exception):
+    def __init__(self, message, status_code=None, body=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+
+
+def get_http_client():
+    if httpx is None:
+        raise ImproperlyConfigured("The async payment views need httpx: pip install httpx")
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.PAYMENT_HTTP_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=settings.PAYMENT_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.PAYMENT_HTTP_MAX_CONNECTIONS,
+            ),
+        )
+        _clients[loop] = client
+    return client
+
+
+async def request_with_retry(method, url, **kwargs):
+    """
+    Sends a request through the shared client, retrying network errors and
+    429/5xx answers with exponential backoff and jitter.
+
+    Only use this for requests that are safe to repeat (GETs, or POSTs that
+    carry an idempotency key).
+    """
+    client = get_http_client()
+    attempts = settings.PAYMENT_HTTP_RETRIES + 1
+    for attempt in range(attempts):
+        last_attempt = attempt == attempts - 1
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            if last_attempt:
+                raise ProviderError(f"{method} {url} failed: {e}")
+        else:
+            if response.status_code not in RETRY_STATUSES or last_attempt:
+                return response
+        delay = settings.PAYMENT_HTTP_BACKOFF * (2 ** attempt)
+        await asyncio.sleep(delay + random.uniform(0, delay))
+
+
+def json_body(response, provider):
+    """The decoded JSON answer; a proxy's HTML error page is a ProviderError too."""
+    try:
+        return response.json()
+    except ValueError:
+        raise ProviderError(f"{provider} sent a non-JSON answer", response.status_code, response.text)
+
+
+# ===================================================================
+# STRIPE
+# ===================================================================
+
+def stripe_form_encode(params, prefix=''):
+    """Flattens nested params the way Stripe's API expects: line_items[0][quantity]=1."""
+    pairs = []
+    items = params.items() if isinstance(params, dict) else enumerate(params)
+    for key, value in items:
+        name = f"{prefix}[{key}]" if prefix else str(key)
+        if isinstance(value, (dict, list, tuple)):
+            pairs.extend(stripe_form_encode(value, name))
+        elif isinstance(value, bool):
+            pairs.append((name, 'true' if value else 'false'))
+        elif value is not None:
+            pairs.append((name, str(value)))
+    return pairs
+
+
+async def stripe_request(method, path, params=None):
+    headers = {'Authorization': f"Bearer {settings.STRIPE_SECRET_KEY}"}
+    url = f"{settings.STRIPE_API_BASE}{path}"
+    if method == 'POST':
+        # The key lets Stripe recognise our retries of the same POST
+        headers['Idempotency-Key'] = str(uuid.uuid4())
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        content = urlencode(stripe_form_encode(params or {}))
+        response = await request_with_retry(method, url, content=content, headers=headers)
+    else:
+        response = await request_with_retry(method, url, params=params, headers=headers)
+
+    body = json_body(response, 'Stripe')
+    if response.status_code >= 400:
+        error = body.get('error') if isinstance(body, dict) else None
+        message = (error or {}).get('message', 'Stripe request failed')
+        raise ProviderError(message, response.status_code, body)
+    return body
+
+
+async def create_checkout_session(params):
+    return await stripe_request('POST', '/v1/checkout/sessions', params)
+
+
+async def retrieve_checkout_session(session_id):
+    # The id comes from the client, so it must stay a single path segment
+    return await stripe_request('GET', f"/v1/checkout/sessions/{quote(session_id, safe='')}")
+
+
+# ===================================================================
+# ESEWA
+# ===================================================================
+
+async def esewa_transaction_status(transaction_uuid, total_amount):
+    """eSewa's status check; `status` is COMPLETE once the payment went through."""
+    response = await request_with_retry('GET', settings.ESEWA_STATUS_URL, params={
+        'product_code': settings.ESEWA_PRODUCT_CODE,
+        'total_amount': str(total_amount),
+        'transaction_uuid': transaction_uuid,
+    })
+    if response.status_code >= 400:
+        raise ProviderError("eSewa status check failed", response.status_code, response.text)
+    return json_body(response, 'eSewa')
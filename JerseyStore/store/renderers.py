@@ -0,0 +1,33 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional: plain DRF rendering without it
+    orjson = None
+
+# ===================================================================
+# FAST JSON RENDERING
+# ===================================================================
+# Same bytes as DRF's JSONRenderer (compact, UTF-8, Decimals as numbers,
+# ISO datetimes with a trailing Z), encoded by orjson when it is installed.
+# Anything orjson does not know natively (Decimal, datetime, lazy strings)
+# is handed to DRF's own encoder, so both paths agree value for value.
+# Without orjson, or when a client asks for indented output, this is
+# exactly JSONRenderer.
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data,
+            default=JSONEncoder().default,
+            option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+        )
+        # JSONRenderer escapes these so the output is also valid JavaScript
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -0,0 +1,124 @@
+from decimal import Decimal
+
+from django.core.files.storage import default_storage
+from django.db.models import F
+
+from .images import rendition_urls
+from .models import ProductSKU
+from .pricing import priced_items
+
+# ===================================================================
+# LEAN READ REPRESENTATIONS
+# ===================================================================
+# The catalog and cart payloads built straight from .values() rows.
+# They must stay byte-for-byte what ProductSerializer and CartSerializer
+# return (the React app reads both), which the tests check; the
+# serializers remain the reference and still handle every write.
+
+PRODUCT_FIELDS = (
+    'id', 'name', 'team', 'season', 'jersey_type', 'description', 'created_at',
+    'min_price', 'max_price', 'total_stock', 'main_image', 'main_image_renditions',
+)
+
+SKU_FIELDS = ('id', 'sku_code', 'size', 'price', 'custom_printing_cost', 'stock_quantity', 'image')
+
+
+def decimal_string(value):
+    """DecimalField output for a 2-place money column: '90.00', or None."""
+    return None if value is None else f"{value.quantize(Decimal('0.01')):f}"
+
+
+def file_url(name, request=None):
+    """FileField/ImageField output for a stored file name."""
+    if not name:
+        return None
+    url = default_storage.url(name)
+    return request.build_absolute_uri(url) if request else url
+
+
+def product_rows(queryset):
+    """Product queryset -> dict rows with just the columns the payload needs."""
+    # created_at is carried for cursor pagination and dropped from the output
+    return queryset.values(*PRODUCT_FIELDS, category_name=F('category__name'))
+
+
+def represent_sku(row, request=None):
+    return {
+        'id': row['id'],
+        'sku_code': row['sku_code'],
+        'size': row['size'],
+        'price': decimal_string(row['price']),
+        'custom_printing_cost': decimal_string(row['custom_printing_cost']),
+        'stock_quantity': row['stock_quantity'],
+        'image': file_url(row['image'], request),
+    }
+
+
+def represent_products(rows, request=None):
+    """ProductSerializer output for product_rows(), with every SKU fetched in one query."""
+    rows = list(rows)
+    skus = {row['id']: [] for row in rows}
+    for sku in ProductSKU.objects.filter(product_id__in=skus).order_by('id').values('product_id', *SKU_FIELDS):
+        skus[sku['product_id']].append(represent_sku(sku, request))
+    return [
+        {
+            'id': row['id'],
+            'name': row['name'],
+            'team': row['team'],
+            'season': row['season'],
+            'jersey_type': row['jersey_type'],
+            'description': row['description'],
+            'category_name': row['category_name'],
+            'skus': skus[row['id']],
+            'main_image': file_url(row['main_image'], request),
+            'image_renditions': rendition_urls(row['main_image_renditions'], request),
+            'min_price': decimal_string(row['min_price']),
+            'max_price': decimal_string(row['max_price']),
+            'total_stock': row['total_stock'],
+        }
+        for row in rows
+    ]
+
+
+def represent_cart_item(line, sku, request=None):
+    return {
+        'id': line['id'],
+        'sku': represent_sku(sku, request),
+        'quantity': line['quantity'],
+        'custom_name': line['custom_name'],
+        'custom_number': line['custom_number'],
+        'total_item_price': line['line_total'],
+    }
+
+
+def cart_payload(cart_id, items):
+    return {
+        'id': cart_id,
+        'items': items,
+        'total_price': sum((item['total_item_price'] for item in items), Decimal('0.00')),
+    }
+
+
+def represent_cart(cart, request=None):
+    """CartSerializer output for an ORM cart, its lines priced and read in one query."""
+    lines = priced_items(cart.items.order_by('id')).values(
+        'id', 'quantity', 'custom_name', 'custom_number', 'line_total',
+        *(f"sku__{field}" for field in SKU_FIELDS),
+    )
+    return cart_payload(cart.id, [
+        represent_cart_item(line, {field: line[f"sku__{field}"] for field in SKU_FIELDS}, request)
+        for line in lines
+    ])
+
+
+def represent_cart_items(cart_id, items, request=None):
+    """CartSerializer output for unsaved CartItems (the cache cart store), SKUs already loaded."""
+    return cart_payload(cart_id, [
+        represent_cart_item(
+            {'id': item.id, 'quantity': item.quantity, 'custom_name': item.custom_name,
+             'custom_number': item.custom_number, 'line_total': item.get_total_item_price()},
+            {field: getattr(item.sku, field) for field in SKU_FIELDS} | {'image': item.sku.image.name},
+            request,
+        )
+        for item in items
+    ])
@@ -0,0 +1,80 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# ===================================================================
+# PRIMARY / REPLICA ROUTING
+# ===================================================================
+# With a `replica` alias configured (REPLICA_DATABASE_URL), reads of the
+# catalog models go to the replica; everything else, and every write,
+# goes to the primary. Without one this router changes nothing.
+#
+# Catalog reads stay on the primary when they must see the latest writes:
+#   - inside a transaction on the primary (orders, reservations, imports)
+#   - inside use_primary() (cart, order and payment views pin themselves;
+#     the product API pins its writes, whose get_object() must not read a
+#     lagging replica)
+
+REPLICA_ALIAS = 'replica'
+
+CATALOG_MODELS = {'store.category', 'store.product', 'store.productsku'}
+
+_pinned = ContextVar('store_pinned_to_primary', default=False)
+
+
+@contextmanager
+def use_primary():
+    """Sends every read in the block to the primary, replica or not."""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class PrimaryDatabaseMixin:
+    """For views that write, or must read what was just written."""
+
+    def dispatch(self, request, *args, **kwargs):
+        with use_primary():
+            return super().dispatch(request, *args, **kwargs)
+
+
+class PrimaryForWritesMixin:
+    """For read-mostly views: reads may use the replica, writes and their lookups may not."""
+
+    read_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in self.read_methods:
+            return super().dispatch(request, *args, **kwargs)
+        with use_primary():
+            return super().dispatch(request, *args, **kwargs)
+
+
+def replica_available():
+    return REPLICA_ALIAS in connections.settings
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (
+            model._meta.label_lower in CATALOG_MODELS
+            and replica_available()
+            and not _pinned.get()
+            and not connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary through replication
+        return db != REPLICA_ALIAS
@@ -0,0 +1,269 @@
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router
+
+from .cache import get_catalog_version
+from .models import Product
+
+# ===================================================================
+# PRODUCT SEARCH INDEX
+# ===================================================================
+# A full-text index over each product's name, team, season, description
+# and category name, kept beside the catalog tables (created by
+# migration 0011):
+#
+#   SQLite      store_product_fts, an FTS5 table keyed by product id,
+#               ranked with bm25(); store_product_fts_vocab lists its terms
+#   PostgreSQL  store_product_search (product_id, document tsvector) with
+#               a GIN index, ranked with ts_rank_cd()
+#
+# Every product is indexed, active or not (the admin searches them all);
+# storefront queries join back to filter is_active. Product and Category
+# signals re-index single rows; bulk writers (catalog import, synthetic
+# seeding) call index_products() themselves, and rebuild_search_index
+# rebuilds it all.
+#
+# Queries match every word as a prefix, so "arg ho" finds "Argentina
+# Home". If nothing matches, words the index doesn't know are
+# swapped for the closest indexed term within one or two edits
+# ("argentnia" -> "argentina") and the query is retried. Candidates are
+# narrowed in the database to terms with the same first letter and a
+# similar length, so a typo in the first letter isn't corrected.
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+MAX_TOKENS = 8
+
+
+def tokenize(query):
+    return [token.lower() for token in TOKEN_PATTERN.findall(query or '')][:MAX_TOKENS]
+
+
+class SqliteSearchBackend:
+    # name, team, season, description, category
+    WEIGHTS = '10.0, 8.0, 3.0, 1.0, 4.0'
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def index(self, product_ids):
+        ids = list(product_ids)
+        with self.connection.cursor() as cursor:
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(f"DELETE FROM store_product_fts WHERE rowid IN ({placeholders})", ids)
+            cursor.execute(
+                "INSERT INTO store_product_fts (rowid, name, team, season, description, category) "
+                "SELECT p.id, p.name, p.team, p.season, p.description, c.name "
+                "FROM store_product p JOIN store_category c ON c.id = p.category_id "
+                f"WHERE p.id IN ({placeholders})",
+                ids,
+            )
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("DELETE FROM store_product_fts")
+            cursor.execute(
+                "INSERT INTO store_product_fts (rowid, name, team, season, description, category) "
+                "SELECT p.id, p.name, p.team, p.season, p.description, c.name "
+                "FROM store_product p JOIN store_category c ON c.id = p.category_id"
+            )
+            cursor.execute("INSERT INTO store_product_fts (store_product_fts) VALUES ('optimize')")
+            cursor.execute("SELECT COUNT(*) FROM store_product_fts")
+            return cursor.fetchone()[0]
+
+    def match(self, tokens, limit, active_only=True):
+        # Quoted so FTS5 syntax in the input is inert
+        terms = [f'"{token}"*' for token in tokens]
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT p.id FROM store_product_fts JOIN store_product p ON p.id = store_product_fts.rowid "
+                f"WHERE store_product_fts MATCH %s {'AND p.is_active' if active_only else ''} "
+                f"ORDER BY bm25(store_product_fts, {self.WEIGHTS}), p.id LIMIT %s",
+                [' '.join(terms), limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def has_prefix(self, token):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM store_product_fts_vocab WHERE term >= %s AND term < %s LIMIT 1",
+                [token, successor(token)],
+            )
+            return cursor.fetchone() is not None
+
+    def terms_near(self, first, shortest, longest, limit):
+        # fts5vocab turns the term range into a seek, not a full scan
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT term FROM store_product_fts_vocab WHERE term >= %s AND term < %s "
+                "AND length(term) BETWEEN %s AND %s AND term NOT GLOB '*[0-9]*' ORDER BY term LIMIT %s",
+                [first, successor(first), shortest, longest, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend:
+    DOCUMENT = (
+        "setweight(to_tsvector('simple', p.name), 'A') || "
+        "setweight(to_tsvector('simple', p.team), 'A') || "
+        "setweight(to_tsvector('simple', c.name), 'B') || "
+        "setweight(to_tsvector('simple', p.season), 'B') || "
+        "setweight(to_tsvector('simple', p.description), 'C')"
+    )
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def index(self, product_ids):
+        ids = list(product_ids)
+        with self.connection.cursor() as cursor:
+            cursor.execute("DELETE FROM store_product_search WHERE product_id = ANY(%s)", [ids])
+            cursor.execute(
+                "INSERT INTO store_product_search (product_id, document) "
+                f"SELECT p.id, {self.DOCUMENT} FROM store_product p "
+                "JOIN store_category c ON c.id = p.category_id WHERE p.id = ANY(%s)",
+                [ids],
+            )
+
+    def rebuild(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("TRUNCATE store_product_search")
+            cursor.execute(
+                "INSERT INTO store_product_search (product_id, document) "
+                f"SELECT p.id, {self.DOCUMENT} FROM store_product p JOIN store_category c ON c.id = p.category_id"
+            )
+            return cursor.rowcount
+
+    def match(self, tokens, limit, active_only=True):
+        query = ' & '.join(f"{token}:*" for token in tokens)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT p.id FROM store_product_search s JOIN store_product p ON p.id = s.product_id, "
+                "to_tsquery('simple', %s) query "
+                f"WHERE s.document @@ query {'AND p.is_active' if active_only else ''} "
+                "ORDER BY ts_rank_cd(s.document, query) DESC, p.id LIMIT %s",
+                [query, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+    def has_prefix(self, token):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM store_product_search WHERE document @@ to_tsquery('simple', %s) LIMIT 1",
+                [f"{token}:*"],
+            )
+            return cursor.fetchone() is not None
+
+    def terms_near(self, first, shortest, longest, limit):
+        # ts_stat only reads documents the GIN index says hold a word
+        # starting with `first` (a single \w character, safe to inline)
+        documents = f"SELECT document FROM store_product_search WHERE document @@ to_tsquery('simple', '{first}:*')"
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT word FROM ts_stat(%s) WHERE word LIKE %s AND length(word) BETWEEN %s AND %s "
+                "AND word !~ '[0-9]' ORDER BY word LIMIT %s",
+                [documents, f"{first}%", shortest, longest, limit],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+def successor(prefix):
+    """The smallest string greater than every string starting with `prefix`."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+BACKENDS = {'sqlite': SqliteSearchBackend, 'postgresql': PostgresSearchBackend}
+
+
+def search_backend(write=False):
+    alias = router.db_for_write(Product) if write else router.db_for_read(Product)
+    connection = connections[alias or 'default']
+    backend = BACKENDS.get(connection.vendor)
+    return backend(connection) if backend else None
+
+
+def index_products(product_ids):
+    """Re-indexes these products (new, changed or deleted rows alike)."""
+    backend = search_backend(write=True)
+    product_ids = list(product_ids)
+    if backend and product_ids:
+        backend.index(product_ids)
+
+
+def rebuild_index():
+    backend = search_backend(write=True)
+    return backend.rebuild() if backend else 0
+
+
+# ===================================================================
+# TYPO TOLERANCE
+# ===================================================================
+
+def within_edits(word, candidate, limit):
+    """Damerau-Levenshtein distance <= limit, giving up as soon as a row exceeds it."""
+    if abs(len(word) - len(candidate)) > limit:
+        return False
+    previous_row, row = None, list(range(len(candidate) + 1))
+    for i, letter in enumerate(word, 1):
+        before, previous_row, row = previous_row, row, [i] + [0] * len(candidate)
+        for j, other in enumerate(candidate, 1):
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + (letter != other))
+            if i > 1 and j > 1 and letter == candidate[j - 2] and word[i - 2] == other:
+                row[j] = min(row[j], before[j - 2] + 1)
+        if min(row) > limit:
+            return False
+    return row[-1] <= limit
+
+
+MAX_EDITS = 2
+BUCKET_SIZE = 200
+
+
+def nearby_terms(backend, token):
+    """
+    Indexed words (numbers left out: SKU-ish digits aren't typos) that
+    share the token's first letter and are within MAX_EDITS letters of
+    its length, at most BUCKET_SIZE of them, cached per bucket until the
+    catalog next changes.
+    """
+    key = f"search:terms:{get_catalog_version()}:{token[0]}:{len(token)}"
+    terms = cache.get(key)
+    if terms is None:
+        terms = backend.terms_near(token[0], len(token) - MAX_EDITS, len(token) + MAX_EDITS, BUCKET_SIZE)
+        cache.set(key, terms, settings.CATALOG_CACHE_TIMEOUT)
+    return terms
+
+
+def correct(tokens, backend):
+    """Tokens with unknown words replaced by their closest indexed term; None if nothing changed."""
+    corrected = []
+    for token in tokens:
+        if len(token) < 4 or token.isdigit() or backend.has_prefix(token):
+            corrected.append(token)
+            continue
+        limit = 1 if len(token) < 8 else MAX_EDITS
+        matches = [
+            term for term in nearby_terms(backend, token)
+            if abs(len(term) - len(token)) <= limit and within_edits(token, term, limit)
+        ]
+        corrected.append(min(matches, key=lambda term: (abs(len(term) - len(token)), term)) if matches else token)
+    return corrected if corrected != tokens else None
+
+
+def search_products(query, limit=20, active_only=True):
+    """
+    Ranked ids of products matching `query`, and the corrected query when
+    typo correction was needed: (ids, corrected_or_None).
+    """
+    tokens = tokenize(query)
+    backend = search_backend()
+    if not tokens or backend is None:
+        return [], None
+    ids = backend.match(tokens, limit, active_only)
+    if ids:
+        return ids, None
+    corrected = correct(tokens, backend)
+    if corrected is None:
+        return [], None
+    return backend.match(corrected, limit, active_only), ' '.join(corrected)
@@ -0,0 +1,59 @@
+import itertools
+
+from .models import Category, Product, ProductSKU
+from .search import index_products
+from .summaries import refresh_product_summaries
+
+# ===================================================================
+# SYNTHETIC CATALOG
+# ===================================================================
+# Bulk jerseys for load testing: seed_jerseys --products N seeds them into
+# a real database, bench_api into its throwaway one.
+
+TEAMS = ["Argentina", "Portugal", "Real Madrid", "Man City", "Inter Miami", "Arsenal", "Chiefs", "Lakers"]
+SEASONS = ["2023", "2024", "24/25", "25/26"]
+JERSEY_TYPES = ["HOME", "AWAY", "THIRD", "SPECIAL"]
+SIZES = ["XS", "S", "M", "L", "XL", "XXL", "3XL", "4XL"]
+
+
+def seed_synthetic_catalog(products, skus_per_product, batch_size=1000, stock=50):
+    """
+    Bulk-creates `products` jerseys with `skus_per_product` sizes each.
+    Returns the number of SKUs created.
+    """
+    categories = [
+        Category.objects.get_or_create(slug=slug, defaults={'name': name})[0]
+        for slug, name in [("bench-club", "Bench Club"), ("bench-intl", "Bench International")]
+    ]
+    start = Product.objects.count()
+    created_skus = 0
+    for offset in range(0, products, batch_size):
+        batch = [
+            Product(
+                category=categories[i % len(categories)],
+                name=f"Synthetic Jersey {start + i}",
+                team=TEAMS[i % len(TEAMS)],
+                season=SEASONS[i % len(SEASONS)],
+                jersey_type=JERSEY_TYPES[i % len(JERSEY_TYPES)],
+                description=f"Synthetic catalog row {start + i} for load testing",
+            )
+            for i in range(offset, min(offset + batch_size, products))
+        ]
+        batch = Product.objects.bulk_create(batch)
+        skus = [
+            ProductSKU(
+                product=product,
+                sku_code=f"SYN-{product.pk}-{size}",
+                size=size,
+                price=f"{90 + (product.pk + n) % 60}.00",
+                stock_quantity=stock,
+                image=f"products/synthetic-{product.pk % 10}.png" if n == 0 else None,
+            )
+            for product in batch
+            for n, size in enumerate(itertools.islice(itertools.cycle(SIZES), skus_per_product))
+        ]
+        ProductSKU.objects.bulk_create(skus, batch_size=batch_size)
+        refresh_product_summaries(product_ids=[product.pk for product in batch])
+        index_products([product.pk for product in batch])
+        created_skus += len(skus)
+    return created_skus
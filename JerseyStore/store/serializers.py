@@ -1,6 +1,9 @@
+from django.core.files.storage import default_storage
 from rest_framework import serializers
+from .images import rendition_urls
+from .representations import represent_products
 from .models import (
-    Product, ProductSKU, Category, Cart, 
+    Product, ProductSKU, Cart,
     CartItem, User, Order, OrderItem, Profile, Newsletter
 )
 
@@ -29,30 +32,51 @@ class ProductSerializer(serializers.ModelSerializer):
     
     # This creates the 'main_image' field for your React ProductCard
     main_image = serializers.SerializerMethodField()
+    # card/detail/zoom WebP and JPEG URLs plus srcset strings (see store/images.py)
+    image_renditions = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
         fields = [
             'id', 'name', 'team', 'season', 'jersey_type', 
-            'description', 'category_name', 'skus', 'main_image'
+            'description', 'category_name', 'skus', 'main_image', 'image_renditions',
+            'min_price', 'max_price', 'total_stock'
         ]
 
     def get_main_image(self, obj):
         """
-        Grabs the image from the first SKU associated with the product.
+        The first SKU image, kept on the product row as `main_image`.
         Uses absolute URI so the frontend gets the full URL including the domain.
         """
-        # Finds the first SKU that actually has an image file path assigned
-        first_sku = obj.skus.exclude(image="").first() 
-        
-        if first_sku and first_sku.image:
+        if obj.main_image:
+            image_url = default_storage.url(obj.main_image)
             request = self.context.get('request')
             if request:
                 # Returns http://127.0.0.1:8000/media/products/jersey.png
-                return request.build_absolute_uri(first_sku.image.url)
-            return first_sku.image.url
+                return request.build_absolute_uri(image_url)
+            return image_url
         return None
 
+    def get_image_renditions(self, obj):
+        return rendition_urls(obj.main_image_renditions, self.context.get('request'))
+
+class ProductRowListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        return represent_products(data, self.context.get('request'))
+
+class ProductRowSerializer(serializers.BaseSerializer):
+    """
+    Read-only twin of ProductSerializer for `.values()` rows (see
+    store/representations.py); a page of products skips field-by-field
+    serialization and loads its SKUs in one query.
+    """
+
+    class Meta:
+        list_serializer_class = ProductRowListSerializer
+
+    def to_representation(self, instance):
+        return represent_products([instance], self.context.get('request'))[0]
+
 # --- 3. CART & ITEM SERIALIZERS ---
 class CartItemSerializer(serializers.ModelSerializer):
     sku = ProductSKUSerializer(read_only=True)
@@ -0,0 +1,51 @@
+from django.db.models import IntegerField, JSONField, Max, Min, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Product, ProductSKU
+
+# ===================================================================
+# PRODUCT SUMMARIES
+# ===================================================================
+# Product.min_price / max_price / total_stock / main_image(_renditions)
+# are copies of what the product's SKUs say, so catalog cards, price sorting
+# and the in-stock filter read one table. They are recomputed by a single
+#   UPDATE store_product SET min_price = (SELECT MIN(price) ...), ...
+# for just the products touched:
+#   - ProductSKU save/delete signals (store/models.py)
+#   - stock reservations taken, released or committed (store/inventory.py)
+#   - catalog imports, per batch (store/catalog_import.py)
+# rebuild_product_summaries recomputes everything if they ever drift.
+
+
+def summary_values():
+    """Column -> expression for Product.objects.update(); correlated on the product's pk."""
+    skus = ProductSKU.objects.filter(product=OuterRef('pk')).order_by().values('product')
+    main_image_sku = ProductSKU.objects.filter(
+        product=OuterRef('pk'), image__isnull=False
+    ).exclude(image='').order_by('id')
+    return {
+        'min_price': Subquery(skus.annotate(value=Min('price')).values('value')),
+        'max_price': Subquery(skus.annotate(value=Max('price')).values('value')),
+        'total_stock': Coalesce(
+            Subquery(skus.annotate(value=Sum('stock_quantity')).values('value')), Value(0),
+            output_field=IntegerField(),
+        ),
+        'main_image': Coalesce(Subquery(main_image_sku.values('image')[:1]), Value('')),
+        'main_image_renditions': Coalesce(
+            Subquery(main_image_sku.values('image_renditions')[:1]), Value({}, JSONField()),
+            output_field=JSONField(),
+        ),
+    }
+
+
+def refresh_product_summaries(product_ids=None, sku_ids=None):
+    """
+    Recomputes the summary columns for the given products, or for the
+    products owning the given SKUs, in one UPDATE. Returns rows updated.
+    """
+    products = Product.objects.all()
+    if product_ids is not None:
+        products = products.filter(pk__in=product_ids)
+    if sku_ids is not None:
+        products = products.filter(pk__in=ProductSKU.objects.filter(pk__in=sku_ids).values('product_id'))
+    return products.update(**summary_values())
@@ -1,8 +1,64 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import hmac
+import io
+import json
+import os
+import pickle
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.db.models import Prefetch
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.urls import reverse
 from rest_framework import status
-from rest_framework.test import APIClient
-from .models import Product, Category
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from decimal import Decimal
+
+from .models import (
+    Product, ProductSKU, Category, Order, OrderItem, User, Cart, CartItem, StockReservation,
+    PaymentEvent, Profile, LoyaltyEntry, CheckoutLine, DailySales, DailySkuSales, Newsletter
+)
+from . import metrics
+from .authentication import CachedJWTAuthentication, user_cache_key
+from .pricing import cart_summary, priced_items, priced_items_prefetch
+from .renderers import FastJSONRenderer
+from .representations import product_rows, represent_cart, represent_cart_items, represent_products
+from .serializers import CartSerializer, ProductSerializer
+from .summaries import refresh_product_summaries
+from .routers import REPLICA_ALIAS, PrimaryReplicaRouter, use_primary
+from .benchmarks import compare_reports, run_benchmarks
+from .cache import bump_catalog_version, catalog_request_digest, get_catalog_version
+from .views import ProductViewSet
+from .carts import OrmCartStore
+from .loyalty import refresh_tiers
+from .orders import create_order_from_session
+from .exports import export_stream
+from .search import rebuild_index, search_products
+from .checkout import prepare_checkout_session, session_expiry
+from .inventory import (
+    OutOfStock, attach_session, commit_reservations, release_expired_reservations,
+    release_reservations, reserve_stock
+)
 
 class ProductApiTest(TestCase):
     def setUp(self):
@@ -12,13 +68,1909 @@ class ProductApiTest(TestCase):
         self.product = Product.objects.create(
             category=self.category,
             name="Test Serum",
-            slug="test-serum",
             description="A test product"
         )
 
     def test_get_product_list(self):
         """Test if the products API returns a 200 OK status"""
         # This matches the 'api/products/' path you defined
-        url = '/api/products/' 
+        url = '/api/products/'
         response = self.client.get(url)
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ProductCatalogQueryTest(TestCase):
+    """The catalog listing must cost the same number of queries for any page size."""
+
+    # COUNT for pagination + products (with category and main image) + SKU prefetch
+    MAX_LIST_QUERIES = 3
+
+    def setUp(self):
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Club Teams", slug="club-teams")
+
+    def add_jerseys(self, count):
+        for i in range(count):
+            product = Product.objects.create(
+                category=self.category, name=f"Jersey {i}", team=f"Team {i}",
+                season="24/25", description="Home kit"
+            )
+            ProductSKU.objects.create(product=product, size="S", price="100.00")
+            ProductSKU.objects.create(
+                product=product, size="M", price="110.00", image=f"products/jersey-{i}.png"
+            )
+
+    def test_list_query_count_does_not_grow_with_page_size(self):
+        self.add_jerseys(2)
+        with self.assertNumQueries(self.MAX_LIST_QUERIES):
+            small = self.client.get('/api/products/')
+
+        self.add_jerseys(7)
+        with self.assertNumQueries(self.MAX_LIST_QUERIES):
+            full = self.client.get('/api/products/')
+
+        self.assertEqual(len(small.data['results']), 2)
+        self.assertEqual(len(full.data['results']), 9)
+
+    def test_main_image_is_first_sku_with_an_image(self):
+        self.add_jerseys(1)
+        response = self.client.get('/api/products/')
+        product = response.data['results'][0]
+        self.assertTrue(product['main_image'].endswith('/media/products/jersey-0.png'))
+        self.assertEqual(product['category_name'], "Club Teams")
+        self.assertEqual([sku['size'] for sku in product['skus']], ["S", "M"])
+
+
+class ProductCatalogCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name="International", slug="international")
+        self.product = Product.objects.create(
+            category=self.category, name="Argentina Home", team="Argentina",
+            season="2024", description="Home kit"
+        )
+        self.sku = ProductSKU.objects.create(product=self.product, size="M", price="120.00")
+
+    def test_repeat_reads_are_served_from_cache(self):
+        self.client.get('/api/products/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/products/')
+        self.assertEqual(response.data['results'][0]['name'], "Argentina Home")
+
+    def test_query_params_get_their_own_entry(self):
+        self.client.get('/api/products/')
+        with self.assertNumQueries(1):
+            # Page 2 of a single-page catalog: only the COUNT runs before the 404
+            response = self.client.get('/api/products/?page=2')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_writes_invalidate_cached_pages(self):
+        self.client.get(f'/api/products/{self.product.id}/')
+
+        self.sku.price = "99.00"
+        self.sku.save()
+        response = self.client.get(f'/api/products/{self.product.id}/')
+        self.assertEqual(response.data['skus'][0]['price'], "99.00")
+
+        self.category.name = "World Cup"
+        self.category.save()
+        response = self.client.get(f'/api/products/{self.product.id}/')
+        self.assertEqual(response.data['category_name'], "World Cup")
+
+        self.product.delete()
+        response = self.client.get(f'/api/products/{self.product.id}/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_matching_etag_returns_304_without_queries(self):
+        etag = self.client.get('/api/products/')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        Product.objects.create(
+            category=self.category, name="Argentina Away", team="Argentina",
+            season="2024", description="Away kit"
+        )
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+    def test_stale_page_served_while_another_worker_recomputes(self):
+        path = f'/api/products/{self.product.id}/'
+        before = self.client.get(path)
+        Product.objects.filter(pk=self.product.pk).update(name="Argentina Home 2026")
+        bump_catalog_version()
+
+        # Another process holds the lock for the new version's page
+        digest = catalog_request_digest(Request(APIRequestFactory().get(path)))
+        lock_key = f"catalog:{get_catalog_version()}:{digest}:lock"
+        cache.add(lock_key, 1)
+        with self.assertNumQueries(0):
+            response = self.client.get(path)
+        self.assertEqual((response.data['name'], response['ETag']), ("Argentina Home", before['ETag']))
+
+        cache.delete(lock_key)
+        response = self.client.get(path)
+        self.assertEqual(response.data['name'], "Argentina Home 2026")
+        self.assertNotEqual(response['ETag'], before['ETag'])
+
+
+class CatalogSingleFlightTest(TransactionTestCase):
+    """A drop: every client misses the same product page at once."""
+
+    CLIENTS = 10
+
+    def test_concurrent_misses_compute_once(self):
+        cache.clear()
+        product = make_sku(stock=5).product
+        start = threading.Barrier(self.CLIENTS)
+        original = ProductViewSet.get_object
+        calls, responses = [], []
+
+        def slow_get_object(view):
+            calls.append(view)
+            time.sleep(0.2)  # keep the computation in flight while the others arrive
+            return original(view)
+
+        def fetch():
+            start.wait()
+            try:
+                responses.append(APIClient().get(f'/api/products/{product.id}/'))
+            finally:
+                connection.close()
+
+        with mock.patch.object(ProductViewSet, 'get_object', autospec=True, side_effect=slow_get_object):
+            threads = [threading.Thread(target=fetch) for _ in range(self.CLIENTS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([r.status_code for r in responses], [200] * self.CLIENTS)
+        self.assertEqual({r.data['name'] for r in responses}, {product.name})
+        self.assertEqual(len({r['ETag'] for r in responses}), 1)
+
+
+class ProductCatalogFilterTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        club = Category.objects.create(name="Club Teams", slug="club-teams")
+        intl = Category.objects.create(name="International", slug="international")
+        self.madrid = self.add_jersey(club, "Real Madrid Home", "Real Madrid", "24/25", "HOME",
+                                      [("M", "140.00", 5), ("L", "140.00", 0)])
+        self.city = self.add_jersey(club, "Man City Away", "Man City", "24/25", "AWAY",
+                                    [("L", "110.00", 3)])
+        self.argentina = self.add_jersey(intl, "Argentina Home", "Argentina", "2024", "HOME",
+                                         [("S", "120.00", 0), ("M", "125.00", 0)])
+
+    def add_jersey(self, category, name, team, season, jersey_type, skus):
+        product = Product.objects.create(
+            category=category, name=name, team=team, season=season,
+            jersey_type=jersey_type, description=f"{team} {season} kit"
+        )
+        for size, price, stock in skus:
+            ProductSKU.objects.create(product=product, size=size, price=price, stock_quantity=stock)
+        return product
+
+    def names(self, query):
+        response = self.client.get(f'/api/products/?{query}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [product['name'] for product in response.data['results']]
+
+    def test_product_field_filters(self):
+        self.assertEqual(self.names('team=Man City'), ["Man City Away"])
+        self.assertEqual(self.names('season=24/25&jersey_type=home'), ["Real Madrid Home"])
+        self.assertEqual(self.names('category=international'), ["Argentina Home"])
+        self.assertEqual(self.names(f'category={self.city.category_id}'),
+                         ["Real Madrid Home", "Man City Away"])
+
+    def test_sku_filters_apply_to_the_same_sku(self):
+        self.assertEqual(self.names('min_price=115&max_price=130'), ["Argentina Home"])
+        self.assertEqual(self.names('size=l'), ["Real Madrid Home", "Man City Away"])
+        # Madrid has an L, but it is the M that is in stock
+        self.assertEqual(self.names('size=L&in_stock=true'), ["Man City Away"])
+        self.assertEqual(self.names('in_stock=1'), ["Real Madrid Home", "Man City Away"])
+
+    def test_ordering(self):
+        self.assertEqual(self.names('ordering=price'),
+                         ["Man City Away", "Argentina Home", "Real Madrid Home"])
+        self.assertEqual(self.names('ordering=-price'),
+                         ["Real Madrid Home", "Argentina Home", "Man City Away"])
+        self.assertEqual(self.names('ordering=newest'),
+                         ["Argentina Home", "Man City Away", "Real Madrid Home"])
+        self.assertEqual(self.names('ordering=name'),
+                         ["Argentina Home", "Man City Away", "Real Madrid Home"])
+
+    def test_search(self):
+        self.assertEqual(self.names('search=madrid'), ["Real Madrid Home"])
+        self.assertEqual(self.names('search=2024 kit'), ["Argentina Home"])
+
+    def test_invalid_price_is_rejected(self):
+        response = self.client.get('/api/products/?min_price=cheap')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CursorPaginationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        category = Category.objects.create(name="Club Teams", slug="club-teams")
+        for i in range(12):
+            Product.objects.create(
+                category=category, name=f"Jersey {i}", team="Team", season="24/25", description="Kit"
+            )
+
+    def test_cursor_pages_walk_the_catalog_without_counting(self):
+        with self.assertNumQueries(2):  # products page + SKU prefetch, no COUNT(*)
+            first = self.client.get('/api/products/?paginate=cursor')
+        self.assertNotIn('count', first.data)
+        self.assertEqual(first.data['results'][0]['name'], "Jersey 11")
+
+        second = self.client.get(first.data['next'])
+        names = [p['name'] for p in first.data['results'] + second.data['results']]
+        self.assertEqual(names, [f"Jersey {i}" for i in range(11, -1, -1)])
+        self.assertIsNone(second.data['next'])
+
+    def test_count_is_opt_in(self):
+        response = self.client.get('/api/products/?paginate=cursor&with_count=true')
+        self.assertEqual(response.data['count'], 12)
+
+    def test_page_numbers_stay_the_default(self):
+        response = self.client.get('/api/products/?page=2')
+        self.assertEqual(response.data['count'], 12)
+        self.assertEqual(len(response.data['results']), 3)
+
+
+class OrderHistoryTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="fan", password="pass")
+        other = User.objects.create_user(username="rival", password="pass")
+        for i in range(3):
+            order = Order.objects.create(user=self.user, total_amount="130.00", status="PAID")
+            OrderItem.objects.create(order=order, product_name=f"Jersey {i}",
+                                     price_at_purchase="120.00", quantity=1)
+        Order.objects.create(user=other, total_amount="50.00")
+        self.client.force_authenticate(self.user)
+
+    def test_lists_only_own_orders_with_items(self):
+        with self.assertNumQueries(2):  # orders page + items prefetch
+            response = self.client.get('/api/orders/')
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertEqual(response.data['results'][0]['items'][0]['product_name'], "Jersey 2")
+
+    def test_status_filter(self):
+        response = self.client.get('/api/orders/?status=pending')
+        self.assertEqual(response.data['results'], [])
+
+
+class CartPricingTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="fan", password="pass")
+        self.cart = Cart.objects.create(user=self.user)
+        category = Category.objects.create(name="Club Teams", slug="club-teams")
+        product = Product.objects.create(category=category, name="Home", team="Team",
+                                         season="24/25", description="Kit")
+        plain = ProductSKU.objects.create(product=product, size="M", price="19.99")
+        pricey = ProductSKU.objects.create(product=product, size="L", price="140.10",
+                                           custom_printing_cost="12.35")
+        lines = [
+            (plain, 3, None, None),
+            (plain, 1, "MESSI", None),
+            (pricey, 2, None, 10),
+            (pricey, 1, "", 0),      # empty customisation is not printed
+            (pricey, 7, "RONALDO", 7),
+        ]
+        for sku, quantity, name, number in lines:
+            CartItem.objects.create(cart=self.cart, sku=sku, quantity=quantity,
+                                    custom_name=name, custom_number=number)
+
+    def python_totals(self):
+        items = list(CartItem.objects.filter(cart=self.cart).order_by('id'))
+        line_totals = [item.get_total_item_price() for item in items]
+        return line_totals, sum(line_totals)
+
+    def test_database_totals_match_python_path(self):
+        expected_lines, expected_total = self.python_totals()
+        lines = [item.line_total for item in priced_items(self.cart.items.order_by('id'))]
+        self.assertEqual(lines, expected_lines)
+        self.assertTrue(all(isinstance(line, Decimal) for line in lines))
+        self.assertEqual(cart_summary(self.cart), {'line_count': 5, 'total': expected_total})
+        self.assertEqual(Cart.objects.get(pk=self.cart.pk).get_total_price(), expected_total)
+
+    def test_empty_cart_totals_zero(self):
+        empty = Cart.objects.create(user=self.user)
+        self.assertEqual(cart_summary(empty), {'line_count': 0, 'total': Decimal('0.00')})
+
+    def test_my_cart_prices_every_line_in_one_query(self):
+        expected_lines, expected_total = self.python_totals()
+        self.client.force_authenticate(self.user)
+        with self.assertNumQueries(2):  # cart get_or_create + priced lines
+            response = self.client.get('/api/cart/my_cart/')
+        self.assertEqual([item['total_item_price'] for item in response.data['items']], expected_lines)
+        self.assertEqual(response.data['total_price'], expected_total)
+
+
+def make_sku(stock, price="120.00", size="M"):
+    category, _ = Category.objects.get_or_create(name="Club Teams", slug="club-teams")
+    product = Product.objects.create(category=category, name="Drop Jersey", team="Team",
+                                     season="24/25", description="Kit")
+    return ProductSKU.objects.create(product=product, size=size, price=price, stock_quantity=stock)
+
+
+class StockReservationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="fan", password="pass")
+        self.sku = make_sku(stock=3)
+        self.other = make_sku(stock=1, size="L")
+
+    def stock(self, sku):
+        return ProductSKU.objects.get(pk=sku.pk).stock_quantity
+
+    def test_reserve_takes_stock_and_release_returns_it(self):
+        holds = reserve_stock(self.user, [(self.sku.id, 2), (self.other.id, 1)])
+        self.assertEqual((self.stock(self.sku), self.stock(self.other)), (1, 0))
+
+        self.assertEqual(release_reservations(holds), 2)
+        self.assertEqual(release_reservations(holds), 0)  # second release is a no-op
+        self.assertEqual((self.stock(self.sku), self.stock(self.other)), (3, 1))
+
+    def test_reservation_is_all_or_nothing(self):
+        with self.assertRaises(OutOfStock) as raised:
+            reserve_stock(self.user, [(self.sku.id, 1), (self.other.id, 2)])
+        self.assertEqual(raised.exception.sku_id, self.other.id)
+        self.assertEqual(self.stock(self.sku), 3)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_holds_are_reclaimed(self):
+        reserve_stock(self.user, [(self.other.id, 1)])
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        # The short SKU's expired hold is released on the spot
+        reserve_stock(self.user, [(self.other.id, 1)])
+        self.assertEqual(self.stock(self.other), 0)
+        self.assertEqual(release_expired_reservations(), 0)
+
+    def test_commit_keeps_stock_sold(self):
+        reserve_stock(self.user, [(self.sku.id, 2)], session_id="cs_test")
+        self.assertEqual(commit_reservations("cs_test"), 1)
+        self.assertEqual(release_expired_reservations(now=timezone.now() + timedelta(days=1)), 0)
+        self.assertEqual(self.stock(self.sku), 1)
+
+    def test_commit_after_expiry_takes_the_stock_again(self):
+        reserve_stock(self.user, [(self.sku.id, 2)], session_id="cs_late")
+        release_expired_reservations(now=timezone.now() + timedelta(days=1))
+        self.assertEqual(self.stock(self.sku), 3)
+        commit_reservations("cs_late")
+        self.assertEqual(self.stock(self.sku), 1)
+
+    def test_commit_after_expiry_flags_an_oversold_order(self):
+        reserve_stock(self.user, [(self.sku.id, 2)], session_id="cs_late")
+        release_expired_reservations(now=timezone.now() + timedelta(days=1))
+        reserve_stock(self.user, [(self.sku.id, 3)], session_id="cs_other")  # sold out meanwhile
+        order = Order.objects.create(user=self.user, total_amount="250.00", transaction_id="cs_late")
+
+        with self.assertLogs('store.inventory', 'WARNING'):
+            self.assertEqual(commit_reservations("cs_late"), 1)
+        self.assertEqual(self.stock(self.sku), 0)
+        self.assertTrue(Order.objects.get(pk=order.pk).oversold)
+
+
+class CheckoutReservationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="fan", password="pass")
+        self.client.force_authenticate(self.user)
+        self.sku = make_sku(stock=1)
+
+    @mock.patch('store.views.stripe.checkout.Session.create')
+    def test_checkout_holds_stock_for_the_session(self, create_session):
+        create_session.return_value = mock.Mock(id="cs_1", url="https://pay.example/cs_1")
+        response = self.client.post('/api/payment/create-checkout-session/',
+                                    {'is_instant': True, 'sku_id': self.sku.id, 'qty': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(StockReservation.objects.get().session_id, "cs_1")
+        self.assertIn('expires_at', create_session.call_args.kwargs)
+
+        self.assertIn("session_id={CHECKOUT_SESSION_ID}", create_session.call_args.kwargs['cancel_url'])
+
+        rival = APIClient()
+        rival.force_authenticate(User.objects.create_user(username="rival", password="pass"))
+        response = rival.post('/api/payment/create-checkout-session/',
+                              {'is_instant': True, 'sku_id': self.sku.id, 'qty': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        response = self.client.post('/api/payment/cancel-checkout/', {'session_id': "cs_1"}, format='json')
+        self.assertEqual(response.data, {"released": 1})
+        self.assertEqual(ProductSKU.objects.get(pk=self.sku.pk).stock_quantity, 1)
+
+    @mock.patch('store.views.stripe.checkout.Session.create')
+    def test_retrying_checkout_swaps_the_earlier_hold(self, create_session):
+        for session_id in ("cs_1", "cs_2"):
+            create_session.return_value = mock.Mock(id=session_id, url=f"https://pay.example/{session_id}")
+            response = self.client.post('/api/payment/create-checkout-session/',
+                                        {'is_instant': True, 'sku_id': self.sku.id, 'qty': 1}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        holds = dict(StockReservation.objects.values_list('session_id', 'status'))
+        self.assertEqual(holds, {"cs_1": "RELEASED", "cs_2": "HELD"})
+        self.assertEqual(ProductSKU.objects.get(pk=self.sku.pk).stock_quantity, 0)
+
+    @mock.patch('store.views.stripe.checkout.Session.create')
+    def test_quantity_must_be_positive(self, create_session):
+        for qty, error in ((0, "qty must be at least 1"), (-1, "qty must be at least 1"),
+                           ("two", "qty must be a whole number")):
+            response = self.client.post('/api/payment/create-checkout-session/',
+                                        {'is_instant': True, 'sku_id': self.sku.id, 'qty': qty}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(response.data['error'], error)
+        create_session.assert_not_called()
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_session_expiry_stays_inside_stripes_window(self):
+        now = timezone.now()
+        self.assertIsNone(session_expiry(now + timedelta(minutes=30), now=now))
+        self.assertEqual(session_expiry(now + timedelta(minutes=35), now=now),
+                         int((now + timedelta(minutes=35)).timestamp()))
+        self.assertEqual(session_expiry(now + timedelta(days=2), now=now),
+                         int((now + timedelta(hours=24, minutes=-2)).timestamp()))
+
+    @mock.patch('store.views.stripe.checkout.Session.create', side_effect=Exception("stripe down"))
+    def test_failed_session_releases_the_hold(self, create_session):
+        response = self.client.post('/api/payment/create-checkout-session/',
+                                    {'is_instant': True, 'sku_id': self.sku.id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(ProductSKU.objects.get(pk=self.sku.pk).stock_quantity, 1)
+
+
+class StockReservationConcurrencyTest(TransactionTestCase):
+    """Many buyers race for the same SKU from separate threads and connections."""
+
+    STOCK = 5
+    BUYERS = 20
+
+    def test_stock_never_goes_negative(self):
+        user = User.objects.create_user(username="fan", password="pass")
+        sku = make_sku(stock=self.STOCK)
+        start = threading.Barrier(self.BUYERS)
+        outcomes = []
+
+        def buy():
+            start.wait()
+            try:
+                while True:
+                    try:
+                        reserve_stock(user, [(sku.id, 1)])
+                        outcomes.append(True)
+                        return
+                    except OutOfStock:
+                        outcomes.append(False)
+                        return
+                    except OperationalError:
+                        # The shared in-memory SQLite test database reports
+                        # "table is locked" instead of waiting; retry like a client would.
+                        time.sleep(0.001)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy) for _ in range(self.BUYERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        sold = outcomes.count(True)
+        self.assertEqual(len(outcomes), self.BUYERS)
+        self.assertEqual(sold, self.STOCK)
+        self.assertEqual(ProductSKU.objects.get(pk=sku.pk).stock_quantity, 0)
+        self.assertEqual(StockReservation.objects.count(), sold)
+
+
+class VerifyPaymentTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="fan", password="pass")
+        self.client.force_authenticate(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+        self.sku = make_sku(stock=10, price="100.00")
+        CartItem.objects.create(cart=self.cart, sku=self.sku, quantity=2)
+        CartItem.objects.create(cart=self.cart, sku=self.sku, quantity=1, custom_name="MESSI", custom_number=10)
+        reserve_stock(self.user, [(self.sku.id, 3)], session_id="cs_paid")
+
+    def paid_session(self, **metadata):
+        metadata = metadata or {"is_instant": "false", "cart_id": str(self.cart.id), "user_id": str(self.user.id)}
+        return mock.Mock(id="cs_paid", payment_status="paid", amount_total=32500, metadata=metadata)
+
+    def verify(self):
+        return self.client.post('/api/payment/verify-payment/', {'session_id': "cs_paid"}, format='json')
+
+    @mock.patch('store.views.stripe.checkout.Session.retrieve')
+    def test_cart_becomes_an_order(self, retrieve):
+        retrieve.return_value = self.paid_session()
+        response = self.verify()
+        self.assertEqual(response.data['status'], "success")
+
+        order = Order.objects.get(pk=response.data['order_id'])
+        self.assertEqual((order.status, order.transaction_id, order.total_amount), ("PAID", "cs_paid", Decimal("325.00")))
+        lines = list(order.items.order_by('id').values_list('product_name', 'quantity', 'price_at_purchase', 'custom_name'))
+        self.assertEqual(lines, [
+            ("Drop Jersey", 2, Decimal("100.00"), None),
+            ("Drop Jersey", 1, Decimal("115.00"), "MESSI"),
+        ])
+        self.assertFalse(self.cart.items.exists())
+        self.assertEqual(StockReservation.objects.get().status, "COMMITTED")
+
+    @mock.patch('store.views.stripe.checkout.Session.retrieve')
+    def test_retries_are_no_ops(self, retrieve):
+        retrieve.return_value = self.paid_session()
+        order_id = self.verify().data['order_id']
+        with self.assertNumQueries(1):
+            response = self.verify()
+        self.assertEqual(response.data['order_id'], order_id)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(OrderItem.objects.count(), 2)
+
+    def check_out(self):
+        """Goes through checkout so the session has its priced lines recorded."""
+        setup_hold = StockReservation.objects.filter(session_id="cs_paid")
+        release_reservations(setup_hold)
+        setup_hold.delete()
+        _, reservations = prepare_checkout_session(self.user, {})
+        attach_session(reservations, "cs_paid")
+
+    @mock.patch('store.views.stripe.checkout.Session.retrieve')
+    def test_conversion_cost_does_not_grow_with_the_cart(self, retrieve):
+        retrieve.return_value = self.paid_session()
+        for number in range(20):
+            CartItem.objects.create(cart=self.cart, sku=self.sku, quantity=1, custom_number=number + 1)
+        ProductSKU.objects.filter(pk=self.sku.pk).update(stock_quantity=100)
+        self.check_out()
+        with self.assertNumQueries(19):
+            # 2 order lookups (view + service), order insert, checkout lines, bulk insert,
+            # cart quantity update + delete, 4 sales rollup statements,
+            # reservation commit (select + flip) and 6 savepoint statements
+            self.verify()
+        self.assertEqual(OrderItem.objects.count(), 22)
+
+    @mock.patch('store.views.stripe.checkout.Session.retrieve')
+    def test_cart_edits_after_checkout_stay_out_of_the_order(self, retrieve):
+        retrieve.return_value = self.paid_session()
+        self.check_out()
+        plain = self.cart.items.get(custom_name=None)
+        CartItem.objects.filter(pk=plain.pk).update(quantity=5)
+        CartItem.objects.create(cart=self.cart, sku=self.sku, quantity=1, custom_name="LATE")
+        ProductSKU.objects.filter(pk=self.sku.pk).update(price="90.00")
+
+        order = Order.objects.get(pk=self.verify().data['order_id'])
+        lines = list(order.items.order_by('id').values_list('quantity', 'price_at_purchase', 'custom_name'))
+        self.assertEqual(lines, [(2, Decimal("100.00"), None), (1, Decimal("115.00"), "MESSI")])
+        left = set(self.cart.items.values_list('quantity', 'custom_name'))
+        self.assertEqual(left, {(3, None), (1, "LATE")})
+
+    @mock.patch('store.views.stripe.checkout.Session.retrieve')
+    def test_another_customers_session_is_refused(self, retrieve):
+        retrieve.return_value = self.paid_session()
+        order_id = self.verify().data['order_id']
+
+        self.client.force_authenticate(User.objects.create_user(username="thief", password="pass"))
+        response = self.verify()
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn('order_id', response.data)
+        self.assertEqual(list(Order.objects.values_list('id', 'user')), [(order_id, self.user.id)])
+
+    @mock.patch('store.views.stripe.checkout.Session.retrieve')
+    def test_instant_purchase(self, retrieve):
+        retrieve.return_value = self.paid_session(is_instant="true", sku_id=str(self.sku.id), qty="2",
+                                                  user_id=str(self.user.id))
+        order = Order.objects.get(pk=self.verify().data['order_id'])
+        self.assertEqual(list(order.items.values_list('quantity', 'price_at_purchase')), [(2, Decimal("100.00"))])
+        self.assertEqual(self.cart.items.count(), 2)
+
+
+WEBHOOK_SECRET = "whsec_test"
+
+
+def stripe_event(event_type, session, event_id="evt_1"):
+    """A local stand-in for a Stripe checkout event, signed the way Stripe signs it."""
+    payload = json.dumps({"id": event_id, "type": event_type, "data": {"object": session}})
+    timestamp = int(time.time())
+    signature = hmac.new(WEBHOOK_SECRET.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return payload, f"t={timestamp},v1={signature}"
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class StripeWebhookTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="fan", password="pass")
+        self.cart = Cart.objects.create(user=self.user)
+        self.sku = make_sku(stock=5, price="100.00")
+        CartItem.objects.create(cart=self.cart, sku=self.sku, quantity=2)
+        reserve_stock(self.user, [(self.sku.id, 2)], session_id="cs_hook")
+        self.session = {
+            "id": "cs_hook", "payment_status": "paid", "amount_total": 21000,
+            "metadata": {"is_instant": "false", "cart_id": str(self.cart.id), "user_id": str(self.user.id)},
+        }
+
+    def deliver(self, payload, signature):
+        return self.client.post('/api/payment/webhook/', payload, content_type='application/json',
+                                HTTP_STRIPE_SIGNATURE=signature)
+
+    def test_events_are_stored_then_processed_by_the_worker(self):
+        payload, signature = stripe_event("checkout.session.completed", self.session)
+        self.assertEqual(self.deliver(payload, signature).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.deliver(payload, signature).status_code, status.HTTP_200_OK)  # redelivery
+        self.assertEqual(PaymentEvent.objects.count(), 1)
+        self.assertFalse(Order.objects.exists())
+
+        call_command('process_payment_events', stdout=io.StringIO())
+        order = Order.objects.get(transaction_id="cs_hook")
+        self.assertEqual(order.items.get().quantity, 2)
+        self.assertIsNotNone(PaymentEvent.objects.get().processed_at)
+        self.assertEqual(StockReservation.objects.get().status, "COMMITTED")
+
+        # The browser's verify-payment now answers without calling Stripe
+        self.client.force_authenticate(self.user)
+        with mock.patch('store.views.stripe.checkout.Session.retrieve') as retrieve:
+            response = self.client.post('/api/payment/verify-payment/', {'session_id': "cs_hook"}, format='json')
+        retrieve.assert_not_called()
+        self.assertEqual(response.data['order_id'], order.id)
+
+    def test_bad_signature_is_rejected(self):
+        payload, _ = stripe_event("checkout.session.completed", self.session)
+        _, other_signature = stripe_event("checkout.session.completed", {}, event_id="evt_other")
+        self.assertEqual(self.deliver(payload, other_signature).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.deliver(payload, "").status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(PaymentEvent.objects.exists())
+
+    def test_expired_session_releases_stock(self):
+        self.deliver(*stripe_event("checkout.session.expired", {"id": "cs_hook"}))
+        call_command('process_payment_events', stdout=io.StringIO())
+        self.assertEqual(ProductSKU.objects.get(pk=self.sku.pk).stock_quantity, 5)
+
+    @override_settings(PAYMENT_EVENT_MAX_ATTEMPTS=2)
+    def test_failing_events_are_retried_then_parked(self):
+        self.session["metadata"]["user_id"] = "999"
+        self.deliver(*stripe_event("checkout.session.completed", self.session))
+        def run():
+            call_command('process_payment_events', stdout=io.StringIO())
+            return PaymentEvent.objects.get()
+
+        event = run()
+        self.assertEqual(event.attempts, 1)
+        first_retry = event.next_attempt_at
+        self.assertGreater(first_retry, timezone.now())
+        self.assertEqual(run().attempts, 1)  # still backing off
+
+        PaymentEvent.objects.update(next_attempt_at=timezone.now())
+        event = run()
+        self.assertEqual(event.attempts, 2)
+        self.assertGreater(event.next_attempt_at - timezone.now(), first_retry - event.received_at)
+
+        PaymentEvent.objects.update(next_attempt_at=timezone.now())
+        event = run()
+        self.assertEqual(event.attempts, 2)  # parked
+        self.assertIsNone(event.processed_at)
+        self.assertIn("DoesNotExist", event.last_error)
+
+
+class FakeProviderServer:
+    """
+    Local stand-in for Stripe's checkout sessions API and eSewa's status
+    check. `fail_next` makes the next N requests answer 503, `html_next`
+    makes them answer 200 with an HTML page instead of JSON.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.sessions = {}
+        self.fail_next = 0
+        self.html_next = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status_code, body):
+                raw = json.dumps(body).encode()
+                self.send_response(status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+            def handle_request(self, method):
+                url = urlparse(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                form = parse_qs(self.rfile.read(length).decode()) if length else {}
+                fake.requests.append((method, url.path, form, dict(self.headers)))
+                if fake.fail_next:
+                    fake.fail_next -= 1
+                    return self.reply(503, {"error": {"message": "try again"}})
+                if fake.html_next:
+                    fake.html_next -= 1
+                    raw = b"<html>Bad gateway</html>"
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/html')
+                    self.send_header('Content-Length', str(len(raw)))
+                    self.end_headers()
+                    return self.wfile.write(raw)
+                if method == 'POST' and url.path == '/v1/checkout/sessions':
+                    session_id = f"cs_fake_{len(fake.sessions) + 1}"
+                    fake.sessions[session_id] = {
+                        "id": session_id, "url": f"https://pay.example/{session_id}",
+                        "payment_status": "paid",
+                        "amount_total": int(form['line_items[0][price_data][unit_amount]'][0]),
+                        "metadata": {key[9:-1]: value[0] for key, value in form.items() if key.startswith('metadata[')},
+                    }
+                    return self.reply(200, fake.sessions[session_id])
+                if method == 'GET' and url.path.startswith('/v1/checkout/sessions/'):
+                    session = fake.sessions.get(url.path.rsplit('/', 1)[-1])
+                    if session:
+                        return self.reply(200, session)
+                    return self.reply(404, {"error": {"message": "No such checkout.session"}})
+                if method == 'GET' and url.path == '/esewa/status/':
+                    query = parse_qs(url.query)
+                    return self.reply(200, {"status": "COMPLETE", "ref_id": "REF1",
+                                            "transaction_uuid": query['transaction_uuid'][0]})
+                return self.reply(404, {"error": {"message": "unknown route"}})
+
+            def do_GET(self):
+                self.handle_request('GET')
+
+            def do_POST(self):
+                self.handle_request('POST')
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class AsyncPaymentViewTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake = FakeProviderServer()
+        cls.provider_settings = override_settings(
+            STRIPE_API_BASE=cls.fake.base_url,
+            STRIPE_SECRET_KEY="sk_test_fake",
+            ESEWA_STATUS_URL=f"{cls.fake.base_url}/esewa/status/",
+            PAYMENT_HTTP_BACKOFF=0,
+        )
+        cls.provider_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.provider_settings.disable()
+        cls.fake.close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.fake.requests.clear()
+        self.fake.fail_next = 0
+        self.fake.html_next = 0
+        self.user = User.objects.create_user(username="fan", password="pass")
+        self.sku = make_sku(stock=3, price="100.00")
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, sku=self.sku, quantity=2)
+        self.auth = {'Authorization': f"Bearer {RefreshToken.for_user(self.user).access_token}"}
+
+    async def post(self, path, data):
+        return await self.async_client.post(path, data, content_type='application/json', headers=self.auth)
+
+    async def test_checkout_then_verify(self):
+        response = await self.post('/api/async/payment/create-checkout-session/', {})
+        self.assertEqual(response.status_code, 200)
+        session_id = response.json()['url'].rsplit('/', 1)[-1]
+        self.assertEqual(self.fake.sessions[session_id]['amount_total'], 21000)
+        self.assertTrue(await StockReservation.objects.filter(session_id=session_id).aexists())
+
+        response = await self.post('/api/async/payment/verify-payment/', {'session_id': session_id})
+        self.assertEqual(response.json()['status'], "success")
+        order = await Order.objects.aget(transaction_id=session_id)
+        self.assertEqual(order.total_amount, Decimal("210.00"))
+
+        response = await self.post('/api/async/payment/verify-payment/', {'session_id': session_id})
+        self.assertEqual(response.json()['order_id'], order.id)
+
+    async def test_retries_reuse_the_idempotency_key(self):
+        self.fake.fail_next = 2
+        response = await self.post('/api/async/payment/create-checkout-session/', {})
+        self.assertEqual(response.status_code, 200)
+        keys = {headers['Idempotency-Key'] for _, _, _, headers in self.fake.requests}
+        self.assertEqual((len(self.fake.requests), len(keys)), (3, 1))
+
+    async def test_provider_outage_releases_the_hold(self):
+        self.fake.fail_next = 10
+        response = await self.post('/api/async/payment/create-checkout-session/', {})
+        self.assertEqual(response.status_code, 502)
+        sku = await ProductSKU.objects.aget(pk=self.sku.pk)
+        self.assertEqual(sku.stock_quantity, 3)
+
+    async def test_non_json_answers_are_provider_errors(self):
+        self.fake.html_next = 1
+        response = await self.post('/api/async/payment/create-checkout-session/', {})
+        self.assertEqual(response.status_code, 502)
+        sku = await ProductSKU.objects.aget(pk=self.sku.pk)
+        self.assertEqual(sku.stock_quantity, 3)
+
+        self.fake.html_next = 1
+        response = await self.post('/api/async/payment/esewa-status/',
+                                   {'transaction_uuid': "CART-1-1", 'total_amount': "210.00"})
+        self.assertEqual(response.status_code, 502)
+
+    async def test_session_id_stays_in_its_path_segment(self):
+        response = await self.post('/api/async/payment/verify-payment/', {'session_id': "../../v1/charges?x=1"})
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(self.fake.requests[-1][1], "/v1/checkout/sessions/..%2F..%2Fv1%2Fcharges%3Fx%3D1")
+
+    async def test_verify_checks_ownership_and_reports_failures(self):
+        response = await self.post('/api/async/payment/create-checkout-session/', {})
+        session_id = response.json()['url'].rsplit('/', 1)[-1]
+
+        thief = await User.objects.acreate(username="thief")
+        headers = {'Authorization': f"Bearer {RefreshToken.for_user(thief).access_token}"}
+        response = await self.async_client.post('/api/async/payment/verify-payment/', {'session_id': session_id},
+                                                content_type='application/json', headers=headers)
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(await Order.objects.aexists())
+
+        self.fake.sessions[session_id]['metadata']['sku_id'] = "999"
+        self.fake.sessions[session_id]['metadata']['is_instant'] = "true"
+        await CheckoutLine.objects.all().adelete()
+        response = await self.post('/api/async/payment/verify-payment/', {'session_id': session_id})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(await Order.objects.aexists())
+
+    async def test_esewa_status(self):
+        response = await self.post('/api/async/payment/esewa-status/',
+                                   {'transaction_uuid': "CART-1-1", 'total_amount': "210.00"})
+        self.assertEqual(response.json(), {"status": "COMPLETE", "ref_id": "REF1", "transaction_uuid": "CART-1-1"})
+
+    async def test_requires_authentication(self):
+        response = await self.async_client.post('/api/async/payment/verify-payment/', {},
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+
+class BenchmarkSuiteTest(TestCase):
+    def test_report_covers_every_scenario(self):
+        cache.set('live:cart', "keep me")
+        report = run_benchmarks(products=4, skus_per_product=2, users=2, cart_lines=2, iterations=3)
+        self.assertEqual(cache.get('live:cart'), "keep me")  # the cold scenarios clear a private cache
+        self.assertEqual(report['config']['seeded_skus'], 8)
+        self.assertEqual(set(report['scenarios']), {
+            'catalog_list_cold', 'catalog_list_cached', 'catalog_detail_cold', 'cart_add_item',
+            'cart_my_cart', 'payment_create_checkout_session', 'payment_verify_payment',
+        })
+        for name, result in report['scenarios'].items():
+            self.assertTrue(all(code < 400 for code in result['status_codes']), name)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertEqual(report['serialization']['page_size'], 100)
+        self.assertIn('fts_p95_ms', report['search'])
+
+        slower = json.loads(json.dumps(report))
+        slower['scenarios']['cart_my_cart']['queries_per_request'] += 1
+        lines, regressed = compare_reports(report, slower)
+        self.assertTrue(regressed)
+        self.assertTrue(any(line.startswith("REGRESSION cart_my_cart") for line in lines))
+
+
+FEED_HEADER = "sku_code,product_slug,name,team,season,jersey_type,category_slug,size,price,stock_quantity\n"
+
+
+class CatalogImportTest(TestCase):
+    def run_import(self, *rows, header=FEED_HEADER, **options):
+        path = self.write_feed(*rows, header=header)
+        out = io.StringIO()
+        call_command('import_catalog', path, stdout=out, stderr=io.StringIO(), **options)
+        return out.getvalue()
+
+    def write_feed(self, *rows, header=FEED_HEADER):
+        handle = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+        handle.write(header + "".join(row + "\n" for row in rows))
+        handle.close()
+        self.addCleanup(os.unlink, handle.name)
+        return handle.name
+
+    def test_creates_then_updates_in_place(self):
+        self.run_import(
+            "ARG-H-M,arg-home,Home,Argentina,2024,home,intl,M,120.00,10",
+            "ARG-H-L,arg-home,Home,Argentina,2024,home,intl,L,120.00,5",
+            "bad-row,,,,,,,,,",
+        )
+        product = Product.objects.get(slug='arg-home')
+        self.assertEqual(product.skus.count(), 2)
+        self.assertEqual(product.category.slug, 'intl')
+        self.assertEqual(product.jersey_type, 'HOME')
+
+        with self.assertNumQueries(12):  # + search index delete/insert
+            self.run_import(
+                "ARG-H-M,arg-home,Home Kit,Argentina,2024,HOME,intl,M,99.50,3",
+                "ARG-H-L,arg-home,Home Kit,Argentina,2024,HOME,intl,L,120.00,5",
+            )
+        sku = ProductSKU.objects.get(sku_code='ARG-H-M')
+        self.assertEqual((sku.price, sku.stock_quantity), (Decimal('99.50'), 3))
+        self.assertEqual(Product.objects.count(), 1)
+        self.assertEqual(Product.objects.get().name, 'Home Kit')
+
+    def test_held_stock_is_not_resold(self):
+        self.run_import("ARG-H-M,arg-home,Home,Argentina,2024,HOME,intl,M,120.00,10")
+        user = User.objects.create_user(username="holder", password="password123")
+        reserve_stock(user, [(ProductSKU.objects.get().pk, 4)])
+        self.run_import("ARG-H-M,arg-home,Home,Argentina,2024,HOME,intl,M,120.00,10")
+        self.assertEqual(ProductSKU.objects.get().stock_quantity, 6)
+
+    def test_adopts_hand_made_product(self):
+        sku = make_sku(stock=1)
+        ProductSKU.objects.filter(pk=sku.pk).update(sku_code='ARG-H-M')
+        self.run_import("ARG-H-M,arg-home,Home,Argentina,2024,HOME,intl,M,120.00,10")
+        sku.refresh_from_db()
+        self.assertEqual(Product.objects.count(), 1)
+        self.assertEqual(sku.product.slug, 'arg-home')
+
+    def test_feed_only_owns_the_optional_columns_it_carries(self):
+        self.run_import("ARG-H-M,arg-home,Home,Argentina,2024,HOME,club-jerseys,M,120.00,10")
+        Category.objects.filter(slug='club-jerseys').update(name="Club Jerseys!")
+        Product.objects.filter(slug='arg-home').update(description="Hand written", is_active=False)
+
+        self.run_import("ARG-H-M,arg-home,Home,Argentina,2024,HOME,club-jerseys,M,110.00,10")
+        product = Product.objects.select_related('category').get(slug='arg-home')
+        self.assertEqual(
+            (product.category.name, product.description, product.is_active, product.min_price),
+            ("Club Jerseys!", "Hand written", False, Decimal('110.00')),
+        )
+
+        self.run_import(
+            "ARG-H-M,arg-home,Home,Argentina,2024,HOME,club-jerseys,M,110.00,10,Clubs,From feed,yes",
+            header=FEED_HEADER.strip() + ",category_name,description,is_active\n",
+        )
+        product = Product.objects.select_related('category').get(slug='arg-home')
+        self.assertEqual((product.category.name, product.description, product.is_active),
+                         ("Clubs", "From feed", True))
+
+    def test_dry_run_writes_nothing_and_lists_changes(self):
+        self.run_import("ARG-H-M,arg-home,Home,Argentina,2024,HOME,intl,M,120.00,10")
+        out = self.run_import(
+            "ARG-H-M,arg-home,Home,Argentina,2024,HOME,intl,M,110.00,10",
+            "ARG-H-S,arg-home,Home,Argentina,2024,HOME,intl,S,120.00,10",
+            dry_run=True,
+        )
+        self.assertIn("~ ARG-H-M: price '120.00' -> '110.00'", out)
+        self.assertIn("+ ARG-H-S", out)
+        self.assertIn("1 new, 1 changed", out)
+        self.assertEqual(ProductSKU.objects.get().price, Decimal('120.00'))
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_TOKEN="", METRICS_DUPLICATE_QUERY_THRESHOLD=5)
+class RequestMetricsTest(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.addCleanup(metrics.registry.reset)
+
+    def test_records_route_queries_and_exports_prometheus(self):
+        make_sku(stock=5)
+        response = self.client.get('/api/products/')
+        self.assertIn('queries"', response['Server-Timing'])
+
+        text = self.client.get('/api/metrics/').content.decode()
+        self.assertIn('store_http_requests_total{route="product-list",method="GET",status="2xx"} 1', text)
+        self.assertIn('store_db_queries_per_request_count{route="product-list",method="GET"} 1', text)
+        self.assertIn('store_db_duplicate_query_requests_total{route="product-list",method="GET"} 0', text)
+
+    def test_flags_repeated_statements(self):
+        def n_plus_one(request):
+            for pk in range(6):
+                list(Product.objects.filter(pk=pk))
+            return HttpResponse()
+
+        request = RequestFactory().get('/api/products/')
+        with self.assertLogs('store.metrics', 'WARNING'):
+            metrics.MetricsMiddleware(n_plus_one)(request)
+        self.assertEqual(metrics.registry.routes[('unmatched', 'GET')].duplicate_requests, 1)
+
+    async def test_async_requests_count_queries_run_through_sync_to_async(self):
+        async def view(request):
+            await sync_to_async(list)(Product.objects.all())
+            return HttpResponse()
+
+        middleware = metrics.MetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(RequestFactory().get('/api/products/'))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+        self.assertEqual(metrics.registry.routes[('unmatched', 'GET')].queries.sum, 1)
+
+    def test_streaming_responses_are_measured_once_consumed(self):
+        def rows():
+            for pk in range(3):
+                yield str(len(Product.objects.filter(pk=pk)))
+
+        response = metrics.MetricsMiddleware(lambda request: StreamingHttpResponse(rows()))(
+            RequestFactory().get('/api/exports/orders/'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(metrics.registry.routes, {})
+        self.assertEqual(b''.join(response.streaming_content), b'000')
+        stats = metrics.registry.routes[('unmatched', 'GET')]
+        self.assertEqual((stats.latency.total, stats.queries.sum), (1, 3))
+
+    @override_settings(METRICS_TOKEN="scrape-me")
+    def test_endpoint_requires_token_when_configured(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 401)
+        response = self.client.get('/api/metrics/', headers={'Authorization': 'Bearer scrape-me'})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_endpoint_hidden_when_disabled(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 404)
+
+
+class ImageRenditionTest(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def upload(self, name, size=(1000, 1200), mode='RGBA'):
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new(mode, size, (200, 30, 30, 128) if mode == 'RGBA' else (200, 30, 30)).save(buffer, 'PNG')
+        return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+    def test_renditions_built_on_save_and_served_with_the_catalog(self):
+        sku = make_sku(stock=5)
+        sku.image = self.upload('products/kit.png')
+        sku.save()
+
+        sku.refresh_from_db()
+        renditions = sku.image_renditions
+        self.assertEqual(renditions['source'], 'products/kit.png')
+        self.assertEqual((renditions['card']['width'], renditions['card']['height']), (400, 480))
+        self.assertEqual(renditions['zoom']['width'], 1000)  # never upscaled
+        self.assertEqual(renditions['card']['webp'], 'products/renditions/kit.png-card.webp')
+        self.assertTrue(default_storage.exists(renditions['detail']['jpeg']))
+
+        product = self.client.get('/api/products/').data['results'][0]
+        self.assertTrue(product['image_renditions']['card']['webp'].startswith('http://testserver/media/'))
+        self.assertEqual(product['image_renditions']['srcset']['jpeg'].count('w,'), 2)
+
+    def test_backfill_command_fills_bulk_imported_skus(self):
+        sku = make_sku(stock=5)
+        ProductSKU.objects.filter(pk=sku.pk).update(image=self.upload('products/bulk.png', mode='RGB'))
+
+        call_command('generate_renditions', stdout=io.StringIO())
+        sku.refresh_from_db()
+        self.assertEqual(sku.image_renditions['source'], 'products/bulk.png')
+
+        with self.assertNumQueries(1):  # everything current: read only
+            call_command('generate_renditions', stdout=io.StringIO())
+
+    def test_clearing_the_image_clears_renditions(self):
+        sku = make_sku(stock=5)
+        sku.image = self.upload('products/gone.png')
+        sku.save()
+        old = sku.image_renditions['card']['webp']
+        sku.image = None
+        with self.captureOnCommitCallbacks(execute=True):
+            sku.save()
+        sku.refresh_from_db()
+        self.assertEqual(sku.image_renditions, {})
+        self.assertFalse(default_storage.exists(old))
+
+    def test_same_name_in_another_format_gets_its_own_renditions(self):
+        png, jpeg = make_sku(stock=5), make_sku(stock=5, size="L")
+        png.image = self.upload('products/messi.png')
+        png.save()
+        jpeg.image = self.upload('products/messi.jpg')
+        jpeg.save()
+        self.assertNotEqual(png.image_renditions['card']['webp'], jpeg.image_renditions['card']['webp'])
+        self.assertTrue(default_storage.exists(png.image_renditions['card']['webp']))
+
+    def test_replaced_images_lose_their_renditions_unless_shared(self):
+        sku, twin = make_sku(stock=5), make_sku(stock=5, size="L")
+        shared = self.upload('products/shared.png')
+        for each in (sku, twin):
+            each.image = shared
+            each.save()
+        shared_card = sku.image_renditions['card']['jpeg']
+
+        sku.image = self.upload('products/own.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            sku.save()
+        self.assertTrue(default_storage.exists(shared_card))  # twin still shows it
+        own_card = sku.image_renditions['card']['jpeg']
+
+        sku.image = self.upload('products/newer.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            sku.save()
+        self.assertFalse(default_storage.exists(own_card))
+        self.assertTrue(default_storage.exists(sku.image_renditions['card']['jpeg']))
+
+
+class ProductSummaryTest(TestCase):
+    def summary(self, product):
+        product.refresh_from_db()
+        return product.min_price, product.max_price, product.total_stock, product.main_image
+
+    def test_sku_hooks_keep_summary_current(self):
+        sku = make_sku(stock=5, price="120.00")
+        product = sku.product
+        self.assertEqual(self.summary(product), (Decimal('120.00'), Decimal('120.00'), 5, ''))
+
+        ProductSKU.objects.create(product=product, size="L", price="90.00", stock_quantity=2,
+                                  image="products/kit.png")
+        self.assertEqual(self.summary(product), (Decimal('90.00'), Decimal('120.00'), 7, 'products/kit.png'))
+
+        sku.delete()
+        self.assertEqual(self.summary(product), (Decimal('90.00'), Decimal('90.00'), 2, 'products/kit.png'))
+
+    def test_reservations_move_total_stock(self):
+        sku = make_sku(stock=5)
+        user = User.objects.create_user(username="holder", password="password123")
+        reservations = reserve_stock(user, [(sku.pk, 3)])
+        self.assertEqual(self.summary(sku.product)[2], 2)
+        release_reservations(reservations)
+        self.assertEqual(self.summary(sku.product)[2], 5)
+
+    def test_rebuild_command_fixes_drift(self):
+        sku = make_sku(stock=5)
+        Product.objects.update(total_stock=99, min_price=None)
+        call_command('rebuild_product_summaries', stdout=io.StringIO())
+        self.assertEqual(self.summary(sku.product)[:3], (Decimal('120.00'), Decimal('120.00'), 5))
+
+    def test_price_sort_and_stock_filter_read_only_the_product_table(self):
+        make_sku(stock=0, price="50.00")
+        make_sku(stock=3, price="80.00")
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/products/', {'ordering': '-price', 'in_stock': 'true'})
+        self.assertEqual([p['min_price'] for p in response.data['results']], ['80.00'])
+        page_query = next(q['sql'] for q in captured if 'LIMIT' in q['sql'])
+        self.assertNotIn('store_productsku', page_query)
+
+
+@override_settings(CART_STORAGE='cache')
+class CacheCartStoreTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sku = make_sku(stock=10, price="100.00")
+        self.user = User.objects.create_user(username="fan", password="pass")
+        self.client = APIClient()
+
+    def add(self, client=None, **data):
+        return (client or self.client).post(
+            '/api/cart/add_item/', {'sku_id': self.sku.pk, 'quantity': 1, **data}, format='json'
+        )
+
+    def test_adding_lines_never_writes_to_the_database(self):
+        self.client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as captured:
+            self.add(quantity=2)
+            self.add(quantity=1)
+            self.add(custom_name=" messi ", custom_number="10")
+        self.assertFalse([q for q in captured if not q['sql'].startswith('SELECT')])
+
+        cart = self.client.get('/api/cart/my_cart/').data
+        self.assertEqual(
+            sorted((item['quantity'], item['custom_name'], item['total_item_price']) for item in cart['items']),
+            [(1, "MESSI", Decimal("115.00")), (3, "", Decimal("300.00"))],
+        )
+        self.assertEqual(cart['total_price'], Decimal("415.00"))
+        self.assertFalse(CartItem.objects.exists())
+
+        line = next(item for item in cart['items'] if item['custom_name'] == "MESSI")
+        self.assertEqual(self.client.delete(f"/api/cart_items/{line['id']}/").status_code, 204)
+        self.assertEqual(len(self.client.get('/api/cart/my_cart/').data['items']), 1)
+
+    def test_guest_cart_merges_on_login(self):
+        guest = APIClient()
+        token = self.add(guest, quantity=2)['X-Cart-Token']
+        guest.credentials(HTTP_X_CART_TOKEN=token)
+        self.add(guest)
+        self.assertEqual(guest.get('/api/cart/my_cart/').data['items'][0]['quantity'], 3)
+
+        self.client.force_authenticate(self.user)
+        self.add()
+        self.client.credentials(HTTP_X_CART_TOKEN=token)
+        items = self.client.get('/api/cart/my_cart/').data['items']
+        self.assertEqual([item['quantity'] for item in items], [4])
+        self.assertEqual(guest.get('/api/cart/my_cart/').data['items'], [])
+
+    @mock.patch('store.views.stripe.checkout.Session.retrieve')
+    @mock.patch('store.views.stripe.checkout.Session.create')
+    def test_checkout_persists_lines_and_order_empties_the_cart(self, create, retrieve):
+        self.client.force_authenticate(self.user)
+        self.add(quantity=2)
+        create.return_value = mock.Mock(id="cs_cache", url="https://stripe.test/cs_cache")
+        self.assertEqual(self.client.post('/api/payment/create-checkout-session/').status_code, 200)
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(list(cart.items.values_list('quantity', flat=True)), [2])
+
+        retrieve.return_value = mock.Mock(
+            id="cs_cache", payment_status="paid", amount_total=21000,
+            metadata={"is_instant": "false", "cart_id": str(cart.id), "user_id": str(self.user.id)},
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/payment/verify-payment/', {'session_id': "cs_cache"}, format='json')
+        self.assertEqual(self.client.get('/api/cart/my_cart/').data['items'], [])
+
+
+
+class CartAddItemTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sku = make_sku(stock=10, price="100.00")
+        self.other = make_sku(stock=10, price="50.00", size="L")
+        self.user = User.objects.create_user(username="fan", password="pass")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add(self, client=None, key=None, **data):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        payload = data or {'sku_id': self.sku.pk, 'quantity': 1}
+        return (client or self.client).post('/api/cart/add_item/', payload, format='json', **headers)
+
+    def lines(self):
+        return sorted(CartItem.objects.values_list('sku_id', 'quantity', 'custom_name', 'custom_number'))
+
+    def test_increments_in_place_and_blank_name_matches_null(self):
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, sku=self.sku, quantity=1, custom_name=None)
+        self.add()
+        self.add(sku_id=self.sku.pk, quantity=-1)
+        self.assertEqual(self.lines(), [(self.sku.pk, 1, None, None)])
+        self.add(sku_id=self.sku.pk, quantity=-5)
+        self.assertEqual(self.lines(), [])
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CartItem.objects.bulk_create([CartItem(cart=cart, sku=self.sku, custom_name=name) for name in ('', None)])
+
+    def test_batch_adds_all_lines_or_none(self):
+        response = self.add(items=[
+            {'sku_id': self.sku.pk, 'quantity': 2},
+            {'sku_id': self.other.pk, 'quantity': 1, 'custom_name': 'messi', 'custom_number': '10'},
+            {'sku_id': self.sku.pk, 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(self.lines(), [(self.sku.pk, 3, '', None), (self.other.pk, 1, 'MESSI', 10)])
+
+        response = self.add(items=[{'sku_id': self.sku.pk, 'quantity': 1}, {'sku_id': 999999, 'quantity': 1}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.add(items=[]).status_code, 400)
+        self.assertEqual(self.lines()[0][1], 3)
+
+    def test_idempotency_key_replays_instead_of_adding_twice(self):
+        first = self.add(key="retry-1")
+        again = self.add(key="retry-1")
+        self.assertEqual((first.status_code, again.status_code), (201, 201))
+        self.assertEqual(again['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.lines(), [(self.sku.pk, 1, '', None)])
+
+        different = self.add(key="retry-1", sku_id=self.other.pk, quantity=1)
+        self.assertEqual(different.status_code, 422)
+        self.assertEqual(self.add(key="retry-2").status_code, 201)
+        self.assertEqual(self.lines(), [(self.sku.pk, 2, '', None)])
+
+    def test_failed_request_releases_the_key(self):
+        self.assertEqual(self.add(key="bad", sku_id=999999, quantity=1).status_code, 400)
+        self.assertEqual(self.add(key="bad", sku_id=999999, quantity=1).status_code, 400)
+
+    def test_guest_retry_gets_the_same_cart_token(self):
+        guest = APIClient()
+        token = self.add(guest, key="guest-1")['X-Cart-Token']
+        self.assertEqual(self.add(guest, key="guest-1")['X-Cart-Token'], token)
+        guest.credentials(HTTP_X_CART_TOKEN=token)
+        self.assertEqual(guest.get('/api/cart/my_cart/').data['items'][0]['quantity'], 1)
+
+
+class CartAddConcurrencyTest(TransactionTestCase):
+    """Tabs adding the same jersey at once must all count, in one row."""
+
+    TABS = 10
+
+    def test_concurrent_adds_all_land(self):
+        user = User.objects.create_user(username="fan", password="pass")
+        sku = make_sku(stock=50)
+        Cart.objects.create(user=user)
+        start = threading.Barrier(self.TABS)
+
+        def add():
+            start.wait()
+            try:
+                while True:
+                    try:
+                        OrmCartStore(user).add(sku.id, 1)
+                        return
+                    except OperationalError:
+                        # The shared in-memory SQLite test database reports
+                        # "table is locked" instead of waiting; retry like a client would.
+                        time.sleep(0.001)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=add) for _ in range(self.TABS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(list(CartItem.objects.values_list('quantity', flat=True)), [self.TABS])
+
+
+class CachedJWTAuthenticationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="fan", password="pass")
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+
+    def test_user_and_profile_come_from_the_cache(self):
+        with self.assertNumQueries(1):  # user and profile in one query
+            self.client.get('/api/me/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/me/')
+        self.assertEqual((response.data['username'], response.data['profile']['tier']), ("fan", "Bronze"))
+
+    def test_saves_and_loyalty_updates_invalidate(self):
+        self.client.get('/api/me/')
+        profile = Profile.objects.get(user=self.user)
+        profile.city = "Rosario"
+        profile.save()
+        self.assertEqual(self.client.get('/api/me/').data['profile']['city'], "Rosario")
+
+        Order.objects.create(user=self.user, total_amount=Decimal("600.00"), status='PAID')
+        call_command('update_loyalty', stdout=io.StringIO())
+        self.assertEqual(self.client.get('/api/me/').data['profile']['tier'], "Silver")
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/me/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cache_holds_no_password_hash(self):
+        self.client.get('/api/me/')
+        entry = cache.get(user_cache_key(self.user.pk))
+        self.assertNotIn('password', entry['user'])
+        self.assertNotIn(self.user.password, pickle.dumps(entry).decode('latin-1'))
+
+        # The rebuilt user loads what was left out, and saves only what it has
+        token = RefreshToken.for_user(self.user).access_token
+        cached = CachedJWTAuthentication().get_user(token)
+        self.assertEqual(cached.profile.tier, "Bronze")
+        self.assertTrue(cached.check_password("pass"))
+        cached.email = "fan@example.com"
+        cached.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.email, "fan@example.com")
+        self.assertTrue(self.user.check_password("pass"))
+
+    @mock.patch.object(jwt_settings, 'CHECK_REVOKE_TOKEN', True)
+    def test_password_change_revokes_cached_tokens(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+        self.assertEqual(self.client.get('/api/me/').status_code, status.HTTP_200_OK)
+        self.user.set_password("new-pass")
+        self.user.save()
+        self.assertEqual(self.client.get('/api/me/').status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class LoyaltyTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="fan", password="pass")
+        self.other = User.objects.create_user(username="casual", password="pass")
+
+    def order(self, user, total, status='PAID'):
+        return Order.objects.create(user=user, total_amount=Decimal(total), status=status,
+                                    transaction_id=f"cs_{time.time_ns()}")
+
+    def profile(self, user):
+        return Profile.objects.values_list('points', 'tier').get(user=user)
+
+    def test_user_saves_never_touch_the_profile(self):
+        with self.assertNumQueries(1):
+            self.user.save()
+        with self.assertNumQueries(1):
+            self.user.save(update_fields=['last_login'])  # what every login does
+
+    def test_checkout_adds_no_loyalty_queries(self):
+        sku = make_sku(stock=5)
+        with CaptureQueriesContext(connection) as captured:
+            create_order_from_session("cs_loyal", 13000, {'is_instant': 'true', 'sku_id': str(sku.pk)}, self.user)
+        self.assertFalse([q for q in captured if 'loyalty' in q['sql'] or 'store_profile' in q['sql']])
+
+    def test_command_awards_reverses_and_sets_tiers(self):
+        self.order(self.user, "450.99")
+        self.order(self.user, "120.00", status='SHIPPED')
+        cancelled = self.order(self.user, "1500.00")
+        self.order(self.other, "99.00", status='PENDING')
+
+        call_command('update_loyalty', stdout=io.StringIO())
+        self.assertEqual(self.profile(self.user), (2070, 'Gold'))
+        self.assertEqual(self.profile(self.other), (0, 'Bronze'))
+
+        Order.objects.filter(pk=cancelled.pk).update(status='CANCELLED')
+        call_command('update_loyalty', stdout=io.StringIO())
+        call_command('update_loyalty', stdout=io.StringIO())  # nothing new: no double counting
+        self.assertEqual(self.profile(self.user), (570, 'Silver'))
+        self.assertEqual(
+            sorted(LoyaltyEntry.objects.values_list('reason', 'points')),
+            [('ORDER', 120), ('ORDER', 450), ('ORDER', 1500), ('REVERSAL', -1500)],
+        )
+
+    def test_tiers_are_recomputed_in_one_update(self):
+        Profile.objects.filter(user=self.user).update(points=2500)
+        Profile.objects.filter(user=self.other).update(points=10, tier='Gold')
+        with self.assertNumQueries(1):
+            self.assertEqual(refresh_tiers(), 2)
+        self.assertEqual(self.profile(self.user), (2500, 'Gold'))
+        self.assertEqual(self.profile(self.other), (10, 'Bronze'))
+
+
+class SalesRollupTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="fan", password="pass")
+        self.medium = make_sku(stock=20, price="100.00")
+        self.large = make_sku(stock=20, price="80.00", size="L")
+
+    def buy(self, session_id, sku, qty=1, amount=None):
+        metadata = {'is_instant': 'true', 'sku_id': str(sku.pk), 'qty': str(qty)}
+        amount = amount if amount is not None else int(Decimal(sku.price) * qty * 100) + 1000
+        return create_order_from_session(session_id, amount, metadata, self.user)[0]
+
+    def rollups(self):
+        return (
+            sorted(DailySales.objects.values_list('day', 'orders', 'revenue')),
+            sorted(DailySkuSales.objects.values_list('day', 'sku_id', 'team', 'size', 'units', 'revenue')),
+        )
+
+    def test_orders_update_rollups_and_rebuild_agrees(self):
+        self.buy("cs_1", self.medium, qty=2)
+        self.buy("cs_2", self.medium)
+        self.buy("cs_3", self.large)
+        self.buy("cs_1", self.medium, qty=2)  # a retry: no new order, nothing counted twice
+
+        today = timezone.localdate()
+        incremental = self.rollups()
+        self.assertEqual(incremental[0], [(today, 3, Decimal("410.00"))])
+        self.assertEqual(incremental[1], [
+            (today, self.medium.pk, "Team", "M", 3, Decimal("300.00")),
+            (today, self.large.pk, "Team", "L", 1, Decimal("80.00")),
+        ])
+
+        call_command('rebuild_sales_rollups', stdout=io.StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_rebuild_drops_cancelled_orders(self):
+        self.buy("cs_1", self.medium)
+        cancelled = self.buy("cs_2", self.large)
+        Order.objects.filter(pk=cancelled.pk).update(status='CANCELLED')
+        call_command('rebuild_sales_rollups', since=str(timezone.localdate()), stdout=io.StringIO())
+        daily, skus = self.rollups()
+        self.assertEqual([(orders, revenue) for _, orders, revenue in daily], [(1, Decimal("110.00"))])
+        self.assertEqual([sku_id for _, sku_id, *_ in skus], [self.medium.pk])
+
+    def test_staff_endpoint_reads_only_the_rollups(self):
+        self.buy("cs_1", self.medium, qty=2)
+        self.buy("cs_2", self.large)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get('/api/analytics/sales/').status_code, 403)
+
+        staff = User.objects.create_user(username="boss", password="pass", is_staff=True)
+        client.force_authenticate(staff)
+        with CaptureQueriesContext(connection) as captured:
+            by_day = client.get('/api/analytics/sales/').data['results']
+            by_sku = client.get('/api/analytics/sales/', {'group': 'sku'}).data['results']
+            by_size = client.get('/api/analytics/sales/', {'group': 'size'}).data['results']
+        self.assertFalse([q for q in captured if 'store_order' in q['sql']])
+        self.assertEqual(by_day[0]['orders'], 2)
+        self.assertEqual([(row['sku_id'], row['units']) for row in by_sku], [(self.medium.pk, 2), (self.large.pk, 1)])
+        self.assertEqual(by_sku[0]['product_name'], self.medium.product.name)
+        self.assertEqual([row['size'] for row in by_size], ["M", "L"])
+        self.assertEqual(client.get('/api/analytics/sales/', {'group': 'week'}).status_code, 400)
+        self.assertEqual(client.get('/api/analytics/sales/', {'from': 'soon'}).status_code, 400)
+
+
+class ProductSearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.intl = Category.objects.create(name="International", slug="intl")
+        self.clubs = Category.objects.create(name="Club Teams", slug="clubs")
+        self.home = self.product("Argentina Home Jersey", "Argentina", "2024", "Three stars", self.intl)
+        self.away = self.product("Away Jersey", "Argentina", "2024", "Blue", self.intl)
+        self.madrid = self.product("Home Jersey", "Real Madrid", "24/25", "Argentina legend edition", self.clubs)
+        self.hidden = self.product("Argentina Retro", "Argentina", "1986", "Archive", self.intl, is_active=False)
+
+    def product(self, name, team, season, description, category, is_active=True):
+        return Product.objects.create(category=category, name=name, team=team, season=season,
+                                      description=description, is_active=is_active)
+
+    def test_ranked_prefix_results_skip_inactive(self):
+        ids, corrected = search_products("argentina")
+        self.assertIsNone(corrected)
+        self.assertEqual(ids[0], self.home.pk)  # name and team beat a description mention
+        self.assertEqual(set(ids), {self.home.pk, self.away.pk, self.madrid.pk})
+        self.assertEqual(search_products("arg aw")[0], [self.away.pk])
+        self.assertEqual(search_products("arg ho")[0], [self.home.pk, self.madrid.pk])
+        self.assertEqual(search_products("real mad")[0], [self.madrid.pk])
+        self.assertIn(self.hidden.pk, search_products("retro", active_only=False)[0])
+        self.assertEqual(search_products('"); DROP TABLE store_product; --')[0], [])
+
+    def test_typos_are_corrected(self):
+        ids, corrected = search_products("argentnia away")
+        self.assertEqual((ids, corrected), ([self.away.pk], "argentina away"))
+        self.assertEqual(search_products("zzzzzz"), ([], None))
+        # Only the bucket the typo fell in is cached, not the whole vocabulary
+        bucket = cache.get(f"search:terms:{get_catalog_version()}:a:9")
+        self.assertIn("argentina", bucket)
+        self.assertTrue(all(term[0] == "a" and 7 <= len(term) <= 11 for term in bucket))
+
+    def test_index_follows_product_and_category_writes(self):
+        self.away.name = "Goalkeeper Shirt"
+        self.away.save()
+        self.assertEqual(search_products("goalkeeper")[0], [self.away.pk])
+        self.intl.name = "Selecciones"
+        self.intl.save()
+        self.assertEqual(set(search_products("selecciones")[0]), {self.home.pk, self.away.pk})
+        self.away.delete()
+        self.assertEqual(search_products("goalkeeper")[0], [])
+        self.assertEqual(rebuild_index(), 3)
+
+    def test_search_endpoint(self):
+        response = self.client.get('/api/products/search/', {'q': 'argentina hom', 'autocomplete': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [
+            {'id': self.home.pk, 'name': "Argentina Home Jersey", 'team': "Argentina", 'season': "2024"},
+            {'id': self.madrid.pk, 'name': "Home Jersey", 'team': "Real Madrid", 'season': "24/25"},
+        ])
+        full = self.client.get('/api/products/search/', {'q': 'madird'}).json()
+        self.assertEqual(full['corrected'], "madrid")
+        self.assertEqual([row['id'] for row in full['results']], [self.madrid.pk])
+        self.assertEqual(full['results'][0]['category_name'], "Club Teams")
+        self.assertEqual(self.client.get('/api/products/search/').json()['results'], [])
+
+    def test_admin_search_uses_the_index(self):
+        staff = User.objects.create_superuser(username="admin", password="pass", email="a@example.com")
+        self.client.force_login(staff)
+        response = self.client.get(reverse('admin:store_product_changelist'), {'q': 'retro'})
+        self.assertEqual(list(response.context['cl'].result_list), [self.hidden])
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username="boss", password="pass", is_staff=True)
+        self.fan = User.objects.create_user(username="fan", password="pass", email="fan@example.com")
+        self.sku = make_sku(stock=10, price="100.00")
+        ProductSKU.objects.filter(pk=self.sku.pk).update(sku_code="DROP-M")
+        self.order = Order.objects.create(user=self.fan, total_amount=Decimal("230.00"), status='PAID')
+        OrderItem.objects.create(order=self.order, sku=self.sku, product_name="Drop Jersey",
+                                 price_at_purchase=Decimal("115.00"), quantity=2, custom_name="MESSI",
+                                 custom_number=10)
+        self.empty = Order.objects.create(user=self.fan, total_amount=Decimal("0.00"))
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def download(self, dataset, **params):
+        response = self.client.get(f'/api/exports/{dataset}/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_orders_csv_has_a_row_per_line(self):
+        response, body = self.download('orders')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment; filename="orders-', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual([row['order_id'] for row in rows], [str(self.order.pk), str(self.empty.pk)])
+        self.assertEqual(
+            (rows[0]['email'], rows[0]['sku_code'], rows[0]['quantity'], rows[0]['price_at_purchase'],
+             rows[0]['custom_name']),
+            ("fan@example.com", "DROP-M", "2", "115.00", "MESSI"),
+        )
+        self.assertEqual(rows[1]['item_id'], "")
+
+    def test_gzipped_jsonl_and_filters(self):
+        Newsletter.objects.create(email="a@example.com")
+        Newsletter.objects.create(email="b@example.com")
+        response, body = self.download('newsletter', **{'as': 'jsonl', 'gzip': 'true'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = [json.loads(line) for line in gzip.decompress(body).splitlines()]
+        self.assertEqual([line['email'] for line in lines], ["a@example.com", "b@example.com"])
+
+        tomorrow = (timezone.localdate() + timedelta(days=1)).isoformat()
+        self.assertEqual(self.download('newsletter', since=tomorrow)[1], b"email,subscribed_at\r\n")
+        self.assertEqual(self.client.get('/api/exports/newsletter/', {'as': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/exports/users/').status_code, 404)
+
+    def test_staff_only(self):
+        self.client.force_authenticate(self.fan)
+        self.assertEqual(self.client.get('/api/exports/orders/').status_code, 403)
+
+    def test_csv_neutralises_formulas(self):
+        Order.objects.filter(pk=self.order.pk).update(shipping_address='=HYPERLINK("http://evil.example")',
+                                                      city="@SUM(A1)", zip_code="-1+1")
+        _, body = self.download('orders')
+        row = next(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual((row['shipping_address'], row['city'], row['zip_code']),
+                         ('\'=HYPERLINK("http://evil.example")', "'@SUM(A1)", "'-1+1"))
+        self.assertEqual(row['total_amount'], "230.00")
+
+        _, body = self.download('orders', **{'as': 'jsonl'})
+        self.assertEqual(json.loads(body.splitlines()[0])['city'], "@SUM(A1)")  # JSON is not evaluated
+
+    def test_since_starts_at_local_midnight(self):
+        start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        Order.objects.filter(pk=self.empty.pk).update(created_at=start - timedelta(microseconds=1))
+        Order.objects.filter(pk=self.order.pk).update(created_at=start)
+        _, body = self.download('orders', since=start.date().isoformat())
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual([row['order_id'] for row in rows], [str(self.order.pk)])
+
+    def test_rows_are_streamed_in_chunks(self):
+        Newsletter.objects.bulk_create([Newsletter(email=f"fan{i}@example.com") for i in range(5)])
+        with mock.patch('store.exports.ROWS_PER_WRITE', 2), self.settings(EXPORT_CHUNK_SIZE=2):
+            chunks = list(export_stream('newsletter'))
+        self.assertEqual(len(chunks), 4)  # header, 2 + 2 + 1 rows
+        self.assertEqual(b''.join(chunks).count(b"@example.com"), 5)
+
+    def test_command_writes_the_file(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'catalog.csv.gz')
+            call_command('export_data', 'catalog', '--gzip', '--output', path, stdout=io.StringIO())
+            with gzip.open(path, 'rt') as handle:
+                rows = list(csv.DictReader(handle))
+        self.assertEqual([(row['sku_code'], row['price']) for row in rows], [("DROP-M", "100.00")])
+
+
+class AdminChangelistTest(TestCase):
+    """Admin pages cost the same number of queries however many rows there are."""
+
+    def setUp(self):
+        self.staff = User.objects.create_superuser(username="admin", password="pass", email="a@example.com")
+        self.client.force_login(self.staff)
+
+    def add_rows(self):
+        fan = User.objects.create_user(username=f"fan{User.objects.count()}", password="pass")
+        sku = make_sku(stock=5)
+        order = Order.objects.create(user=fan, total_amount=Decimal("120.00"), status='PAID')
+        OrderItem.objects.create(order=order, sku=sku, product_name="Drop Jersey",
+                                 price_at_purchase=Decimal("120.00"), quantity=1)
+        cart = Cart.objects.create(user=fan)
+        CartItem.objects.create(cart=cart, sku=sku)
+        LoyaltyEntry.objects.create(user=fan, order=order, points=120)
+        return order, cart, sku
+
+    def queries(self, url, **params):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, url)
+        return captured
+
+    def test_query_counts_do_not_grow_with_rows(self):
+        order, cart, sku = self.add_rows()
+
+        def grow():
+            self.add_rows()
+            ProductSKU.objects.create(product=sku.product, size="L", price="120.00")
+            OrderItem.objects.create(order=order, sku=make_sku(stock=1), product_name="Drop Jersey",
+                                     price_at_purchase=Decimal("99.00"), quantity=1)
+            CartItem.objects.create(cart=cart, sku=make_sku(stock=1))
+
+        pages = [
+            reverse('admin:store_order_changelist'),
+            reverse('admin:store_cart_changelist'),
+            reverse('admin:store_product_changelist'),
+            reverse('admin:store_productsku_changelist'),
+            reverse('admin:store_loyaltyentry_changelist'),
+            reverse('admin:store_order_change', args=[order.pk]),
+            reverse('admin:store_cart_change', args=[cart.pk]),
+            reverse('admin:store_product_change', args=[sku.product_id]),
+        ]
+        cart_page = pages[6]
+        for url in pages:
+            self.queries(url)  # warm per-process caches (content types, permissions)
+        before = {url: len(self.queries(url)) for url in pages}
+        for _ in range(4):
+            grow()
+        for url in pages:
+            with self.subTest(url=url):
+                # The SKU autocomplete widget looks up each cart line's label
+                extra = 4 if url == cart_page else 0
+                self.assertEqual(len(self.queries(url)), before[url] + extra)
+
+    def test_changelists_count_once_and_searches_use_indexes(self):
+        self.add_rows()
+        captured = self.queries(reverse('admin:store_order_changelist'))
+        self.assertEqual(len([q for q in captured if 'COUNT(' in q['sql']]), 1)
+        order = Order.objects.get()
+        url = reverse('admin:store_order_changelist')
+        for term, expected in ((str(order.pk), [order]), ('fan', [order]), ('an', []), ('nobody', [])):
+            with self.subTest(term=term):
+                self.assertEqual(list(self.client.get(url, {'q': term}).context['cl'].result_list), expected)
+
+    def test_big_tables_use_the_planner_estimate(self):
+        for _ in range(3):
+            self.add_rows()
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        with mock.patch('store.admin.ESTIMATED_COUNT_THRESHOLD', 2):
+            captured = self.queries(reverse('admin:store_order_changelist'))
+            self.assertFalse([q for q in captured if 'COUNT(' in q['sql']])
+            # Filtered lists still count exactly
+            filtered = self.client.get(reverse('admin:store_order_changelist'), {'status__exact': 'PENDING'})
+        self.assertEqual(filtered.context['cl'].result_count, 0)
+
+
+class LeanRepresentationTest(TestCase):
+    """The .values() payloads must match the DRF serializers they stand in for."""
+
+    def setUp(self):
+        cache.clear()
+        self.request = RequestFactory().get('/api/products/')
+        self.sku = make_sku(stock=4, price="99.5")
+        make_sku(stock=0, price="120.00", size="L")
+        renditions = {'card': {'width': 400, 'height': 480, 'webp': 'products/renditions/kit-card.webp',
+                               'jpeg': 'products/renditions/kit-card.jpg'}}
+        ProductSKU.objects.filter(pk=self.sku.pk).update(
+            sku_code="ÉTÉ-M", image='products/kit.png', image_renditions=renditions
+        )
+        refresh_product_summaries()
+        Product.objects.create(category=self.sku.product.category, name="No SKUs", team="T",
+                               season="24/25", description="Empty \u2028 line")
+
+    def serialized_products(self):
+        products = (
+            Product.objects.select_related('category').order_by('id')
+            .prefetch_related(Prefetch('skus', queryset=ProductSKU.objects.order_by('id')))
+        )
+        return ProductSerializer(products, many=True, context={'request': self.request}).data
+
+    def test_products_match_product_serializer(self):
+        expected = self.serialized_products()
+        with self.assertNumQueries(2):
+            lean = represent_products(product_rows(Product.objects.order_by('id')), self.request)
+        self.assertEqual(lean, json.loads(json.dumps(expected)))
+        self.assertEqual(FastJSONRenderer().render(lean), JSONRenderer().render(expected))
+
+        response = self.client.get('/api/products/')
+        self.assertEqual(response.content, JSONRenderer().render({
+            'count': len(expected), 'next': None, 'previous': None, 'results': expected
+        }))
+        detail = self.client.get(f"/api/products/{self.sku.product_id}/")
+        self.assertEqual(detail.content, JSONRenderer().render(expected[0]))
+
+    def test_cart_matches_cart_serializer(self):
+        user = User.objects.create_user(username="fan", password="pass")
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, sku=self.sku, quantity=2, custom_name="MESSI", custom_number=10)
+        CartItem.objects.create(cart=cart, sku=self.sku, quantity=1)
+
+        cart = Cart.objects.prefetch_related(priced_items_prefetch(CartItem.objects.all())).get()
+        expected = JSONRenderer().render(CartSerializer(cart, context={'request': self.request}).data)
+        self.assertEqual(FastJSONRenderer().render(represent_cart(cart, self.request)), expected)
+
+        items = list(cart.items.select_related('sku').order_by('id'))  # priced in Python, like cache lines
+        self.assertEqual(
+            FastJSONRenderer().render(represent_cart_items(cart.id, items, self.request)), expected
+        )
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            'price': Decimal('12.50'), 'at': timezone.now(), 'day': timezone.now().date(),
+            'text': "Müller \u2028 \u2029", 'nested': [{1: None, 'ok': True}], 'float': 1.5,
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        with mock.patch('store.renderers.orjson', None):
+            self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(
+            FastJSONRenderer().render(data, 'application/json; indent=2'),
+            JSONRenderer().render(data, 'application/json; indent=2'),
+        )
+
+
+@mock.patch('store.routers.replica_available', return_value=True)
+class ReplicaRoutingTest(SimpleTestCase):
+    """Routing decisions only; QuerySet.db asks the router without touching a database."""
+
+    def test_catalog_reads_use_the_replica(self, _):
+        self.assertEqual(Product.objects.all().db, 'replica')
+        self.assertEqual(ProductSKU.objects.all().db, 'replica')
+        self.assertEqual(Cart.objects.all().db, 'default')
+        self.assertEqual(Order.objects.all().db, 'default')
+
+    def test_pinned_blocks_and_transactions_read_the_primary(self, _):
+        with use_primary():
+            self.assertEqual(Product.objects.all().db, 'default')
+        self.assertEqual(Product.objects.all().db, 'replica')
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            self.assertEqual(Product.objects.all().db, 'default')
+
+    def test_writes_and_migrations_stay_on_the_primary(self, _):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_write(Product), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'store'))
+        self.assertTrue(router.allow_migrate('default', 'store'))
+
+    def test_without_a_replica_nothing_changes(self, replica_available):
+        replica_available.return_value = False
+        self.assertEqual(Product.objects.all().db, 'default')
+
+
+class ReplicaDatabaseTest(TransactionTestCase):
+    """
+    Requests against a real `replica` alias: a second SQLite connection to
+    the test database, configured as its mirror the way REPLICA_DATABASE_URL
+    configures one. Committed rows (TransactionTestCase) are visible on both.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Added here rather than in `databases`: the test runner checks
+        # those aliases against settings before any test class runs.
+        primary = connections['default'].settings_dict
+        connections.settings[REPLICA_ALIAS] = {**primary, 'TEST': {**primary['TEST'], 'MIRROR': 'default'}}
+        cls.databases = {*cls.databases, REPLICA_ALIAS}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA_ALIAS].close()
+        del connections[REPLICA_ALIAS]
+        del connections.settings[REPLICA_ALIAS]
+        del cls.databases
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="fan", password="pass")
+        self.sku = make_sku(stock=5)
+        self.product = self.sku.product
+
+    def request(self, method, path, data=None, user=None):
+        """The response plus the SQL each alias ran while answering it."""
+        self.client.force_authenticate(user)
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA_ALIAS]) as replica:
+            response = getattr(self.client, method)(path, data, format='json')
+        return response, [q['sql'] for q in primary], [q['sql'] for q in replica]
+
+    def test_catalog_reads_use_the_replica(self):
+        response, primary, replica = self.request('get', '/api/products/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'][0]['id'], self.product.id)
+        self.assertTrue(any('store_product' in sql for sql in replica))
+        self.assertFalse(any('store_product' in sql for sql in primary))
+
+    @mock.patch('store.views.stripe.checkout.Session.create')
+    def test_cart_order_and_payment_views_stay_on_the_primary(self, create_session):
+        create_session.return_value = mock.Mock(id="cs_1", url="https://pay.example/cs_1")
+        for method, path, data in (
+            ('post', '/api/cart/add_item/', {'sku_id': self.sku.id, 'quantity': 1}),
+            ('get', '/api/cart/my_cart/', None),
+            ('get', '/api/orders/', None),
+            ('post', '/api/payment/create-checkout-session/', {'is_instant': True, 'sku_id': self.sku.id}),
+        ):
+            response, primary, replica = self.request(method, path, data, user=self.user)
+            self.assertLess(response.status_code, 400, path)
+            self.assertTrue(primary, path)
+            self.assertEqual(replica, [], path)
+
+    def test_product_writes_look_up_on_the_primary(self):
+        response, primary, replica = self.request('patch', f'/api/products/{self.product.pk}/', {'team': "Renamed"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(replica, [])
+
+        response, primary, replica = self.request('delete', f'/api/products/{self.product.pk}/')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(replica, [])
+        self.assertFalse(Product.objects.exists())
@@ -6,13 +6,25 @@ from .views import (
     NewsletterViewSet, 
     UserMeView, 
     PaymentView,
-    CartItemViewSet
+    CartItemViewSet,
+    OrderViewSet,
+    SalesAnalyticsView,
+    ExportView
 )
+from . import async_views
+from .metrics import metrics_view
 
 router = DefaultRouter()
 router.register(r'products', ProductViewSet, basename='product')
 router.register(r'cart', CartViewSet, basename='cart')
 router.register(r'newsletter', NewsletterViewSet, basename='newsletter')
+router.register(r'orders', OrderViewSet, basename='order')
+
+# Staff dashboard, read from the sales rollups
+router.register(r'analytics/sales', SalesAnalyticsView, basename='sales-analytics')
+
+# Staff CSV/JSONL downloads, streamed
+router.register(r'exports', ExportView, basename='export')
 
 # Matches frontend api/payment/
 router.register(r'payment', PaymentView, basename='payment')
@@ -25,4 +37,13 @@ urlpatterns = [
     
     # Custom dashboard endpoint
     path('me/', UserMeView.as_view({'get': 'list'}), name='user-me'),
+
+    # Prometheus scrape target (404 unless METRICS_ENABLED)
+    path('metrics/', metrics_view, name='metrics'),
+
+    # Async (ASGI) payment endpoints sharing one pooled HTTP client
+    path('async/payment/create-checkout-session/', async_views.create_checkout_session,
+         name='async-create-checkout-session'),
+    path('async/payment/verify-payment/', async_views.verify_payment, name='async-verify-payment'),
+    path('async/payment/esewa-status/', async_views.esewa_status, name='async-esewa-status'),
 ]
\ No newline at end of file
@@ -4,32 +4,123 @@ import hmac
 import hashlib
 import base64
 import json
-from decimal import Decimal
+from datetime import date
 from django.conf import settings
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.filters import SearchFilter
 
 # Import models
 from .models import (
-    Cart, Order, OrderItem, ProductSKU, 
-    Product, Newsletter, User, CartItem
+    Cart, Order, ProductSKU,
+    Product, Newsletter, CartItem, StockReservation, PaymentEvent
 )
 
+from .analytics import GROUPS, sales_report
+from .cache import CatalogCacheMixin
+from .routers import PrimaryDatabaseMixin, PrimaryForWritesMixin
+from .filters import TRUE_VALUES, CatalogFilterBackend
+from .pagination import CreatedCursorPagination
+from .pricing import cart_summary
+from .representations import (
+    cart_payload, product_rows, represent_cart, represent_cart_items, represent_products
+)
+from .search import search_products
+from .carts import (
+    CART_TOKEN_HEADER, OrmCartStore, get_cart_store, get_guest_cart_store,
+    new_cart_token, normalize_line, valid_cart_token
+)
+from .exports import DATASETS, FORMATS, export_filename, export_stream
+from .checkout import SHIPPING_COST, CheckoutError, prepare_checkout_session
+from .idempotency import idempotent
+from .inventory import OutOfStock, attach_session, release_reservations
+from .orders import create_order_from_session
+
 # Import serializers
 from .serializers import (
-    ProductSerializer, NewsletterSerializer, 
-    CartSerializer, UserSerializer
+    ProductSerializer, ProductRowSerializer, NewsletterSerializer,
+    CartSerializer, UserSerializer, OrderSerializer
 )
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
 
+MAX_CART_BATCH = 50
+
 # --- PRODUCT & NEWSLETTER ---
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(PrimaryForWritesMixin, CatalogCacheMixin, viewsets.ModelViewSet):
     queryset = Product.objects.filter(is_active=True)
     serializer_class = ProductSerializer
     permission_classes = [permissions.AllowAny]
+    # ?search= matches name, team and description (see CatalogFilterBackend for the rest)
+    filter_backends = [CatalogFilterBackend, SearchFilter]
+    search_fields = ['name', 'team', 'description']
+    read_actions = ('list', 'retrieve')
+
+    def get_queryset(self):
+        """
+        Catalog query plan: category is joined and SKUs come from one
+        prefetch, so a page of jerseys costs a fixed number of queries no
+        matter how many rows it holds. Price, stock and the main image are
+        read from the product row itself (see store/summaries.py).
+        Reads fetch plain rows for ProductRowSerializer instead of models.
+        """
+        queryset = super().get_queryset().order_by('id')
+        if self.action in self.read_actions:
+            return product_rows(queryset)
+        return (
+            queryset
+            .select_related('category')
+            .prefetch_related(Prefetch('skus', queryset=ProductSKU.objects.order_by('id')))
+        )
+
+    def get_serializer_class(self):
+        if self.action in self.read_actions:
+            return ProductRowSerializer
+        return ProductSerializer
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Ranked full-text search (store/search.py): ?q=arg hom, ?limit= (max 50).
+        ?autocomplete=true answers with just id/name/team/season for a dropdown.
+        """
+        return self.cached_response(self.search_results, request)
+
+    def search_results(self, request):
+        params = request.query_params
+        autocomplete = params.get('autocomplete', '').lower() in TRUE_VALUES
+        try:
+            limit = min(max(int(params.get('limit', 8 if autocomplete else 20)), 1), 50)
+        except ValueError:
+            limit = 20
+        query = params.get('q', '').strip()
+        ids, corrected = search_products(query, limit=limit)
+
+        rows = {row['id']: row for row in product_rows(Product.objects.filter(pk__in=ids))}
+        rows = [rows[pk] for pk in ids if pk in rows]
+        if autocomplete:
+            results = [{key: row[key] for key in ('id', 'name', 'team', 'season')} for row in rows]
+        else:
+            results = represent_products(rows, request)
+        return Response({"query": query, "corrected": corrected, "results": results})
+
+    @property
+    def paginator(self):
+        """
+        Page numbers (with a total count) by default, which the catalog grid
+        uses. ?paginate=cursor switches to keyset pages for infinite scroll;
+        those are always newest first and ignore ?ordering.
+        """
+        if not hasattr(self, '_paginator'):
+            if self.request.query_params.get('paginate') == 'cursor':
+                self._paginator = CreatedCursorPagination()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
 
 class NewsletterViewSet(viewsets.ModelViewSet):
     queryset = Newsletter.objects.all()
@@ -45,23 +136,61 @@ class UserMeView(viewsets.ViewSet):
         serializer = UserSerializer(request.user, context={'request': request})
         return Response(serializer.data)
 
-class CartViewSet(viewsets.ModelViewSet):
+class CartStoreMixin:
+    """
+    Resolves the cart store for a request (see store/carts.py): the
+    customer's cart when authenticated, merging in any guest cart named by
+    X-Cart-Token; otherwise the guest cart for that token.
+    """
+
+    def get_cart_store(self, create_guest=False):
+        request = self.request
+        token = request.headers.get(CART_TOKEN_HEADER, '')
+        token = token if valid_cart_token(token) else ''
+        if request.user.is_authenticated:
+            store = get_cart_store(request.user)
+            if token:
+                store.merge_from(get_guest_cart_store(token))
+            return store
+        if not token and create_guest:
+            token = new_cart_token()
+        self.guest_cart_token = token
+        return get_guest_cart_store(token) if token else None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if getattr(self, 'guest_cart_token', ''):
+            response[CART_TOKEN_HEADER] = self.guest_cart_token
+        return response
+
+class CartViewSet(PrimaryDatabaseMixin, CartStoreMixin, viewsets.ModelViewSet):
     serializer_class = CartSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # Guests can build a cart; checkout and everything else needs an account
+    guest_actions = ('list', 'my_cart', 'add_item')
+
+    def get_permissions(self):
+        if self.action in self.guest_actions:
+            return [permissions.AllowAny()]
+        return super().get_permissions()
 
     def get_queryset(self):
         return Cart.objects.filter(user=self.request.user)
 
+    def cart_data(self, store):
+        """Cart payload with every line priced: {id, items, total_price}."""
+        if store is None:
+            return cart_payload(None, [])
+        if isinstance(store, OrmCartStore):
+            return represent_cart(store.cart(), self.request)
+        return represent_cart_items(store.cart_id, store.items(), self.request)
+
     def list(self, request):
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        serializer = self.get_serializer(cart)
-        return Response(serializer.data)
+        return Response(self.cart_data(self.get_cart_store()))
 
     @action(detail=False, methods=['get'], url_path='my_cart')
     def my_cart(self, request):
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        serializer = self.get_serializer(cart)
-        return Response(serializer.data)
+        return Response(self.cart_data(self.get_cart_store()))
 
     @action(detail=True, methods=['patch'], url_path='update_shipping')
     def update_shipping(self, request, pk=None):
@@ -73,37 +202,128 @@ class CartViewSet(viewsets.ModelViewSet):
         return Response({"status": "shipping updated", "cart_id": cart.id}, status=status.HTTP_200_OK)
 
     @action(detail=False, methods=['post'], url_path='add_item')
+    @idempotent('cart.add_item')
     def add_item(self, request):
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        sku_id = request.data.get('sku_id')
-        quantity = int(request.data.get('quantity', 1))
-        custom_name = str(request.data.get('custom_name', '')).strip().upper()
-        custom_number = str(request.data.get('custom_number', '')).strip()
-
+        """
+        One line ({sku_id, quantity, custom_name, custom_number}) or several
+        as {"items": [...]}, added all or none. Retries are safe with an
+        Idempotency-Key header (see store/idempotency.py).
+        """
+        batch = request.data.get('items')
         try:
-            item, created = CartItem.objects.get_or_create(
-                cart=cart, 
-                sku_id=sku_id,
-                custom_name=custom_name,
-                custom_number=custom_number,
-                defaults={'quantity': quantity}
-            )
-            if not created:
-                item.quantity += quantity
-                item.save()
-            return Response({"message": "Item added to locker"}, status=status.HTTP_201_CREATED)
+            if batch is None:
+                lines = [self.parse_line(request.data)]
+            elif not isinstance(batch, list) or not 0 < len(batch) <= MAX_CART_BATCH:
+                raise ValueError(f"items must be a list of 1 to {MAX_CART_BATCH} lines")
+            else:
+                lines = [self.parse_line(line) for line in batch]
+            self.get_cart_store(create_guest=True).add_many(lines)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if batch is None:
+            return Response({"message": "Item added to locker"}, status=status.HTTP_201_CREATED)
+        return Response({"message": "Items added to locker", "count": len(lines)}, status=status.HTTP_201_CREATED)
+
+    @staticmethod
+    def parse_line(data):
+        if not isinstance(data, dict):
+            raise ValueError("Each line must be an object")
+        # custom_number is an integer column: a blank number means "no number"
+        custom_name, custom_number = normalize_line(data.get('custom_name', ''), data.get('custom_number', ''))
+        return data.get('sku_id'), int(data.get('quantity', 1)), custom_name, custom_number
 
-class CartItemViewSet(viewsets.ModelViewSet):
+class CartItemViewSet(PrimaryDatabaseMixin, CartStoreMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_permissions(self):
+        if self.action == 'destroy':
+            return [permissions.AllowAny()]
+        return super().get_permissions()
+
     def get_queryset(self):
         return CartItem.objects.filter(cart__user=self.request.user)
 
+    def destroy(self, request, pk=None):
+        store = self.get_cart_store()
+        try:
+            removed = store is not None and store.remove(int(pk))
+        except ValueError:
+            removed = False
+        if not removed:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+# --- ORDERS ---
+
+class OrderViewSet(PrimaryDatabaseMixin, viewsets.ReadOnlyModelViewSet):
+    """Order history for the logged-in customer, newest first."""
+    serializer_class = OrderSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = CreatedCursorPagination
+    filter_backends = [SearchFilter]
+    search_fields = ['transaction_id', 'items__product_name']
+
+    def get_queryset(self):
+        queryset = Order.objects.filter(user=self.request.user).prefetch_related('items')
+        order_status = self.request.query_params.get('status')
+        if order_status:
+            queryset = queryset.filter(status=order_status.upper())
+        return queryset
+
+class SalesAnalyticsView(viewsets.ViewSet):
+    """
+    Staff sales dashboard, read from the precomputed rollups (store/analytics.py).
+    ?group=day|sku|team|size  ?from=YYYY-MM-DD  ?to=YYYY-MM-DD (default: last 30 days)
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def list(self, request):
+        group = request.query_params.get('group', 'day')
+        if group not in GROUPS:
+            return Response({"error": f"group must be one of {', '.join(GROUPS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start, end = (
+                date.fromisoformat(request.query_params[name]) if request.query_params.get(name) else None
+                for name in ('from', 'to')
+            )
+        except ValueError:
+            return Response({"error": "from and to must be dates like 2026-01-31"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response({"group": group, "results": sales_report(group, start, end)})
+
+class ExportView(viewsets.ViewSet):
+    """
+    Staff data exports, streamed (store/exports.py): /api/exports/orders/,
+    /newsletter/ or /catalog/ with ?as=csv|jsonl ?gzip=true ?since=YYYY-MM-DD.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def retrieve(self, request, pk=None):
+        if pk not in DATASETS:
+            return Response({"error": f"export must be one of {', '.join(DATASETS)}"},
+                            status=status.HTTP_404_NOT_FOUND)
+        file_format = request.query_params.get('as', 'csv')
+        if file_format not in FORMATS:
+            return Response({"error": f"as must be one of {', '.join(FORMATS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            since = date.fromisoformat(request.query_params['since']) if request.query_params.get('since') else None
+        except ValueError:
+            return Response({"error": "since must be a date like 2026-01-31"}, status=status.HTTP_400_BAD_REQUEST)
+        compress = request.query_params.get('gzip', '').lower() in TRUE_VALUES
+
+        response = StreamingHttpResponse(
+            export_stream(pk, file_format, compress=compress, since=since),
+            content_type='application/gzip' if compress else f"{FORMATS[file_format]}; charset=utf-8",
+        )
+        response['Content-Disposition'] = f'attachment; filename="{export_filename(pk, file_format, compress)}"'
+        response['Cache-Control'] = 'no-store'
+        return response
+
 # --- PAYMENT ---
 
-class PaymentView(viewsets.ViewSet):
+class PaymentView(PrimaryDatabaseMixin, viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     @action(detail=True, methods=['get'], url_path='check-status')
@@ -122,75 +342,48 @@ class PaymentView(viewsets.ViewSet):
         Creates a Stripe Checkout Session for either 'Instant Buy' or 'Full Cart'.
         """
         try:
-            is_instant = request.data.get('is_instant', False)
-            shipping_cost = Decimal('10.00')
-            
-            if is_instant:
-                sku_id = request.data.get('sku_id')
-                if not sku_id:
-                    return Response({"error": "sku_id is required for instant purchase"}, status=400)
-                
-                sku = ProductSKU.objects.get(id=sku_id)
-                qty = int(request.data.get('qty', 1))
-                total_cents = int((Decimal(str(sku.price)) * qty + shipping_cost) * 100)
-                
-                metadata = {
-                    "sku_id": str(sku.id), 
-                    "qty": str(qty), 
-                    "is_instant": "true",
-                    "user_id": str(request.user.id)
-                }
-                line_item_name = f"Instant Purchase: {sku.product.name}"
-            else:
-                cart, _ = Cart.objects.get_or_create(user=request.user)
-                if not cart.items.exists():
-                    return Response({"error": "Locker is empty"}, status=400)
-                
-                total_val = Decimal(str(cart.get_total_price() or 0))
-                total_cents = int((total_val + shipping_cost) * 100)
-                metadata = {
-                    "is_instant": "false", 
-                    "cart_id": str(cart.id),
-                    "user_id": str(request.user.id)
-                }
-                line_item_name = "Jersey Arena - Locker Checkout"
-
-            session = stripe.checkout.Session.create(
-                payment_method_types=['card'],
-                line_items=[{
-                    'price_data': {
-                        'currency': 'usd', 
-                        'product_data': {'name': line_item_name}, 
-                        'unit_amount': total_cents
-                    }, 
-                    'quantity': 1
-                }],
-                mode='payment',
-                metadata=metadata,
-                success_url=f"{settings.CLIENT_URL}/success?session_id={{CHECKOUT_SESSION_ID}}",
-                cancel_url=f"{settings.CLIENT_URL}/cart",
-            )
+            params, reservations = prepare_checkout_session(request.user, request.data)
+            try:
+                session = stripe.checkout.Session.create(**params)
+            except Exception:
+                release_reservations(reservations)
+                raise
+            attach_session(reservations, session.id)
             return Response({'url': session.url})
-            
-        except ProductSKU.DoesNotExist:
-            return Response({"error": "Product SKU not found"}, status=404)
+
+        except CheckoutError as e:
+            return Response(e.as_response_data(), status=e.status_code)
+        except OutOfStock as e:
+            return Response({"error": "Not enough stock for this size", "sku_id": e.sku_id}, status=409)
         except Exception as e:
             print(f"STRIPE ERROR: {str(e)}")
             return Response({"error": "Failed to create payment session"}, status=400)
 
+    @action(detail=False, methods=['post'], url_path='cancel-checkout')
+    def cancel_checkout(self, request):
+        """
+        Gives back the stock held for an abandoned Stripe session.
+        """
+        session_id = request.data.get('session_id')
+        if not session_id:
+            return Response({"error": "session_id required"}, status=400)
+        released = release_reservations(
+            StockReservation.objects.filter(session_id=session_id, user=request.user)
+        )
+        return Response({"released": released}, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=['post'], url_path='process-esewa')
     def process_esewa(self, request):
         """
         Generates the signed data required for eSewa's v2 API.
         """
         try:
-            cart, _ = Cart.objects.get_or_create(user=request.user)
-            if not cart.items.exists():
+            cart = get_cart_store(request.user).persist()
+            summary = cart_summary(cart)
+            if not summary['line_count']:
                 return Response({"error": "Locker is empty"}, status=400)
 
-            cart_total = cart.get_total_price() or Decimal('0.00')
-            shipping_cost = Decimal('10.00')
-            total_amount = Decimal(str(cart_total)) + shipping_cost
+            total_amount = summary['total'] + SHIPPING_COST
             
             product_code = getattr(settings, 'ESEWA_PRODUCT_CODE', 'EPAYTEST')
             secret_key = getattr(settings, 'ESEWA_SECRET_KEY', '8g8M8ksRXz9S7S4U')
@@ -232,42 +425,48 @@ class PaymentView(viewsets.ViewSet):
             if not session_id:
                 return Response({"error": "session_id required"}, status=400)
 
+            # Usually the webhook worker has already created the order
+            order = Order.objects.filter(transaction_id=session_id, user=request.user).first()
+            if order:
+                return Response({"message": "Order already processed", "order_id": order.id}, status=200)
+
             session = stripe.checkout.Session.retrieve(session_id)
+            if (session.metadata or {}).get('user_id') != str(request.user.id):
+                return Response({"error": "Checkout session not found"}, status=status.HTTP_404_NOT_FOUND)
             if session.payment_status == 'paid':
-                # Idempotency check: Don't create order twice
-                if Order.objects.filter(stripe_payment_id=session.id).exists():
-                    return Response({"message": "Order already processed"}, status=200)
-
-                order = Order.objects.create(
-                    user=request.user,
-                    total_price=Decimal(session.amount_total) / 100,
-                    status='paid',
-                    stripe_payment_id=session.id
+                order, created = create_order_from_session(
+                    session.id, session.amount_total, session.metadata, request.user
                 )
-
-                is_instant = session.metadata.get('is_instant') == 'true'
-
-                if is_instant:
-                    sku = ProductSKU.objects.get(id=session.metadata.get('sku_id'))
-                    OrderItem.objects.create(
-                        order=order, 
-                        sku=sku, 
-                        quantity=int(session.metadata.get('qty', 1)), 
-                        price=sku.price
-                    )
-                else:
-                    cart_id = session.metadata.get('cart_id')
-                    cart = Cart.objects.get(id=cart_id, user=request.user)
-                    for item in cart.items.all():
-                        OrderItem.objects.create(
-                            order=order, sku=item.sku, quantity=item.quantity, 
-                            price=item.sku.price, custom_name=item.custom_name, 
-                            custom_number=item.custom_number
-                        )
-                    cart.items.all().delete()
-                
+                if not created:
+                    return Response({"message": "Order already processed", "order_id": order.id}, status=200)
                 return Response({"order_id": order.id, "status": "success"}, status=status.HTTP_200_OK)
             return Response({"error": "Payment failed"}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             print(f"VERIFICATION ERROR: {str(e)}")
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
\ No newline at end of file
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(
+        detail=False, methods=['post'], url_path='webhook',
+        permission_classes=[permissions.AllowAny], authentication_classes=[]
+    )
+    def stripe_webhook(self, request):
+        """
+        Stripe webhook receiver. Verifies the signature, stores the raw event
+        and returns straight away; process_payment_events turns it into an order.
+        """
+        payload = request.body
+        try:
+            stripe.WebhookSignature.verify_header(
+                payload, request.headers.get('Stripe-Signature'),
+                settings.STRIPE_WEBHOOK_SECRET, tolerance=300
+            )
+            event = json.loads(payload)
+        except (stripe.SignatureVerificationError, ValueError):
+            return Response({"error": "Invalid webhook signature"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Stripe redelivers until it gets a 2xx; the unique event_id absorbs the duplicates
+        PaymentEvent.objects.get_or_create(
+            event_id=event['id'],
+            defaults={'event_type': event['type'], 'payload': event}
+        )
+        return Response({"received": True}, status=status.HTTP_200_OK)